@@ -0,0 +1,62 @@
+# Standard libraries
+import time
+import argparse
+
+# Local imports
+from kernels import *
+
+#############
+# CONSTANTS #
+#############
+
+DEFAULT_SIZE = 256      # tiles per side
+DEFAULT_TICKS = 20
+
+#####################
+# CLASSES/FUNCTIONS #
+#####################
+
+def time_phases(kernels, size, ticks):
+    """Average time (ms) of each tick phase on a size x size map of random values.
+       One untimed warm-up tick is run first (Numba compiles on first call)."""
+    fields = random_fields((size, size))
+    phases = {
+        'heat_balance': lambda: kernels.heat_balance(fields, fields.cosZenith, 0.0, 1.0),
+        'smooth_temps': lambda: kernels.smooth_temps(fields, TEMPERATURE_SMOOTH_FACTOR),
+        'advect_temps': lambda: kernels.advect_temps(fields, 1.0),
+        'ideal_gas': lambda: kernels.ideal_gas(fields),
+        'calc_velocity': lambda: kernels.calc_velocity(fields, 1.0),
+        }
+    timings = {}
+    for phase, run_phase in phases.items():
+        run_phase()
+        startTime = time.perf_counter()
+        for tick in range(ticks):
+            run_phase()
+        timings[phase] = 1000 * (time.perf_counter() - startTime) / ticks
+    return timings
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Time simulation kernels per tick phase.")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="tiles per side")
+    parser.add_argument("--ticks", type=int, default=DEFAULT_TICKS, help="timed ticks per phase")
+    parser.add_argument("--backend", choices=KERNEL_BACKENDS, default=KERNEL_BACKEND)
+    parser.add_argument("--check", action="store_true", help="compare backend against NumPy reference first")
+    args = parser.parse_args()
+
+    shape = (args.size, args.size)
+    kernels = load_kernels(shape, args.backend)
+    log(f"Kernel backend: {kernels.name} ({args.size} x {args.size} tiles, {args.ticks} ticks)")
+
+    # Equivalence test against reference implementation
+    if args.check:
+        for phase, (difference, passed) in check_backends(kernels, NumpyKernels(shape), shape).items():
+            log(f"  check {phase:<14} max rel. difference {difference:.2e} {'PASS' if passed else 'FAIL'}", log=False)
+
+    for phase, milliseconds in time_phases(kernels, args.size, args.ticks).items():
+        log(f"  {phase:<14} {milliseconds:9.3f} ms/tick", log=False)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,167 @@
+# Standard libraries
+from types import SimpleNamespace
+
+# Third-party libraries
+import numpy as np #2.1.1
+
+# Local imports
+from physics import *
+from kernels import *
+from simulation import *
+
+#############
+# CONSTANTS #
+#############
+
+SUN_HOUR_ANGLE_INCREMENT = 15   # degrees per hour (as in main.py)
+MAX_SUN_HOUR_ANGLE = 360        # degrees
+
+# Map arrays that each member evolves separately (others, e.g. elevation, are shared)
+MEMBER_FIELDS = ('temperature', 'airTemperature', 'lastAirTemperature', 'heatFromAir', 'airPressure', 'airDensity',
+                 'windU', 'windV', 'windSpeedMagnitude')
+
+#####################
+# CLASSES/FUNCTIONS #
+#####################
+
+def member_values(value, memberCount):
+    """Per-member parameter as an array of memberCount values
+       (a single value is shared by all members)."""
+    values = np.asarray(value, float)
+    if values.ndim == 0:
+        return np.full(memberCount, float(values))
+    if len(values) != memberCount:
+        raise ValueError(f"Expected {memberCount} member values, got {len(values)}")
+    return values
+
+
+class Ensemble:
+    """Many copies ("members") of one map simulated side by side, e.g. to
+       compare greenhouse effects. Every map array gains a leading member
+       axis (members, x, y) and per-member parameters broadcast along it,
+       so a tick advances all members with the same NumPy operations a
+       single map uses (see kernels.TiledExecutor).
+
+       Per-member parameters (one value for all members, or one per member):
+       greenhouse, heatRatioAir (share of sunlight absorbed by air), seaLevel
+       (ft) and albedo, a dict of tile type -> albedo overriding the material
+       defaults (or a list of such dicts, one per member)."""
+
+    # Sun data, air smoothing, air pressure, wind and advection work on the member arrays exactly as on a map
+    sunlight = GameMap.sunlight
+    step_sunlight = GameMap.step_sunlight
+    smooth_temps = GameMap.smooth_temps
+    gas_calcs = GameMap.gas_calcs
+    calc_velocity = GameMap.calc_velocity
+    advect_temps = GameMap.advect_temps
+
+    def __init__(self, gameMap, members, greenhouse=None, heatRatioAir=HEAT_RATIO_AIR, seaLevel=None, albedo=None):
+        mapData = gameMap.mapData
+        self.memberCount = members
+        self.shape = (members,) + mapData.temperature.shape
+        self.timeStep = gameMap.timeStep
+        self.hours = 0
+
+        # Per-member parameters, shaped to broadcast against (members, x, y)
+        memberAxis = (members, 1, 1)
+        self.greenhouse = member_values(gameMap.greenhouse if greenhouse is None else greenhouse, members).reshape(memberAxis)
+        self.heatRatioAir = member_values(heatRatioAir, members).reshape(memberAxis)
+        self.seaLevel = member_values(gameMap.seaLevel if seaLevel is None else seaLevel, members).reshape(memberAxis)
+        if albedo is None or isinstance(albedo, dict):
+            albedo = [albedo or {}] * members
+        if len(albedo) != members:
+            raise ValueError(f"Expected {members} member albedo overrides, got {len(albedo)}")
+        self.typeAlbedo = np.array([[overrides.get(tileType, TYPE_ALBEDO[code]) for code, tileType in enumerate(TILE_TYPES)]
+                                    for overrides in albedo])
+
+        # Sun data shared with the map (same world, same sun)
+        self.tileCount = gameMap.tileCount
+        self.sunlightCache = gameMap.sunlightCache
+        self.sunHourAngle = gameMap.sunHourAngle
+        self.dayOfYear = gameMap.dayOfYear
+
+        # Every member starts from the current state of the map
+        self.elevation = mapData.elevation
+        self.mapData = SimpleNamespace(**{name: np.repeat(getattr(mapData, name)[np.newaxis], members, axis=0)
+                                          for name in MEMBER_FIELDS})
+        self.elevationFactorSeaLevel = None
+        self.update_elevation_factors()
+        self.mapData.typeCode = np.full(self.shape, -1, np.int8)
+        self.mapData.surfaceAlbedo = np.empty(self.shape)
+        self.mapData.surfaceHeatMass = np.empty(self.shape)
+        self.mapData.surfaceRoughness = np.empty(self.shape)
+        self.mapData.surfaceSnow = np.empty(self.shape, bool)
+        self.update_tile_types()
+
+        # Member arrays are blocked per map by the NumPy kernels (Numba loops are 2D only)
+        self.kernels = NumpyKernels(self.shape)
+
+    def update_elevation_factors(self):
+        """Lapse-rate factors and air density of every member from its own sea
+           level (see GameMap.update_elevation_factors; member sea levels are
+           fixed, so they are computed once)."""
+        if self.elevationFactorSeaLevel is not None:
+            return False
+        mapData = self.mapData
+        mapData.airTempElevFactor, mapData.airPresElevFactor, mapData.airDensElevFactor = \
+            (np.broadcast_to(factor, self.shape).copy() for factor in elevation_factors(self.elevation, self.seaLevel))
+        np.multiply(mapData.airDensElevFactor, SEA_LEVEL_AIR_DENSITY, out=mapData.airDensity)
+        self.elevationFactorSeaLevel = self.seaLevel
+        return True
+
+    def update_tile_types(self):
+        """Tile types of every member from its own sea level and temperatures;
+           material properties are updated only where the type changed."""
+        changedTiles = classify_tiles(self.elevation, self.mapData.temperature, self.seaLevel, self.mapData.typeCode)
+        if changedTiles.size:
+            self.update_material_properties(changedTiles)
+        return changedTiles
+
+    def update_material_properties(self, tiles):
+        """Material properties of tiles (flat indices) from their type (albedo per member)."""
+        mapData = self.mapData
+        typeCode = mapData.typeCode.flat[tiles]
+        member = tiles // (self.shape[1] * self.shape[2])
+        mapData.surfaceAlbedo.flat[tiles] = self.typeAlbedo[member, typeCode]
+        mapData.surfaceHeatMass.flat[tiles] = TYPE_HEAT_MASS[typeCode]
+        mapData.surfaceRoughness.flat[tiles] = TYPE_ROUGHNESS[typeCode]
+        mapData.surfaceSnow.flat[tiles] = typeCode == TILE_TYPE_CODES['snow']
+
+    def heat_calcs(self, dt=None):
+        """Heat balance of every member (see GameMap.heat_calcs). Shared sun
+           data and per-member parameters are broadcast to the member arrays
+           (as views) so the kernel can slice them like per-tile arrays."""
+        if dt is None:
+            dt = self.timeStep
+        cosineSolarZenithAngle = np.broadcast_to(self.step_sunlight(dt), self.shape)
+        greenhouse = np.broadcast_to(self.greenhouse, self.shape)
+        heatRatioAir = np.broadcast_to(self.heatRatioAir, self.shape)
+        substeps = substep_count(dt, max_stable_time_step(self.mapData, self.greenhouse))
+        for substep in range(substeps):
+            self.kernels.heat_balance(self.mapData, cosineSolarZenithAngle, greenhouse, dt / substeps, heatRatioAir)
+
+    def simulate(self, dt=None):
+        """Run a single tick for all members (same phases as Game.simulate)."""
+        if dt is None:
+            dt = self.timeStep
+        self.hours += dt
+        self.sunHourAngle += SUN_HOUR_ANGLE_INCREMENT * dt
+        if self.sunHourAngle >= MAX_SUN_HOUR_ANGLE:
+            self.sunHourAngle -= MAX_SUN_HOUR_ANGLE
+            self.dayOfYear = (self.dayOfYear + 1) % DAYS_PER_YEAR
+        self.heat_calcs(dt)
+        self.smooth_temps(dt)
+        self.gas_calcs()
+        self.calc_velocity(dt)
+        self.advect_temps(dt)
+        self.update_tile_types()
+
+    def member_data(self, member=0):
+        """Map arrays of one member (views without the member axis) and the
+           shared elevation, like a single map's mapData (e.g. for display_values)."""
+        return SimpleNamespace(elevation=self.elevation,
+                               **{name: values[member] for name, values in vars(self.mapData).items()})
+
+    def member_means(self, name):
+        """Map-average value of a member array (e.g. 'temperature') for each member."""
+        return np.mean(getattr(self.mapData, name), axis=(-2, -1))
@@ -0,0 +1,128 @@
+# Third-party libraries
+import numpy as np #2.1.1
+
+# Local imports
+from physics import *
+from kernels import *
+
+#############
+# CONSTANTS #
+#############
+
+# Newton iteration on surface/air temperatures
+EQUILIBRIUM_TOLERANCE = 1E-6        # degrees F, largest temperature update when converged
+EQUILIBRIUM_MAX_ITERATIONS = 50
+EQUILIBRIUM_MAX_STEP = 50.0         # degrees F, largest temperature update per iteration (damping)
+
+# Linear solve for each Newton update (smoothing couples neighboring air tiles)
+LINEAR_TOLERANCE = 1E-3             # residual relative to right-hand side (Newton converges without exact solves)
+LINEAR_MAX_ITERATIONS = 100
+
+#####################
+# CLASSES/FUNCTIONS #
+#####################
+
+def smoothing_symbol(shape):
+    """Eigenvalues of smoothing_pull on a map of given shape (for np.fft.rfft2).
+       The pull is the same stencil at every tile with the map looping around
+       its edges, so it is diagonal in the 2D Fourier basis: B^2 / 9 - 9,
+       where B is the symbol of a 3x3 window sum."""
+    frequencyX = 2 * np.pi * np.fft.fftfreq(shape[-2])[:, None]
+    frequencyY = 2 * np.pi * np.fft.rfftfreq(shape[-1])[None, :]
+    windowSum = (1 + 2 * np.cos(frequencyX)) * (1 + 2 * np.cos(frequencyY))
+    return windowSum**2 / WINDOW_SIZE - SMOOTH_PULL_WEIGHT
+
+
+def solve_smoothing_system(diagonal, symbol, rightHandSide, tolerance=LINEAR_TOLERANCE):
+    """Solve (diagonal + smoothing) * x = rightHandSide, with smoothing given by
+       its Fourier symbol. Iterates with the system for the average diagonal
+       (solved exactly by FFT) as preconditioner, until the residual is below
+       tolerance (relative) or stops decreasing."""
+    shape = rightHandSide.shape
+    preconditioner = np.mean(diagonal) + symbol
+    solutionSpectrum = np.zeros(symbol.shape, complex)
+    solution = np.zeros(shape)
+    lastResidual = np.inf
+    for linearIteration in range(LINEAR_MAX_ITERATIONS):
+        residual = rightHandSide - diagonal * solution - np.fft.irfft2(symbol * solutionSpectrum, shape)
+        residualSize = np.max(np.abs(residual))
+        if residualSize <= tolerance * np.max(np.abs(rightHandSide)) or residualSize >= lastResidual:
+            break
+        lastResidual = residualSize
+        solutionSpectrum += np.fft.rfft2(residual) / preconditioner
+        solution = np.fft.irfft2(solutionSpectrum, shape)
+    return solution
+
+
+def solve_equilibrium(fields, cosZenith, greenhouse, smoothFactor, tolerance=EQUILIBRIUM_TOLERANCE,
+                      maxIterations=EQUILIBRIUM_MAX_ITERATIONS, initial=None):
+    """Surface and air temperatures at which the daily-averaged heat balance
+       (see kernels.heat_balance) and air smoothing (smoothFactor per hour) of
+       every tile are in equilibrium, with cosZenith the day-averaged daylight
+       sun data (night counted as zero, see GameMap.daily_sunlight). As in the
+       ticks, only heat warming the air is scaled by its elevation factor
+       (airTempElevFactor): over a day the air takes its gains scaled and its
+       losses in full. Tile types (albedo, heat mass) are held fixed; see
+       GameMap.spin_up for reclassifying them between solves.
+
+       Newton iteration on the T^4 radiation terms: each tile's surface
+       equation is eliminated, leaving one linear system for the air updates
+       that is solved with the smoothing part inverted by FFT. The starting
+       guess is initial (temperature, airTemperature), default the current
+       map temperatures.
+       Returns (temperature, airTemperature, iterations, converged)."""
+    if initial is None:
+        initial = (fields.temperature, fields.airTemperature)
+    temperature = np.maximum(initial[0], ABSOLUTE_ZERO + 1)
+    airTemperature = np.maximum(initial[1], ABSOLUTE_ZERO + 1)
+    convection = convection_factor(fields.windSpeedMagnitude, fields.surfaceRoughness)
+    airTempElevFactor = fields.airTempElevFactor
+    sunHeatIn = BASE_SUN_HEAT_FLUX * cosZenith
+    smoothing = AIR_HEAT_MASS * smoothFactor                   # BTU/hr per degree of pull
+    symbol = smoothing * smoothing_symbol(temperature.shape)
+
+    for iteration in range(1, maxIterations + 1):
+
+        # Warm air or surface reduces albedo of snow (held fixed within an iteration)
+        surfaceAlbedo = fields.surfaceAlbedo - 0.1 * (fields.surfaceSnow & (airTemperature > 32)) \
+                                             - 0.15 * (fields.surfaceSnow & (temperature > 32))
+        sunHeatToSurface = sunHeatIn * (1 - HEAT_RATIO_AIR) * (1 - surfaceAlbedo)
+        sunHeatToAir = sunHeatIn * (HEAT_RATIO_AIR * (1 - ALBEDO['air'])
+                                    + (1 - HEAT_RATIO_AIR) * surfaceAlbedo * REFLECTION_RATIO_SURFACE_TO_AIR * (1 + greenhouse))
+
+        # Radiation and its derivative (d/dT of T^4 in Rankine)
+        surfaceRadiation = SURFACE_RADIATION_COEFFICIENT * (temperature - ABSOLUTE_ZERO)**4
+        surfaceRadiationRate = 4 * surfaceRadiation / (temperature - ABSOLUTE_ZERO)
+        airRadiation = AIR_RADIATION_COEFFICIENT * (1 + greenhouse) * (airTemperature - ABSOLUTE_ZERO)**4
+        airRadiationRate = 4 * airRadiation / (airTemperature - ABSOLUTE_ZERO)
+
+        # Net heat (BTU/hr) into surface and air (air gains scaled by elevation,
+        # incl. convection from a warmer surface)
+        convectionToSurface = convection * (airTemperature - temperature)
+        convectionWeight = np.where(convectionToSurface > 0, 1.0, airTempElevFactor)
+        surfaceNetHeat = sunHeatToSurface + RADIATION_RATIO_AIR_TO_SURFACE * airRadiation + convectionToSurface - surfaceRadiation
+        airNetHeat = airTempElevFactor * (sunHeatToAir + SURFACE_RADIATION_ABSORPTION_AIR * (1 + greenhouse) * surfaceRadiation) \
+                   - airRadiation - convectionWeight * convectionToSurface + smoothing * smoothing_pull(airTemperature)
+
+        # Jacobian of each tile's (surface, air) balance, excluding smoothing
+        surfaceBySurface = -convection - surfaceRadiationRate
+        surfaceByAir = RADIATION_RATIO_AIR_TO_SURFACE * airRadiationRate + convection
+        airBySurface = airTempElevFactor * SURFACE_RADIATION_ABSORPTION_AIR * (1 + greenhouse) * surfaceRadiationRate \
+                     + convectionWeight * convection
+        airByAir = -airRadiationRate - convectionWeight * convection
+
+        # Eliminate surface update: (diagonal + smoothing) * airUpdate = rightHandSide
+        diagonal = airByAir - airBySurface * surfaceByAir / surfaceBySurface
+        rightHandSide = airBySurface * surfaceNetHeat / surfaceBySurface - airNetHeat
+        airUpdate = solve_smoothing_system(diagonal, symbol, rightHandSide)
+        surfaceUpdate = -(surfaceNetHeat + surfaceByAir * airUpdate) / surfaceBySurface
+
+        # Damped update (also keeps temperatures above absolute zero)
+        largestUpdate = max(np.max(np.abs(airUpdate)), np.max(np.abs(surfaceUpdate)))
+        scale = min(1.0, EQUILIBRIUM_MAX_STEP / largestUpdate) if largestUpdate > 0 else 1.0
+        temperature = np.maximum(temperature + scale * surfaceUpdate, ABSOLUTE_ZERO + 1)
+        airTemperature = np.maximum(airTemperature + scale * airUpdate, ABSOLUTE_ZERO + 1)
+        if largestUpdate <= tolerance:
+            return temperature, airTemperature, iteration, True
+
+    return temperature, airTemperature, iteration, False
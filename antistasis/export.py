@@ -0,0 +1,160 @@
+# Standard libraries
+import os
+import re
+import time
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Third-party libraries
+import pygame #2.6.1
+
+# Local imports
+from simulation import *
+from ensemble import *
+
+#############
+# CONSTANTS #
+#############
+
+# Run defaults
+DEFAULT_SIZE = 64                   # tiles per side
+DEFAULT_SEED = 0
+DEFAULT_TICKS = 24 * 30             # ticks per run (30 days of hourly ticks)
+DEFAULT_INTERVAL = 6                # ticks between frames
+DEFAULT_RESOLUTION = (1024, 1024)   # px
+DEFAULT_MODES = ('Surface',)
+DEFAULT_OUTPUT = "frames"
+
+# Encoding pool: PNG encoding holds the GIL, so frames are written by worker
+# processes; at most EXPORT_QUEUE_SIZE frames wait for them, further frames are dropped
+EXPORT_WORKERS = None               # worker processes (None = one per CPU)
+EXPORT_QUEUE_SIZE = 16
+
+# Display modes that can be exported (climatology modes are blank until their window has data)
+EXPORT_DISPLAY_MODES = ('Surface',) + tuple(CONTOUR_DISPLAY_MODES) + tuple(CLIMATOLOGY_DISPLAY_MODES)
+
+#####################
+# CLASSES/FUNCTIONS #
+#####################
+
+def render_colors(mapData, displayMode, colors, seaLevel=0, climatology=None):
+    """One RGB pixel per tile ([x, y, 3]) of a display mode, in the average
+       color of the tile graphic the game would draw (see tile_colors).
+       Climatology modes need the run's climatology (see map_climatology)."""
+    if displayMode == "Surface":
+        return colors[surface_graphic_codes(mapData.typeCode, mapData.elevation)]
+    return colors[contour_graphic_codes(*display_values(mapData, displayMode, seaLevel, climatology))]
+
+
+def write_frame(path, pixels, resolution):
+    """Scale a frame (one pixel per tile, tiles kept sharp) to resolution and save it as PNG."""
+    pygame.image.save(pygame.transform.scale(pygame.surfarray.make_surface(pixels), resolution), path)
+    return path
+
+
+def mode_file_name(displayMode):
+    """File name prefix for a display mode, e.g. "Air Temperature" -> "air_temperature"."""
+    return re.sub(r"[^a-z0-9]+", "_", displayMode.lower()).strip("_")
+
+
+class FrameExporter:
+    """Writes numbered PNG frames (<mode>_000000.png, ...) in a process pool
+       through a bounded queue, so the simulation never waits on encoding or
+       disk: a frame submitted while queueSize frames are pending is
+       dropped (counted in dropped) instead. Frames are numbered in the order
+       they are queued, per mode, so dropped frames leave no gaps in the
+       sequence (video encoders stop at the first gap). Without dropFrames,
+       submit waits for a free slot (every frame kept, slower runs)."""
+
+    def __init__(self, directory, resolution=DEFAULT_RESOLUTION, workers=EXPORT_WORKERS, queueSize=EXPORT_QUEUE_SIZE,
+                 dropFrames=True):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.resolution = tuple(resolution)
+        self.pool = ProcessPoolExecutor(workers)
+        self.pool.submit(int).result() # start the workers now, not while the first frames queue up
+        self.slots = threading.BoundedSemaphore(queueSize)
+        self.dropFrames = dropFrames
+        self.frameCounts = {}   # frames queued per display mode (next frame number)
+        self.written = 0
+        self.dropped = 0
+        self.errors = []
+
+    def submit(self, displayMode, pixels):
+        """Queue a frame for writing as the next frame of its display mode.
+           Returns False if it was dropped (queue full)."""
+        if not self.slots.acquire(blocking=not self.dropFrames):
+            self.dropped += 1
+            return False
+        frameIndex = self.frameCounts.get(displayMode, 0)
+        self.frameCounts[displayMode] = frameIndex + 1
+        path = os.path.join(self.directory, f"{mode_file_name(displayMode)}_{frameIndex:06d}.png")
+        future = self.pool.submit(write_frame, path, pixels, self.resolution)
+        future.add_done_callback(self.frame_done)
+        return True
+
+    def frame_done(self, future):
+        """Free the frame's queue slot (pool thread)."""
+        self.slots.release()
+        if future.exception() is not None:
+            self.errors.append(future.exception())
+        else:
+            self.written += 1
+
+    def close(self):
+        """Wait for pending frames and stop the pool. Raises the first write error, if any."""
+        self.pool.shutdown(wait=True)
+        if self.errors:
+            raise self.errors[0]
+
+
+def export_run(world, ensemble, exporter, displayModes, ticks, interval):
+    """Simulate member 0 of an ensemble for a number of ticks, submitting a
+       frame of every display mode at the start and every interval ticks.
+       Member 0's climatology is recorded every tick for climatology modes."""
+    colors = tile_colors(Graphics())
+    climatology = map_climatology(world.mapData.temperature.shape, world.timeStep)
+    frameIndex = 0
+    for tick in range(ticks + 1):
+        if tick > 0:
+            ensemble.simulate()
+            for statistics in climatology.values():
+                statistics.record(ensemble.member_data())
+        if tick % interval == 0:
+            mapData = ensemble.member_data()
+            for displayMode in displayModes:
+                exporter.submit(displayMode, render_colors(mapData, displayMode, colors, world.seaLevel, climatology))
+            frameIndex += 1
+    return frameIndex
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Export a headless simulation as numbered PNG frames (no window).")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="tiles per side")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="world generation seed")
+    parser.add_argument("--greenhouse", type=float, default=0.0, help="greenhouse effect")
+    parser.add_argument("--ticks", type=int, default=DEFAULT_TICKS, help="ticks to simulate")
+    parser.add_argument("--interval", type=int, default=DEFAULT_INTERVAL, help="ticks between frames")
+    parser.add_argument("--modes", nargs="+", choices=EXPORT_DISPLAY_MODES, default=DEFAULT_MODES, help="display modes to export")
+    parser.add_argument("--resolution", type=int, nargs=2, default=DEFAULT_RESOLUTION, metavar=("WIDTH", "HEIGHT"), help="frame size (px)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="frame directory")
+    parser.add_argument("--workers", type=int, default=EXPORT_WORKERS, help="encoding processes (default: one per CPU)")
+    parser.add_argument("--queue", type=int, default=EXPORT_QUEUE_SIZE, help="frames waiting for encoding before frames are dropped")
+    parser.add_argument("--no-drop", action="store_true", help="wait for the encoders instead of dropping frames")
+    args = parser.parse_args()
+
+    world = HeadlessWorld(args.size, args.seed)
+    ensemble = Ensemble(world, 1, greenhouse=args.greenhouse)
+    exporter = FrameExporter(args.output, args.resolution, args.workers, args.queue, dropFrames=not args.no_drop)
+    startTime = time.perf_counter()
+    frames = export_run(world, ensemble, exporter, args.modes, args.ticks, args.interval)
+    exporter.close()
+    log(f"Exported {exporter.written} frames ({frames} per mode requested, {exporter.dropped} dropped) "
+        f"to {args.output} in {time.perf_counter() - startTime:.1f} s")
+    if exporter.dropped:
+        log(f"{exporter.dropped} frames were dropped, so frames are not evenly spaced in time (use --no-drop to keep every frame)")
+
+
+if __name__ == "__main__":
+    run()
@@ -1,5 +1,6 @@
 import os
 import sys
+import numpy as np
 import pygame
 from pygame.locals import *
 
@@ -169,6 +170,141 @@ class ContourBars:
         self.gameWindow.screen.blit(contourText, currentPos)
         
 
+class ZonalPlot:
+    """Side panel plotting zonal (per latitude row) statistics against latitude,
+       rows top to bottom as on the map: surface and air temperature means
+       with the range of surface temperatures in each row, their average over
+       the recorded history, and ice cover. The panel is redrawn only when
+       new statistics were recorded and blitted from cache otherwise."""
+
+    # Initialize
+    def __init__(self, gameWindow, width=320, height=400, padding=10, temperatureRange=(-50, 120)):
+        self.gameWindow = gameWindow
+        self.width = width
+        self.height = height
+        self.padding = padding
+        self.temperatureRange = temperatureRange
+        self.iceBarWidth = 40
+        self.position = (gameWindow.x - width - padding, padding)
+        self.backgroundColor = (25, 25, 25)
+        self.rangeColor = (90, 60, 40)
+        self.surfaceColor = (255, 106, 0)
+        self.airColor = (0, 255, 255)
+        self.historyColor = (140, 140, 140)
+        self.iceColor = (255, 255, 255)
+        self.unitColor = (255, 255, 255)
+        self.surface = None
+        self.drawnCount = None
+
+    def plot_x(self, temperature):
+        """Panel x coordinate (px) of a temperature."""
+        low, high = self.temperatureRange
+        plotWidth = self.width - self.iceBarWidth - 3 * self.padding
+        fraction = np.clip((np.asarray(temperature) - low) / (high - low), 0, 1)
+        return self.padding + fraction * plotWidth
+
+    def render(self, zonalHistory, font):
+        """Draw the panel from the latest and averaged zonal statistics."""
+        self.surface = pygame.Surface((self.width, self.height))
+        self.surface.fill(self.backgroundColor)
+        latest = zonalHistory.latest()
+        average = zonalHistory.mean()
+        rows = latest.shape[-1]
+
+        # Header and axis labels
+        titleText = font.render("Zonal means (°F)", True, self.unitColor, self.backgroundColor)
+        self.surface.blit(titleText, (self.padding, self.padding))
+        top = 2 * self.padding + titleText.get_height()
+        bottom = self.height - 2 * self.padding - titleText.get_height()
+        low, high = (font.render(str(value), True, self.unitColor, self.backgroundColor) for value in self.temperatureRange)
+        self.surface.blit(low, (self.plot_x(self.temperatureRange[0]), bottom + self.padding))
+        self.surface.blit(high, (self.plot_x(self.temperatureRange[1]) - high.get_width(), bottom + self.padding))
+        iceText = font.render("Ice", True, self.unitColor, self.backgroundColor)
+        iceLeft = self.width - self.iceBarWidth - self.padding
+        self.surface.blit(iceText, (iceLeft, bottom + self.padding))
+
+        # Row centers, top to bottom
+        rowHeight = (bottom - top) / rows
+        y = top + (np.arange(rows) + 0.5) * rowHeight
+
+        # Surface temperature range and ice cover of each row
+        for row in range(rows):
+            pygame.draw.line(self.surface, self.rangeColor, (self.plot_x(latest[0, 1, row]), y[row]),
+                             (self.plot_x(latest[0, 2, row]), y[row]), max(int(rowHeight), 1))
+            iceWidth = latest[2, 0, row] * self.iceBarWidth
+            if iceWidth > 0:
+                pygame.draw.rect(self.surface, self.iceColor, (iceLeft, y[row] - rowHeight / 2, iceWidth, max(rowHeight, 1)))
+
+        # Mean profiles (history average first, so the latest is drawn on top)
+        for profile, color in ((average[0, 0], self.historyColor), (average[1, 0], self.historyColor),
+                               (latest[0, 0], self.surfaceColor), (latest[1, 0], self.airColor)):
+            pygame.draw.lines(self.surface, color, False, list(zip(self.plot_x(profile), y)), 2)
+
+        self.drawnCount = zonalHistory.count
+
+    def create(self, zonalHistory, font):
+        """Blit the panel, redrawing it first if statistics were recorded since."""
+        if zonalHistory.count == 0:
+            return
+        if self.drawnCount != zonalHistory.count:
+            self.render(zonalHistory, font)
+        self.gameWindow.screen.blit(self.surface, self.position)
+
+
+class BackgroundScaler:
+    """Scales a surface on a worker thread (an executor) so the main loop does
+       not stall on slow scaling (e.g. smoothscale of a large map). Until the
+       result is ready, the last finished one can stand in (see preview),
+       stretched cheaply (nearest-neighbour) if the size changed, but only
+       while its source still shows the same content: once that changes, the
+       caller discards it and scales the new content itself. A new request
+       supersedes the pending one: it is cancelled if it has not started,
+       otherwise its result is dropped."""
+
+    # Initialize
+    def __init__(self, executor):
+        self.executor = executor
+        self.job = None
+        self.result = None
+
+    def request(self, scale, source, size):
+        """Start scale(source, size) in the background. The source must not
+           be drawn on until the job finishes (pass a copy if it changes)."""
+        self.cancel()
+        self.job = self.executor.submit(scale, source, size)
+
+    def cancel(self):
+        """Drop the pending request (cancelled if not started yet)."""
+        if self.job is not None:
+            self.job.cancel()
+            self.job = None
+
+    def pending(self):
+        """Whether a requested surface is not collected yet."""
+        return self.job is not None
+
+    def poll(self):
+        """The requested surface once it is ready (returned once), else None.
+           Errors raised by the scaling are raised here."""
+        if self.job is None or not self.job.done():
+            return None
+        self.result = self.job.result()
+        self.job = None
+        return self.result
+
+    def discard(self):
+        """Forget the last finished surface (its source content changed)."""
+        self.result = None
+
+    def preview(self, size):
+        """Last finished surface at size (stretched if needed), or None if there is none."""
+        if self.result is None:
+            return None
+        if self.result.get_size() == tuple(size):
+            return self.result
+        return pygame.transform.scale(self.result, size)
+
+
 class Renderer:
     """Handles all game display functions."""
     
@@ -0,0 +1,554 @@
+# Standard libraries
+import os
+import math
+import threading
+import importlib.util
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+# Third-party libraries
+import numpy as np #2.1.1
+
+# Local imports
+from physics import *
+from topology import *
+from ui import *
+
+#############
+# CONSTANTS #
+#############
+
+# Backend selection: "auto" (Numba if installed, else NumPy), "numpy" or "numba"
+KERNEL_BACKEND = "auto"
+KERNEL_BACKENDS = ("auto", "numpy", "numba")
+
+# Explicit time stepping: one (sub-)step may cover at most this multiple of the
+# shortest thermal time constant of any tile, otherwise it is split into sub-steps.
+# 2 is the explicit Euler stability limit; measured stable with 1, 3 and 6 h ticks,
+# while 4 diverges with 3 h ticks (the time constant is a worst-case estimate)
+STABILITY_FACTOR = 2.0
+
+# Smoothing pulls each tile toward the averages of the nine 3x3 windows it is part of
+SMOOTH_PULL_WEIGHT = WINDOW_SIZE
+
+# Heat balance terms summed over the map for the energy budget (BTU, see heat_balance)
+BUDGET_TERMS = ('sunAbsorbedSurface', 'sunAbsorbedAir', 'sunReflected', 'surfaceRadiation', 'airRadiation',
+                'airRadiationToSurface', 'convectionToSurface', 'greenhouseReabsorbed', 'surfaceHeatGain', 'airHeatGain')
+
+# Tiling/threading
+CACHE_BLOCK_ELEMENTS = 4096     # tile values per block (32 KB per float64 buffer, so one block's temporaries stay in L2)
+KERNEL_THREADS = None           # worker threads for tiled kernels (None = one per CPU)
+
+# Heat balance coefficients (per tile, so multiplied by tile area)
+ABSOLUTE_ZERO = -459.67                                                                 # degrees F
+SURFACE_RADIATION_COEFFICIENT = RADIATION_CONTROL_FACTOR * STEFAN_BOLTZMANN_CONSTANT * EMISSIVITY['surface'] * TILE_AREA
+AIR_RADIATION_COEFFICIENT = RADIATION_CONTROL_FACTOR * STEFAN_BOLTZMANN_CONSTANT * EMISSIVITY['air'] * TILE_AREA
+AIR_HEAT_MASS = (CALC_DEPTH['air'] * TILE_AREA) * DENSITY['air'] * HEAT_CAPACITY['air']  # BTU/F of simulated air layer
+AIR_CONVECTION_COEFFICIENT_BOUNDS = (0.088, 30.840) # 0.5 to 175 W/m^2 K in BTU/ft^2 F
+MAX_CONVECTION_WIND_SPEED = 176.0                   # 120mph -- 176 ft/s
+
+# Wind components are (u, v): u toward +x, v "up" the map (toward -y), in ft/s
+# Weights that turn differences to each 3x3 window tile into a gradient (per ft; zero for the tile itself)
+TILE_LENGTH = 5280.0                                                                    # ft
+WINDOW_GRADIENT_WEIGHTS = np.array([(u / (4 * math.hypot(x, y) * TILE_LENGTH), v / (4 * math.hypot(x, y) * TILE_LENGTH))
+                                    if (x, y) != (0, 0) else (0.0, 0.0)
+                                    for (x, y), (u, v) in zip(WINDOW_OFFSETS, WINDOW_DIRECTIONS)])
+
+# Pressure gradient (psi/ft) over air density (lb/ft^3) to wind speed gained per hour (ft/s per hr)
+PSI_TO_PSF = 144.0
+AIR_GAS_CONSTANT = 53.353                           # ft lbf / lb R
+GRAVITATIONAL_CONSTANT = 32.174                     # lbm ft / lbf s^2
+WIND_ACCELERATION_COEFFICIENT = -PSI_TO_PSF * GRAVITATIONAL_CONSTANT * 3600 * PRESSURE_GRADIENT_CONTROL_FACTOR
+MAX_WIND_SPEED = 176.0                              # 120mph -- 176 ft/s
+TILES_PER_WIND_HOUR = 3600 / TILE_LENGTH            # tiles travelled per hour per ft/s of wind
+
+#####################
+# CLASSES/FUNCTIONS #
+#####################
+
+def _rows(value, block):
+    """Slice a kernel parameter to the current block if it is a per-tile array
+       (same shape as the map arrays, e.g. via np.broadcast_to).
+       Scalars (e.g. greenhouse factor) are passed through unchanged."""
+    if isinstance(value, np.ndarray) and value.ndim > 0:
+        return value[block]
+    return value
+
+
+class ScratchBuffers:
+    """Preallocated temporary arrays for blocks of one shape.
+       Kernels request buffers by name and write into them with out=,
+       so each intermediate term reuses the same memory every tick."""
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.buffers = {}
+
+    def __call__(self, name, dtype=np.float64):
+        buffer = self.buffers.get(name)
+        if buffer is None:
+            buffer = np.empty(self.shape, dtype)
+            self.buffers[name] = buffer
+        return buffer
+
+
+class TiledExecutor:
+    """Runs a kernel over cache-sized blocks of rows of the map arrays.
+       Blocks are handed to a thread pool (NumPy releases the GIL inside
+       ufuncs). Each worker thread reuses its own scratch buffers for every
+       block it runs, so no block ever allocates full-map temporaries.
+       Arrays with leading axes (e.g. ensemble members, see ensemble.py)
+       are split into blocks of rows of each map."""
+
+    def __init__(self, shape, blockElements=CACHE_BLOCK_ELEMENTS, threads=KERNEL_THREADS):
+
+        # Split along x (contiguous rows for C-ordered arrays), separately for each map
+        rowCount, rowLength = shape[-2:]
+        rowsPerBlock = max(1, blockElements // rowLength)
+        rowBlocks = [slice(start, min(start + rowsPerBlock, rowCount)) for start in range(0, rowCount, rowsPerBlock)]
+        self.blocks = [leading + (rows,) for leading in np.ndindex(*shape[:-2]) for rows in rowBlocks]
+        self.blockShapes = [(rows.stop - rows.start, rowLength) for leading in np.ndindex(*shape[:-2]) for rows in rowBlocks]
+        self.scratch = threading.local()
+
+        # No pool needed when there is nothing to split (small maps) or threading is disabled
+        if threads is None:
+            threads = os.cpu_count() or 1
+        threads = min(threads, len(self.blocks))
+        self.pool = ThreadPoolExecutor(threads) if threads > 1 else None
+
+    def run_block(self, kernel, block, blockShape, *args):
+        """Call kernel(block, scratch, *args) with this thread's scratch buffers for the block shape."""
+        buffers = getattr(self.scratch, 'buffers', None)
+        if buffers is None:
+            buffers = self.scratch.buffers = {}
+        scratch = buffers.get(blockShape)
+        if scratch is None:
+            scratch = buffers[blockShape] = ScratchBuffers(blockShape)
+        kernel(block, scratch, *args)
+
+    def run(self, kernel, *args):
+        """Call kernel(block, scratch, *args) for every block and wait for all to finish."""
+        if self.pool is None:
+            for block, blockShape in zip(self.blocks, self.blockShapes):
+                self.run_block(kernel, block, blockShape, *args)
+        else:
+            futures = [self.pool.submit(self.run_block, kernel, block, blockShape, *args) for block, blockShape in zip(self.blocks, self.blockShapes)]
+            for future in futures:
+                future.result()
+
+    def shutdown(self):
+        """Stop worker threads."""
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+def heat_balance(block, scratch, fields, cosZenith, greenhouse, dt, heatRatioAir=HEAT_RATIO_AIR, budget=None):
+    """Vectorized heat balance for one block of tiles (see GameMap.heat_calcs).
+       Heat flows are BTU/hr, applied over a step of dt hours, with heatRatioAir
+       the share of incoming sunlight absorbed by the air. Surface and
+       air temperatures in fields are updated in place; every intermediate
+       term is written into the block's scratch buffers.
+       If given, budget (array of len(BUDGET_TERMS)) gets the block's total
+       of each term over the step added to it, one sum per term."""
+
+    # Views of this block (writes go straight back to the map arrays)
+    temperature = fields.temperature[block]
+    airTemperature = fields.airTemperature[block]
+    lastAirTemperature = fields.lastAirTemperature[block]
+    heatFromAir = fields.heatFromAir[block]
+    windSpeed = fields.windSpeedMagnitude[block]
+    surfaceSnow = fields.surfaceSnow[block]
+    cosZenith = _rows(cosZenith, block)
+    greenhouse = _rows(greenhouse, block)
+    airTempElevFactor = fields.airTempElevFactor[block]
+    heatRatioAir = _rows(heatRatioAir, block)
+
+    # Correct for values below absolute zero
+    np.maximum(temperature, ABSOLUTE_ZERO, out=temperature)
+    np.maximum(airTemperature, ABSOLUTE_ZERO, out=airTemperature)
+    totals = np.zeros(len(BUDGET_TERMS)) if budget is not None else None
+
+    # Allow heat input if tile is in sunlight (sun below the horizon brings no heat)
+    # Scale by latitude (lower at poles)
+    sunHeatIn = np.maximum(cosZenith, 0, out=scratch('sunHeatIn'))
+    sunHeatIn *= BASE_SUN_HEAT_FLUX
+
+    # Warm air or surface reduces albedo of snow
+    surfaceAlbedo = scratch('surfaceAlbedo')
+    np.copyto(surfaceAlbedo, fields.surfaceAlbedo[block])
+    warmSnow = scratch('warmSnow', bool)
+    np.greater(airTemperature, 32, out=warmSnow)
+    np.logical_and(warmSnow, surfaceSnow, out=warmSnow)
+    np.subtract(surfaceAlbedo, 0.1, out=surfaceAlbedo, where=warmSnow)
+    np.greater(temperature, 32, out=warmSnow)
+    np.logical_and(warmSnow, surfaceSnow, out=warmSnow)
+    np.subtract(surfaceAlbedo, 0.15, out=surfaceAlbedo, where=warmSnow)
+
+    # Air to surface convection (positive = heat into surface)
+    # Convection coefficient maxes out at 120mph wind and 175 W/m^2 K
+    convection = scratch('convection')
+    np.divide(windSpeed, MAX_CONVECTION_WIND_SPEED, out=convection)
+    np.sqrt(convection, out=convection)
+    convection *= AIR_CONVECTION_COEFFICIENT_BOUNDS[1] - AIR_CONVECTION_COEFFICIENT_BOUNDS[0]
+    convection += AIR_CONVECTION_COEFFICIENT_BOUNDS[0]
+    np.maximum(convection, NATURAL_CONVECTION_COEFFICIENT, out=convection)
+    convection *= fields.surfaceRoughness[block]
+    convection *= TILE_AREA
+    deltaTemp = np.subtract(airTemperature, temperature, out=scratch('deltaTemp'))
+    convection *= deltaTemp
+
+    # Radiation from surface and air (Rankine^4)
+    surfaceRadiation = np.add(temperature, -ABSOLUTE_ZERO, out=scratch('surfaceRadiation'))
+    np.square(surfaceRadiation, out=surfaceRadiation)
+    np.square(surfaceRadiation, out=surfaceRadiation)
+    surfaceRadiation *= SURFACE_RADIATION_COEFFICIENT
+    airRadiation = np.add(airTemperature, -ABSOLUTE_ZERO, out=scratch('airRadiation'))
+    np.square(airRadiation, out=airRadiation)
+    np.square(airRadiation, out=airRadiation)
+    airRadiation *= AIR_RADIATION_COEFFICIENT
+    airRadiation *= 1 + greenhouse
+
+    ########################
+    # Surface heat transfer
+    ########################
+
+    # IN: sun radiation, atmosphere re-radiation, hot air convection
+    # OUT: radiation to air, reflected sun radiation, cold air convection
+    sunHeatToSurface = np.multiply(sunHeatIn, 1 - heatRatioAir, out=scratch('sunHeatToSurface'))
+    surfaceReflection = np.multiply(sunHeatToSurface, surfaceAlbedo, out=scratch('surfaceReflection'))
+    surfaceNetHeat = np.subtract(sunHeatToSurface, surfaceReflection, out=scratch('surfaceNetHeat'))
+    surfaceNetHeat += heatFromAir
+    surfaceNetHeat += convection
+    surfaceNetHeat -= surfaceRadiation
+    if totals is not None:
+        totals[2] = np.sum(surfaceReflection)
+        totals[0] = np.sum(sunHeatToSurface) - totals[2]
+        totals[3] = np.sum(surfaceRadiation)
+        totals[4] = np.sum(airRadiation)
+        totals[5] = np.sum(heatFromAir)
+        totals[6] = np.sum(convection)
+        totals[8] = np.sum(surfaceNetHeat)
+
+    # Net heat change over time step to temperature change
+    surfaceNetHeat *= dt
+    surfaceNetHeat /= fields.surfaceHeatMass[block]
+    temperature += surfaceNetHeat
+
+    ####################
+    # Air heat transfer
+    ####################
+
+    # IN: sun radiation, surface re-radiation, hot surface convection, a percent of surface reflected energy
+    # OUT: radiation to surface/space, reflected sun radiation, cold surface convection
+    airNetHeat = np.multiply(sunHeatIn, heatRatioAir * (1 - ALBEDO['air']), out=scratch('airNetHeat'))
+    if totals is not None:
+        totals[1] = np.sum(airNetHeat)
+    reabsorbed = np.multiply(surfaceRadiation, SURFACE_RADIATION_ABSORPTION_AIR, out=scratch('reabsorbed'))
+    reabsorbed *= 1 + greenhouse
+    airNetHeat += reabsorbed
+    np.multiply(surfaceReflection, REFLECTION_RATIO_SURFACE_TO_AIR, out=reabsorbed)
+    reabsorbed *= 1 + greenhouse
+    airNetHeat += reabsorbed
+    if totals is not None:
+        totals[7] = np.sum(airNetHeat) - totals[1]
+    airNetHeat -= airRadiation
+    airNetHeat -= convection
+
+    # Net heat change over time step to temperature change
+    airNetHeat *= dt / AIR_HEAT_MASS
+
+    # By default, half of radiation from atmosphere reabsorbed by the surface
+    np.multiply(airRadiation, RADIATION_RATIO_AIR_TO_SURFACE, out=heatFromAir)
+
+    # Elevation factor only applies to warming air
+    warming = np.greater_equal(airNetHeat, 0, out=warmSnow)
+    np.multiply(airNetHeat, airTempElevFactor, out=airNetHeat, where=warming)
+
+    # Save previous value to calculate change in pressure/density
+    np.copyto(lastAirTemperature, airTemperature)
+    airTemperature += airNetHeat
+
+    # Flows (BTU/hr) over the step; air heat gain is already a temperature change over it
+    if totals is not None:
+        totals *= dt
+        totals[9] = np.sum(airNetHeat) * AIR_HEAT_MASS
+        add_to_budget(budget, totals)
+
+
+_budgetLock = threading.Lock()
+
+def add_to_budget(budget, totals):
+    """Add a block's (or a whole map's) energy budget totals to budget.
+       Blocks run on several threads, so additions are serialized."""
+    with _budgetLock:
+        budget += totals
+
+
+def budget_terms(budget):
+    """Energy budget array as a dict of term name -> total (BTU)."""
+    return dict(zip(BUDGET_TERMS, (float(total) for total in budget)))
+
+
+def convection_factor(windSpeed, surfaceRoughness):
+    """Air <-> surface convection per degree of difference (BTU/hr F) of each
+       tile, as in heat_balance."""
+    convection = AIR_CONVECTION_COEFFICIENT_BOUNDS[0] + (AIR_CONVECTION_COEFFICIENT_BOUNDS[1] - AIR_CONVECTION_COEFFICIENT_BOUNDS[0]) * np.sqrt(windSpeed / MAX_CONVECTION_WIND_SPEED)
+    return np.maximum(convection, NATURAL_CONVECTION_COEFFICIENT) * surfaceRoughness * TILE_AREA
+
+
+def max_stable_time_step(fields, greenhouse):
+    """Longest explicit heat balance step (hrs) that stays stable for every tile.
+       Uses the fastest possible response on the map (lightest surface, windiest
+       and roughest tile, hottest temperatures) so only a few reductions are needed."""
+
+    # Surface <-> air exchange by convection, per degree of difference
+    windSpeed = np.max(fields.windSpeedMagnitude)
+    convection = AIR_CONVECTION_COEFFICIENT_BOUNDS[0] + (AIR_CONVECTION_COEFFICIENT_BOUNDS[1] - AIR_CONVECTION_COEFFICIENT_BOUNDS[0]) * math.sqrt(max(windSpeed, 0) / MAX_CONVECTION_WIND_SPEED)
+    convection = max(convection, NATURAL_CONVECTION_COEFFICIENT) * np.max(fields.surfaceRoughness) * TILE_AREA
+    surfaceHeatMass = np.min(fields.surfaceHeatMass)
+    exchangeRate = convection * (1 / surfaceHeatMass + 1 / AIR_HEAT_MASS)
+
+    # Radiative loss linearized around hottest tile (d/dT of T^4)
+    surfaceRankine = max(np.max(fields.temperature) - ABSOLUTE_ZERO, 0)
+    airRankine = max(np.max(fields.airTemperature) - ABSOLUTE_ZERO, 0)
+    surfaceRadiationRate = 4 * SURFACE_RADIATION_COEFFICIENT * surfaceRankine**3 / surfaceHeatMass
+    airRadiationRate = 4 * AIR_RADIATION_COEFFICIENT * (1 + np.max(greenhouse)) * airRankine**3 / AIR_HEAT_MASS
+
+    return STABILITY_FACTOR / (exchangeRate + max(surfaceRadiationRate, airRadiationRate))
+
+
+def substep_count(dt, maxStep):
+    """Number of equal sub-steps needed so none is longer than maxStep."""
+    return max(1, math.ceil(dt / maxStep - 1E-9))
+
+
+def smoothing_pull(airTemperature):
+    """Pull of the 3x3 window averages on each tile's air temperature
+       (smoothing adds pull * smoothFactor): the average of each of the nine
+       windows a tile is part of, minus the tile. Linear in air temperature,
+       and zero for a uniform map (smoothing conserves the average)."""
+    topology = map_topology(airTemperature.shape[-2:])
+    averageTemperature = topology.gather(airTemperature).mean(axis=-1)
+    return topology.gather(averageTemperature).sum(axis=-1) - SMOOTH_PULL_WEIGHT * airTemperature
+
+
+def smooth_temps(fields, smoothFactor):
+    """Averages air temperature across each tile and its neighbors, moving
+       each tile a fraction of the way to the average of every 3x3 window
+       it is part of. All windows use the temperatures from before the
+       call, so the result does not depend on the order tiles are visited."""
+    fields.airTemperature += smoothing_pull(fields.airTemperature) * smoothFactor
+
+
+def advect_temps(fields, dt):
+    """Semi-Lagrangian advection of air temperature by the wind over dt hours:
+       each tile takes the temperature found where its air was dt hours ago
+       (traced straight back along its wind), interpolated bilinearly between
+       the four surrounding tiles, looping around the map edges. Stable for
+       any wind speed or dt, since values are only ever interpolated.
+       Interpolation alone does not conserve heat where the wind converges or
+       diverges, so the map-average air temperature is restored afterwards
+       (a global fixer, as in semi-Lagrangian weather models).
+       Works on map arrays with leading axes (e.g. ensemble members)."""
+    airTemperature = fields.airTemperature
+    sizeX, sizeY = airTemperature.shape[-2:]
+
+    # Departure point of each tile (in tiles; v points toward -y)
+    departureX = np.arange(sizeX)[:, np.newaxis] - fields.windU * (TILES_PER_WIND_HOUR * dt)
+    departureY = np.arange(sizeY)[np.newaxis, :] + fields.windV * (TILES_PER_WIND_HOUR * dt)
+    cornerX = np.floor(departureX)
+    cornerY = np.floor(departureY)
+    weightX = departureX - cornerX
+    weightY = departureY - cornerY
+
+    # Flat indices of the four surrounding tiles (within each map)
+    mapOffset = np.arange(int(np.prod(airTemperature.shape[:-2]))).reshape(airTemperature.shape[:-2] + (1, 1)) * (sizeX * sizeY)
+    x0 = cornerX.astype(np.intp) % sizeX
+    y0 = cornerY.astype(np.intp) % sizeY
+    x1 = (x0 + 1) % sizeX
+    y1 = (y0 + 1) % sizeY
+    x0 = mapOffset + x0 * sizeY
+    x1 = mapOffset + x1 * sizeY
+
+    temperatures = airTemperature.ravel()
+    lower = np.take(temperatures, x0 + y0) * (1 - weightY) + np.take(temperatures, x0 + y1) * weightY
+    upper = np.take(temperatures, x1 + y0) * (1 - weightY) + np.take(temperatures, x1 + y1) * weightY
+    advectedTemperature = lower * (1 - weightX) + upper * weightX
+
+    # Global fixer: same average heat (equal air mass per tile) before and after
+    advectedTemperature += np.mean(airTemperature, axis=(-2, -1), keepdims=True) - np.mean(advectedTemperature, axis=(-2, -1), keepdims=True)
+    airTemperature[...] = advectedTemperature
+
+
+def ideal_gas(fields):
+    """Air pressure (psi) of every tile from its air density and temperature
+       by the ideal gas law, P = density * R * T (T in Rankine)."""
+    airPressure = fields.airPressure
+    np.subtract(fields.airTemperature, ABSOLUTE_ZERO, out=airPressure)
+    airPressure *= fields.airDensity
+    airPressure *= AIR_GAS_CONSTANT / PSI_TO_PSF
+
+
+def calc_velocity(fields, dt):
+    """Accelerate wind down the pressure gradient over dt hours, against
+       surface friction (see GameMap.calc_velocity). The gradient of each tile
+       comes from its eight neighbors, using pressure reduced to sea level so
+       terrain alone does not drive wind. Wind is stored as u/v components;
+       windSpeedMagnitude is derived from them (capped at MAX_WIND_SPEED)."""
+    windU = fields.windU
+    windV = fields.windV
+    windSpeedMagnitude = fields.windSpeedMagnitude
+
+    # Pressure gradient (psi/ft) from neighbor differences, looping around the map edges
+    seaLevelPressure = fields.airPressure / fields.airPresElevFactor
+    differences = map_topology(seaLevelPressure.shape[-2:]).gather(seaLevelPressure) - seaLevelPressure[..., np.newaxis]
+    gradientU, gradientV = np.moveaxis(differences @ WINDOW_GRADIENT_WEIGHTS, -1, 0)
+
+    # Accelerate, then apply friction implicitly (stable for any dt)
+    acceleration = (WIND_ACCELERATION_COEFFICIENT * dt) / fields.airDensity
+    damping = 1 / (1 + WIND_FRICTION_RATE * dt)
+    windU += acceleration * gradientU
+    windU *= damping
+    windV += acceleration * gradientV
+    windV *= damping
+
+    # Cap wind speed, keeping direction
+    np.hypot(windU, windV, out=windSpeedMagnitude)
+    tooFast = windSpeedMagnitude > MAX_WIND_SPEED
+    if np.any(tooFast):
+        speedScale = MAX_WIND_SPEED / windSpeedMagnitude[tooFast]
+        windU[tooFast] *= speedScale
+        windV[tooFast] *= speedScale
+        windSpeedMagnitude[tooFast] = MAX_WIND_SPEED
+
+
+class NumpyKernels:
+    """Reference implementation of each tick phase, using NumPy array
+       operations (heat balance tiled over the thread pool)."""
+
+    name = "numpy"
+
+    def __init__(self, shape):
+        self.executor = TiledExecutor(shape)
+
+    def heat_balance(self, fields, cosZenith, greenhouse, dt, heatRatioAir=HEAT_RATIO_AIR, budget=None):
+        self.executor.run(heat_balance, fields, cosZenith, greenhouse, dt, heatRatioAir, budget)
+
+    def smooth_temps(self, fields, smoothFactor):
+        smooth_temps(fields, smoothFactor)
+
+    def advect_temps(self, fields, dt):
+        advect_temps(fields, dt)
+
+    def ideal_gas(self, fields):
+        ideal_gas(fields)
+
+    def calc_velocity(self, fields, dt):
+        calc_velocity(fields, dt)
+
+
+class NumbaKernels:
+    """Each tick phase as a Numba-compiled loop over tiles (kernels_numba).
+       Compiled on first use and cached to disk."""
+
+    name = "numba"
+
+    def __init__(self, shape):
+        import kernels_numba
+        self.jit = kernels_numba
+        self.topology = map_topology(shape)
+
+    def heat_balance(self, fields, cosZenith, greenhouse, dt, heatRatioAir=HEAT_RATIO_AIR, budget=None):
+        totals = self.jit.heat_balance(fields.temperature, fields.airTemperature, fields.lastAirTemperature, fields.heatFromAir,
+                                       fields.windSpeedMagnitude, fields.surfaceAlbedo, fields.surfaceHeatMass,
+                                       fields.surfaceRoughness, fields.surfaceSnow, fields.airTempElevFactor, cosZenith,
+                                       float(greenhouse), float(dt), float(heatRatioAir))
+        if budget is not None:
+            add_to_budget(budget, totals)
+
+    def smooth_temps(self, fields, smoothFactor):
+        self.jit.smooth_temps(fields.airTemperature, self.topology.windowIndices, float(smoothFactor))
+
+    def advect_temps(self, fields, dt):
+        self.jit.advect_temps(fields.airTemperature, fields.windU, fields.windV, float(dt))
+
+    def ideal_gas(self, fields):
+        self.jit.ideal_gas(fields.airPressure, fields.airTemperature, fields.airDensity)
+
+    def calc_velocity(self, fields, dt):
+        self.jit.calc_velocity(fields.airPressure, fields.airPresElevFactor, fields.airDensity, fields.windU, fields.windV,
+                               fields.windSpeedMagnitude, self.topology.windowIndices, WINDOW_GRADIENT_WEIGHTS, float(dt))
+
+
+def numba_available():
+    """Check whether Numba is installed without importing it."""
+    return importlib.util.find_spec("numba") is not None
+
+
+def load_kernels(shape, backend=KERNEL_BACKEND):
+    """Choose kernel backend for a map of given shape.
+       "auto" uses Numba when installed and falls back to NumPy."""
+    if backend not in KERNEL_BACKENDS:
+        raise ValueError(f"Unknown kernel backend '{backend}' (expected one of {KERNEL_BACKENDS})")
+    if backend != "numpy":
+        if numba_available():
+            return NumbaKernels(shape)
+        if backend == "numba":
+            log("Numba is not installed, falling back to NumPy kernels.")
+    return NumpyKernels(shape)
+
+
+def random_fields(shape, seed=0):
+    """Plausible random tile values for exercising kernels outside of a map."""
+    rng = np.random.default_rng(seed)
+    surfaceSnow = rng.random(shape) < 0.25
+    windU = rng.uniform(-20, 20, shape)
+    windV = rng.uniform(-20, 20, shape)
+    return SimpleNamespace(
+        temperature = rng.uniform(-30, 100, shape),
+        airTemperature = rng.uniform(-30, 100, shape),
+        lastAirTemperature = np.zeros(shape),
+        heatFromAir = rng.uniform(0, 2E8, shape),
+        airPressure = rng.uniform(13.5, 15, shape),
+        airDensity = rng.uniform(0.06, 0.08, shape),
+        airTempElevFactor = rng.uniform(0.5, 1, shape),
+        airPresElevFactor = rng.uniform(0.5, 1, shape),
+        windU = windU,
+        windV = windV,
+        windSpeedMagnitude = np.hypot(windU, windV),
+        surfaceAlbedo = np.where(surfaceSnow, ALBEDO['ice'], ALBEDO['stone']),
+        surfaceHeatMass = np.where(surfaceSnow, DENSITY['ice'] * CALC_DEPTH['ice'] * HEAT_CAPACITY['ice'],
+                                   DENSITY['stone'] * CALC_DEPTH['stone'] * HEAT_CAPACITY['stone']) * TILE_AREA,
+        surfaceRoughness = np.where(surfaceSnow, ROUGHNESS['snow'], ROUGHNESS['stone']),
+        surfaceSnow = surfaceSnow,
+        cosZenith = rng.uniform(-1, 1, shape),
+        energyBudget = np.zeros(len(BUDGET_TERMS)),
+        )
+
+
+def check_backends(candidate, reference, shape, seed=0, rtol=1E-9):
+    """Equivalence test: runs each tick phase of two backends on identical
+       random tile values (shape must match the backends) and compares results.
+       Returns {phase: (max relative difference, passed)}."""
+    phases = {
+        'heat_balance': (lambda kernels, f: kernels.heat_balance(f, f.cosZenith, 0.1, 3.0, budget=f.energyBudget),
+                         ('temperature', 'airTemperature', 'heatFromAir', 'energyBudget')),
+        'smooth_temps': (lambda kernels, f: kernels.smooth_temps(f, 3 * TEMPERATURE_SMOOTH_FACTOR), ('airTemperature',)),
+        'advect_temps': (lambda kernels, f: kernels.advect_temps(f, 3.0), ('airTemperature',)),
+        'ideal_gas': (lambda kernels, f: kernels.ideal_gas(f), ('airPressure',)),
+        'calc_velocity': (lambda kernels, f: kernels.calc_velocity(f, 3.0), ('windU', 'windV', 'windSpeedMagnitude')),
+        }
+    results = {}
+    for phase, (run_phase, outputs) in phases.items():
+        candidateFields = random_fields(shape, seed)
+        referenceFields = random_fields(shape, seed)
+        run_phase(candidate, candidateFields)
+        run_phase(reference, referenceFields)
+        difference = 0.0
+        for name in outputs:
+            a = getattr(candidateFields, name)
+            b = getattr(referenceFields, name)
+            scale = np.maximum(np.abs(b), 1.0)
+            difference = max(difference, float(np.nanmax(np.abs(a - b) / scale)))
+        results[phase] = (difference, difference <= rtol)
+    return results
@@ -0,0 +1,240 @@
+# Standard libraries
+import os
+import math
+import hashlib
+
+# Third-party libraries
+import numpy as np #2.1.1
+import numba
+
+# Local imports
+from physics import *
+from kernels import ABSOLUTE_ZERO, SURFACE_RADIATION_COEFFICIENT, AIR_RADIATION_COEFFICIENT, AIR_HEAT_MASS, \
+                    AIR_CONVECTION_COEFFICIENT_BOUNDS, MAX_CONVECTION_WIND_SPEED, SMOOTH_PULL_WEIGHT, \
+                    WIND_ACCELERATION_COEFFICIENT, MAX_WIND_SPEED, TILES_PER_WIND_HOUR, AIR_GAS_CONSTANT, PSI_TO_PSF
+
+#############
+# CONSTANTS #
+#############
+
+# Globals are frozen into compiled code, so unpack dictionaries/tuples to plain values
+AIR_ALBEDO = ALBEDO['air']
+CONVECTION_COEFFICIENT_MIN = AIR_CONVECTION_COEFFICIENT_BOUNDS[0]
+CONVECTION_COEFFICIENT_RANGE = AIR_CONVECTION_COEFFICIENT_BOUNDS[1] - AIR_CONVECTION_COEFFICIENT_BOUNDS[0]
+
+# Numba's disk cache is only invalidated when this file changes, but the constants above
+# (including physics.py) are frozen into the machine code: keep one cache per set of values
+KERNEL_CONSTANTS_HASH = hashlib.sha1(repr(sorted((name, value) for name, value in globals().items()
+                                                 if name.isupper())).encode()).hexdigest()[:16]
+KERNEL_CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "antistasis", "kernels", KERNEL_CONSTANTS_HASH)
+
+#####################
+# CLASSES/FUNCTIONS #
+#####################
+
+def kernel(**options):
+    """numba.njit, cached on disk in KERNEL_CACHE_DIRECTORY (the cache
+       location is fixed when a function is decorated)."""
+    def compile_kernel(function):
+        defaultCacheDirectory = numba.config.CACHE_DIR
+        numba.config.CACHE_DIR = KERNEL_CACHE_DIRECTORY
+        try:
+            return numba.njit(cache=True, **options)(function)
+        finally:
+            numba.config.CACHE_DIR = defaultCacheDirectory
+    return compile_kernel
+
+
+# Each function matches the NumPy reference of the same name in kernels.py
+
+@numba.njit(inline='always')
+def wrap(index, size):
+    """Index one step past either map edge looped around to the other edge
+       (cheaper than the sign handling of %)."""
+    if index < 0:
+        return index + size
+    if index >= size:
+        return index - size
+    return index
+
+
+@kernel(parallel=True, fastmath={'reassoc'})
+def heat_balance(temperature, airTemperature, lastAirTemperature, heatFromAir, windSpeedMagnitude,
+                 surfaceAlbedo, surfaceHeatMass, surfaceRoughness, surfaceSnow, airTempElevFactor, cosZenith,
+                 greenhouse, dt, heatRatioAir):
+    """Per-tile heat balance loop (see kernels.heat_balance).
+       Returns the map totals of the energy budget terms (kernels.BUDGET_TERMS)."""
+    sizeX, sizeY = temperature.shape
+    rowTotals = np.zeros((sizeX, 10))
+    for i in numba.prange(sizeX):
+        sunAbsorbedSurface = 0.0
+        sunAbsorbedAir = 0.0
+        sunReflected = 0.0
+        surfaceRadiationTotal = 0.0
+        airRadiationTotal = 0.0
+        airRadiationToSurface = 0.0
+        convectionToSurface = 0.0
+        greenhouseReabsorbed = 0.0
+        surfaceHeatGain = 0.0
+        airHeatGain = 0.0
+        for j in range(sizeY):
+
+            # Correct for values below absolute zero
+            surfaceTemperature = max(temperature[i, j], ABSOLUTE_ZERO)
+            airTemp = max(airTemperature[i, j], ABSOLUTE_ZERO)
+            sunHeatIn = BASE_SUN_HEAT_FLUX * max(cosZenith[i, j], 0.0)
+
+            # Warm air or surface reduces albedo of snow
+            albedo = surfaceAlbedo[i, j]
+            if surfaceSnow[i, j]:
+                if airTemp > 32:
+                    albedo -= 0.1
+                if surfaceTemperature > 32:
+                    albedo -= 0.15
+
+            # Air to surface convection
+            convectionCoefficient = CONVECTION_COEFFICIENT_MIN + CONVECTION_COEFFICIENT_RANGE * math.sqrt(windSpeedMagnitude[i, j] / MAX_CONVECTION_WIND_SPEED)
+            convectionCoefficient = max(convectionCoefficient, NATURAL_CONVECTION_COEFFICIENT)
+            convectionEnergy = convectionCoefficient * surfaceRoughness[i, j] * TILE_AREA * (airTemp - surfaceTemperature)
+            if convectionEnergy > 0:
+                airConvectionToSurface = convectionEnergy
+                surfaceConvectionToAir = 0.0
+            else:
+                airConvectionToSurface = 0.0
+                surfaceConvectionToAir = -convectionEnergy
+
+            # Surface heat transfer
+            sunHeatToSurface = (1 - heatRatioAir) * sunHeatIn
+            surfaceReflection = sunHeatToSurface * albedo
+            surfaceRankine = surfaceTemperature - ABSOLUTE_ZERO
+            surfaceRadiation = SURFACE_RADIATION_COEFFICIENT * (surfaceRankine * surfaceRankine) * (surfaceRankine * surfaceRankine)
+            totalSurfaceHeatGain = (sunHeatToSurface - surfaceReflection) + heatFromAir[i, j] + airConvectionToSurface
+            totalSurfaceHeatLoss = surfaceRadiation + surfaceConvectionToAir
+            temperature[i, j] = surfaceTemperature + (totalSurfaceHeatGain - totalSurfaceHeatLoss) * dt / surfaceHeatMass[i, j]
+            sunAbsorbedSurface += sunHeatToSurface - surfaceReflection
+            sunReflected += surfaceReflection
+            surfaceRadiationTotal += surfaceRadiation
+            airRadiationToSurface += heatFromAir[i, j]
+            convectionToSurface += convectionEnergy
+            surfaceHeatGain += totalSurfaceHeatGain - totalSurfaceHeatLoss
+
+            # Air heat transfer
+            airRankine = airTemp - ABSOLUTE_ZERO
+            airRadiation = AIR_RADIATION_COEFFICIENT * (airRankine * airRankine) * (airRankine * airRankine) * (1 + greenhouse)
+            sunHeatToAir = heatRatioAir * (1 - AIR_ALBEDO) * sunHeatIn
+            reabsorbed = surfaceRadiation * SURFACE_RADIATION_ABSORPTION_AIR * (1 + greenhouse) \
+                       + surfaceReflection * REFLECTION_RATIO_SURFACE_TO_AIR * (1 + greenhouse)
+            totalAirHeatGain = sunHeatToAir + reabsorbed + surfaceConvectionToAir
+            totalAirHeatLoss = airRadiation + airConvectionToSurface
+            airDeltaTemperature = (totalAirHeatGain - totalAirHeatLoss) * (dt / AIR_HEAT_MASS)
+            heatFromAir[i, j] = airRadiation * RADIATION_RATIO_AIR_TO_SURFACE
+            if airDeltaTemperature >= 0:
+                airDeltaTemperature *= airTempElevFactor[i, j]
+            lastAirTemperature[i, j] = airTemp
+            airTemperature[i, j] = airTemp + airDeltaTemperature
+            sunAbsorbedAir += sunHeatToAir
+            airRadiationTotal += airRadiation
+            greenhouseReabsorbed += reabsorbed
+            airHeatGain += airDeltaTemperature
+
+        # Flows (BTU/hr) over the step; air heat gain is already a temperature change over it
+        rowTotals[i, 0] = sunAbsorbedSurface * dt
+        rowTotals[i, 1] = sunAbsorbedAir * dt
+        rowTotals[i, 2] = sunReflected * dt
+        rowTotals[i, 3] = surfaceRadiationTotal * dt
+        rowTotals[i, 4] = airRadiationTotal * dt
+        rowTotals[i, 5] = airRadiationToSurface * dt
+        rowTotals[i, 6] = convectionToSurface * dt
+        rowTotals[i, 7] = greenhouseReabsorbed * dt
+        rowTotals[i, 8] = surfaceHeatGain * dt
+        rowTotals[i, 9] = airHeatGain * AIR_HEAT_MASS
+    return rowTotals.sum(axis=0)
+
+
+@kernel(parallel=True)
+def smooth_temps(airTemperature, windowIndices, smoothFactor):
+    """Two passes over tiles (flat, windows from topology.Topology):
+       3x3 window averages, then the pull of each window on its tiles
+       (see kernels.smooth_temps)."""
+    tileCount, windowSize = windowIndices.shape
+    temperatures = airTemperature.reshape(tileCount)
+    averageTemperature = np.empty(tileCount)
+    for tile in numba.prange(tileCount):
+        total = 0.0
+        for n in range(windowSize):
+            total += temperatures[windowIndices[tile, n]]
+        averageTemperature[tile] = total / windowSize
+    newTemperature = np.empty(tileCount)
+    for tile in numba.prange(tileCount):
+        pull = 0.0
+        for n in range(windowSize):
+            pull += averageTemperature[windowIndices[tile, n]]
+        pull -= SMOOTH_PULL_WEIGHT * temperatures[tile]
+        newTemperature[tile] = temperatures[tile] + pull * smoothFactor
+    temperatures[:] = newTemperature
+
+
+@kernel(parallel=True)
+def advect_temps(airTemperature, windU, windV, dt):
+    """Semi-Lagrangian advection, bilinear interpolation at each tile's
+       departure point from the temperatures at the start of the call,
+       then the map-average temperature restored (see kernels.advect_temps)."""
+    sizeX, sizeY = airTemperature.shape
+    startTemperature = airTemperature.copy()
+    for i in numba.prange(sizeX):
+        for j in range(sizeY):
+            departureX = i - windU[i, j] * (TILES_PER_WIND_HOUR * dt)
+            departureY = j + windV[i, j] * (TILES_PER_WIND_HOUR * dt)
+            cornerX = math.floor(departureX)
+            cornerY = math.floor(departureY)
+            weightX = departureX - cornerX
+            weightY = departureY - cornerY
+            x0 = int(cornerX) % sizeX
+            y0 = int(cornerY) % sizeY
+            x1 = wrap(x0 + 1, sizeX)
+            y1 = wrap(y0 + 1, sizeY)
+            lower = startTemperature[x0, y0] * (1 - weightY) + startTemperature[x0, y1] * weightY
+            upper = startTemperature[x1, y0] * (1 - weightY) + startTemperature[x1, y1] * weightY
+            airTemperature[i, j] = lower * (1 - weightX) + upper * weightX
+    airTemperature += np.mean(startTemperature) - np.mean(airTemperature)
+
+
+@kernel(parallel=True)
+def ideal_gas(airPressure, airTemperature, airDensity):
+    """Ideal gas law per tile (see kernels.ideal_gas)."""
+    sizeX, sizeY = airPressure.shape
+    for i in numba.prange(sizeX):
+        for j in range(sizeY):
+            airPressure[i, j] = (airTemperature[i, j] - ABSOLUTE_ZERO) * airDensity[i, j] * (AIR_GAS_CONSTANT / PSI_TO_PSF)
+
+
+@kernel(parallel=True)
+def calc_velocity(airPressure, airPresElevFactor, airDensity, windU, windV, windSpeedMagnitude, windowIndices,
+                  gradientWeights, dt):
+    """Pressure gradient wind update, one tile at a time (flat, windows
+       from topology.Topology; see kernels.calc_velocity)."""
+    tileCount, windowSize = windowIndices.shape
+    damping = 1 / (1 + WIND_FRICTION_RATE * dt)
+    seaLevelPressure = (airPressure / airPresElevFactor).reshape(tileCount)
+    density = airDensity.reshape(tileCount)
+    flatU = windU.reshape(tileCount)
+    flatV = windV.reshape(tileCount)
+    flatSpeed = windSpeedMagnitude.reshape(tileCount)
+    for tile in numba.prange(tileCount):
+        gradientU = 0.0
+        gradientV = 0.0
+        for n in range(windowSize):
+            difference = seaLevelPressure[windowIndices[tile, n]] - seaLevelPressure[tile]
+            gradientU += gradientWeights[n, 0] * difference
+            gradientV += gradientWeights[n, 1] * difference
+        acceleration = (WIND_ACCELERATION_COEFFICIENT * dt) / density[tile]
+        u = (flatU[tile] + acceleration * gradientU) * damping
+        v = (flatV[tile] + acceleration * gradientV) * damping
+        magnitude = math.hypot(u, v)
+        if magnitude > MAX_WIND_SPEED:
+            u *= MAX_WIND_SPEED / magnitude
+            v *= MAX_WIND_SPEED / magnitude
+            magnitude = MAX_WIND_SPEED
+        flatU[tile] = u
+        flatV[tile] = v
+        flatSpeed[tile] = magnitude
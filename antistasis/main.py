@@ -1,17 +1,9 @@
 # Standard libraries
-import os
-import sys
-import time
-import math
-import random
-import subprocess
+import threading
 
 # Third-party libraries
-import numpy as np #2.1.1
-import pandas as pd #2.2.2
 import pygame #2.6.1
 from pygame.locals import *
-import pyglet #2.0.20
 
 # Local imports
 from graphics import *
@@ -26,17 +18,40 @@ from __version__ import __version__ as gameVersion
 
 # Simulation
 SEA_LEVEL_INCREMENT = 100   # ft
-SUN_HOUR_ANGLE_INCREMENT = 15  # degrees
+SUN_HOUR_ANGLE_INCREMENT = 15  # degrees per hour
 MAX_SUN_HOUR_ANGLE = 360       # degrees
 
 SIM_TICK_DURATION = 1000    # ms
 SIM_SPEED_LEVELS = [0, 1, 2, 5, 10, 25]
+IDLE_EVENT_TIMEOUT = 250    # ms, longest wait for input while paused and nothing to redraw
 
 WORLD_SIZE = 32
+WORLD_SEED = None   # None for a new world each launch; a fixed seed is generated once, then loaded from the world cache
+
+PUBLISH_STATE = False   # mirror map arrays into shared memory each tick for external tools (see shared_state.StateReader)
+TELEMETRY = False       # serve per-tick metrics and field frames on TELEMETRY_HOST:TELEMETRY_PORT (see telemetry.py)
+
+# Energy budget readout (map-average flux of each heat flow term, W/m^2)
+BTU_PER_HR_TO_WATTS = 0.29307107
+TILE_AREA_SQUARE_METERS = 2589988.11  # 1 square mile
+ENERGY_BUDGET_LABELS = {
+'sunAbsorbedSurface':       "Sun -> surface",
+'sunAbsorbedAir':           "Sun -> air",
+'sunReflected':             "Sun reflected",
+'surfaceRadiation':         "Surface radiation",
+'airRadiation':             "Air radiation",
+'airRadiationToSurface':    "Air rad. -> surface",
+'convectionToSurface':      "Convection -> surface",
+'greenhouseReabsorbed':     "Reabsorbed by air",
+'surfaceHeatGain':          "Surface net gain",
+'airHeatGain':              "Air net gain",
+'airLapseLoss':             "Air lapse-rate loss",
+}
 
 # Pygame settings
 EVENTS_USED = [pygame.KEYDOWN,          pygame.QUIT,        pygame.MOUSEBUTTONDOWN, \
-               pygame.MOUSEBUTTONUP,    pygame.MOUSEWHEEL,  pygame.MOUSEMOTION]
+               pygame.MOUSEBUTTONUP,    pygame.MOUSEWHEEL,  pygame.MOUSEMOTION, \
+               pygame.WINDOWEXPOSED]
 
 #####################
 # CLASSES/FUNCTIONS #
@@ -52,9 +67,17 @@ class Game:
         self.window = None
         self.screen = None
         self.map = None
+        self.zonalPlot = None
+        self.publisher = None
+        self.telemetry = None
         self.clock = None
         self.fonts = {}
         
+        # Properties related to startup (map setup runs in the background)
+        self.loadingStage = "Starting up"
+        self.loadingProgress = 0.0
+        self.loadingError = None
+        
         # Properties related to simulation speed/time
         self.running = True
         self.simulating = False
@@ -62,8 +85,11 @@ class Game:
         self.simSpeedIndex = 1
         self.hours = 0
         
-        # Properties related to display
+        # Properties related to display (the screen is only redrawn when something on it changed)
+        self.redrawNeeded = True
         self.readout = True
+        self.budgetReadout = False
+        self.zonalReadout = False
         
         # Properties related to controls
         self.mouseDown = False
@@ -78,6 +104,8 @@ class Game:
         K_6: ('Air Pressure', 'psi'),        
         K_7: ('Air Density', 'lb/ft³'),        
         K_8: ('Wind Speed', 'mph'),        
+        K_9: ('Mean Air Temperature', '°F'),
+        K_0: ('Diurnal Range', '°F'),
         }
     
     def toggle_control(self, control):
@@ -89,13 +117,11 @@ class Game:
 
     def raise_sea_level(self):
         """Passes user request to raise sea level to simulation core."""
-        self.map.seaLevel += SEA_LEVEL_INCREMENT
-        self.map.reset_tiles()
+        self.map.set_sea_level(self.map.seaLevel + SEA_LEVEL_INCREMENT)
         
     def lower_sea_level(self):
         """Passes user request to raise sea level to simulation core."""
-        self.map.seaLevel -= SEA_LEVEL_INCREMENT
-        self.map.reset_tiles()
+        self.map.set_sea_level(self.map.seaLevel - SEA_LEVEL_INCREMENT)
 
     def handle_keydown(self, event):
         """Handles a Pygame keydown event.
@@ -120,6 +146,14 @@ class Game:
         # Toggle stats (FPS, coords, etc)
         if event.key == K_q:
             self.readout = not self.readout
+
+        # Toggle energy budget readout
+        if event.key == K_b:
+            self.budgetReadout = not self.budgetReadout
+
+        # Toggle zonal (latitude) statistics plot
+        if event.key == K_l:
+            self.zonalReadout = not self.zonalReadout
                 
         # Raise sea level
         if event.key == K_w:
@@ -137,6 +171,10 @@ class Game:
         if event.key == K_s:
             self.map.displaySun = not self.map.displaySun
             
+        # Jump to equilibrium temperatures
+        if event.key == K_r:
+            self.map.spin_up()
+
         # Decrease greenhouse effect
         if event.key == K_LEFTBRACKET:
             self.map.decrease_greenhouse_effect()
@@ -157,12 +195,25 @@ class Game:
         """Handles Pygame events.
            Keydown events passed to handle_keydown."""
 
+        # While paused with nothing to redraw, sleep until input arrives (or timeout)
+        events = pygame.event.get()
+        if not events and self.simSpeedFactor == 0 and not (self.redrawNeeded or self.map.redrawNeeded
+                                                            or self.map.scaling_pending()):
+            event = pygame.event.wait(IDLE_EVENT_TIMEOUT)
+            if event.type != NOEVENT:
+                events = [event]
+
+        # Wheel steps and drag offsets are summed over the frame and applied once (one rescale)
+        zoomSteps = 0
+        dragX, dragY = 0, 0
+
         # Loop through all events (filtered by EVENTS_USED)
-        for event in pygame.event.get():
+        for event in events:
 
-            # Keydowns passed to keydown handler function
+            # Keydowns passed to keydown handler function (every key may change the display)
             if event.type == pygame.KEYDOWN:
                 self.handle_keydown(event)
+                self.redrawNeeded = True
                 
             # Mouse currently only used to click-and-drag and zoom
             elif event.type == pygame.MOUSEBUTTONDOWN:
@@ -171,13 +222,28 @@ class Game:
                 self.mouseDown = False
             elif event.type == pygame.MOUSEMOTION:
                 if self.mouseDown:
-                    self.map.drag(event.rel)
+                    dragX += event.rel[0]
+                    dragY += event.rel[1]
+                if self.readout:
+                    self.redrawNeeded = True # mouse coordinates shown
             elif event.type == pygame.MOUSEWHEEL:
-                self.map.zoom(event.y)
+                zoomSteps += event.y
+            
+            # Window uncovered/restored
+            elif event.type == pygame.WINDOWEXPOSED:
+                self.redrawNeeded = True
             
             # End game
             elif event.type == QUIT:
                 self.running = False    
+
+        # Apply the frame's zoom and pan together (a pan alone only rescales zoomed-out views)
+        if zoomSteps:
+            self.map.zoom(zoomSteps, (dragX, dragY))
+        elif dragX or dragY:
+            self.map.drag((dragX, dragY))
+        self.map.finish_zoom(pygame.time.get_ticks())
+        self.map.finish_scaling()
     
     def start_up(self):
         """Initializes Pygame, sets up game window/screen, creates game objects
@@ -210,14 +276,61 @@ class Game:
         self.screen = self.window.screen
         log("Interface loaded.")
 
-        # Initialize map object
-        self.map = GameMap(self.window, self.graphics, WORLD_SIZE)
-        log("Map initialized.")
-
         # Font for on-screen text
         self.fonts['default'] = pygame.font.SysFont('simsunextb.ttf', 32)
         self.fonts['contour'] = pygame.font.Font('resources/fonts/unispace.ttf', 14)
         self.fonts['pokemon'] = pygame.font.Font('resources/fonts/PokemonGb-RAeo.ttf', 14)
+
+        # Initialize map object in the background, showing its progress until it is ready
+        mapThread = threading.Thread(target=self.create_map, daemon=True)
+        mapThread.start()
+        while mapThread.is_alive():
+            for event in pygame.event.get():
+                if event.type == QUIT:
+                    self.running = False
+            self.draw_loading_screen()
+            pygame.display.flip()
+            self.clock.tick(30)
+        if self.loadingError is not None:
+            raise self.loadingError
+        self.zonalPlot = ZonalPlot(self.window)
+        if PUBLISH_STATE:
+            import shared_state
+            try:
+                self.publisher = shared_state.StatePublisher(self.map.mapData)
+            except FileExistsError as error:
+                log(f"Map state not published: {error}")
+        if TELEMETRY:
+            import telemetry
+            self.telemetry = telemetry.TelemetryServer(lambda displayMode: display_values(self.map.mapData, displayMode,
+                                                                                         self.map.seaLevel, self.map.climatology))
+            self.telemetry.start()
+        log("Map initialized.")
+
+    def set_loading_progress(self, stage, fraction):
+        """Record map setup progress (called from the setup thread)."""
+        self.loadingStage = stage
+        self.loadingProgress = fraction
+
+    def create_map(self):
+        """Create the map (run in the background by start_up)."""
+        try:
+            self.map = GameMap(self.window, self.graphics, WORLD_SIZE, seed=WORLD_SEED, progress=self.set_loading_progress)
+            self.map.update_zonal_statistics(self.hours)
+        except Exception as error:
+            self.loadingError = error
+
+    def draw_loading_screen(self):
+        """Draw the current map setup stage and a progress bar."""
+        self.screen.fill(backdropColor)
+        stageText = self.fonts['pokemon'].render(f"{self.loadingStage}...", True, textColor, textBackdropColor)
+        center = (self.window.x // 2, self.window.y // 2)
+        self.screen.blit(stageText, (center[0] - stageText.get_width() // 2, center[1] - 40))
+        barWidth, barHeight = 400, 20
+        barRect = pygame.Rect(center[0] - barWidth // 2, center[1], barWidth, barHeight)
+        pygame.draw.rect(self.screen, textColor, barRect, 2)
+        progressRect = pygame.Rect(barRect.x + 4, barRect.y + 4, int((barWidth - 8) * self.loadingProgress), barHeight - 8)
+        pygame.draw.rect(self.screen, textColor, progressRect)
     
     @property
     def simSpeedFactor(self):
@@ -243,17 +356,27 @@ class Game:
     
     def simulate(self):
         """Run a single tick of the simulation.
-           Corresponds to one real-world hour."""
-        self.hours += 1
-        self.map.sunHourAngle += SUN_HOUR_ANGLE_INCREMENT
+           Corresponds to TIME_STEP real-world hours (map.timeStep)."""
+        self.hours += self.map.timeStep
+        self.map.sunHourAngle += SUN_HOUR_ANGLE_INCREMENT * self.map.timeStep
         if self.map.sunHourAngle >= MAX_SUN_HOUR_ANGLE:
             self.map.sunHourAngle -= MAX_SUN_HOUR_ANGLE
+            self.map.dayOfYear = (self.map.dayOfYear + 1) % DAYS_PER_YEAR
         self.map.reset_suntiles()
         self.map.heat_calcs()
         self.map.smooth_temps()
-        #self.map.gas_calcs()
-        #map.calc_velocity()
-        self.map.reset_tiles()
+        self.map.gas_calcs()
+        self.map.calc_velocity()
+        self.map.advect_temps()
+        changedTiles = self.map.update_tile_types()
+        self.map.update_zonal_statistics(self.hours)
+        self.map.update_climatology()
+        self.map.redraw_tick(changedTiles)
+        if self.publisher is not None:
+            self.publisher.publish(self.hours)
+        if self.telemetry is not None:
+            from telemetry import map_metrics
+            self.telemetry.publish(self.hours, map_metrics(self.map.mapData))
         
     def control_simulation(self):
         """Paces the simulation according to set speed."""
@@ -269,7 +392,21 @@ class Game:
             if currentTime >= nextTickTime:
                 self.simulate()
                 self.lastTickTime = currentTime
+                self.redrawNeeded = True
         
+    def draw_energy_budget(self, position):
+        """Draw the map-average flux (W/m^2) of each heat flow term of the last tick."""
+        tileHours = self.map.mapAreaTiles * self.map.timeStep
+        budget = self.map.energy_budget()
+        budgetBackdropBox = pygame.Surface((392, 26 * len(ENERGY_BUDGET_LABELS) + 10))
+        budgetBackdropBox.set_alpha(150)
+        budgetBackdropBox.fill((0, 0, 0))
+        self.screen.blit(budgetBackdropBox, position)
+        for line, (term, label) in enumerate(ENERGY_BUDGET_LABELS.items()):
+            flux = budget[term] / tileHours * BTU_PER_HR_TO_WATTS / TILE_AREA_SQUARE_METERS
+            budgetText = self.fonts['pokemon'].render(f"{label}: {flux:.1f}", True, textColor, textBackdropColor)
+            self.screen.blit(budgetText, (position[0] + 10, position[1] + 10 + 26 * line))
+
     def run(self):
 
         # Log start time
@@ -284,66 +421,83 @@ class Game:
             # Pace simulation according to speed setting
             self.control_simulation()    
 
-            # Fill the background with color
-            self.screen.fill(backdropColor)
+            # Skip composition and flip when neither view nor simulation changed
+            if self.redrawNeeded or self.map.redrawNeeded:
+                self.redrawNeeded = False
+                self.map.redrawNeeded = False
+
+                # Fill the background with color
+                self.screen.fill(backdropColor)
                  
-            # Generate map and blit
-            mapSurface, origin = self.map.get_map()
-            self.screen.blit(mapSurface, origin)
+                # Generate map and blit
+                mapSurface, origin = self.map.get_map()
+                self.screen.blit(mapSurface, origin)
             
-            # Display sunlit area if enabled
-            if self.map.displaySun:
-                sunSurface, origin = self.map.get_sun_map()
-                self.screen.blit(sunSurface, origin)
+                # Display sunlit area if enabled
+                if self.map.displaySun:
+                    sunSurface, origin = self.map.get_sun_map()
+                    self.screen.blit(sunSurface, origin)
             
-            # Plot contour levels
-            if self.map.contourEnabled:
-                self.map.contour.create(self.map.contourMin, self.map.contourMax, self.map.unit, self.fonts['contour'])
-
-            # Toggle display of run/simulation stats
-            if self.readout:
-
-                # Backdrop to enhance readout text clarity
-                readoutBackdropBox = pygame.Surface((392, 166))
-                readoutBackdropBox.set_alpha(150)
-                readoutBackdropBox.fill((0, 0, 0))
-                self.screen.blit(readoutBackdropBox, (0, 0))
-
-                # Calculate and display FPS
-                fps = self.clock.get_fps()
-                fpsText = self.fonts['pokemon'].render(f"FPS: {fps:.1f}", True, textColor, textBackdropColor)
-                self.screen.blit(fpsText, (10, 10))
-
-                # Display mouse coordinates
-                mousePosText = self.fonts['pokemon'].render(str(pygame.mouse.get_pos()), True, textColor, textBackdropColor)
-                self.screen.blit(mousePosText, (10, 36))
+                # Plot contour levels
+                if self.map.contourEnabled:
+                    self.map.contour.create(self.map.contourMin, self.map.contourMax, self.map.unit, self.fonts['contour'])
+
+                # Plot zonal (latitude) statistics
+                if self.zonalReadout:
+                    self.zonalPlot.create(self.map.zonalHistory, self.fonts['contour'])
+
+                # Toggle display of run/simulation stats
+                if self.readout:
+
+                    # Backdrop to enhance readout text clarity
+                    readoutBackdropBox = pygame.Surface((392, 166))
+                    readoutBackdropBox.set_alpha(150)
+                    readoutBackdropBox.fill((0, 0, 0))
+                    self.screen.blit(readoutBackdropBox, (0, 0))
+
+                    # Calculate and display FPS
+                    fps = self.clock.get_fps()
+                    fpsText = self.fonts['pokemon'].render(f"FPS: {fps:.1f}", True, textColor, textBackdropColor)
+                    self.screen.blit(fpsText, (10, 10))
+
+                    # Display mouse coordinates
+                    mousePosText = self.fonts['pokemon'].render(str(pygame.mouse.get_pos()), True, textColor, textBackdropColor)
+                    self.screen.blit(mousePosText, (10, 36))
                 
-                # Display current map view mode
-                displayModeText = self.fonts['pokemon'].render("Mode: " + str(self.map.displayMode), True, textColor, textBackdropColor)
-                self.screen.blit(displayModeText, (10, 62))
+                    # Display current map view mode
+                    displayModeText = self.fonts['pokemon'].render("Mode: " + str(self.map.displayMode), True, textColor, textBackdropColor)
+                    self.screen.blit(displayModeText, (10, 62))
                 
-                if self.simSpeedFactor == 0:
-                    runningText = self.fonts['pokemon'].render("Simulation Paused (0x)", True, textColor, textBackdropColor)
-                else:
-                    runningText = self.fonts['pokemon'].render("Simulation Running (" + str(self.simSpeedFactor) + "x)", True, textColor, textBackdropColor)
-                self.screen.blit(runningText, (10, 88))
+                    if self.simSpeedFactor == 0:
+                        runningText = self.fonts['pokemon'].render("Simulation Paused (0x)", True, textColor, textBackdropColor)
+                    else:
+                        runningText = self.fonts['pokemon'].render("Simulation Running (" + str(self.simSpeedFactor) + "x)", True, textColor, textBackdropColor)
+                    self.screen.blit(runningText, (10, 88))
                 
-                displayGreenhouseText = self.fonts['pokemon'].render("Greenhouse Effect: " + str(round(self.map.greenhouse, 2)), True, textColor, textBackdropColor)
-                self.screen.blit(displayGreenhouseText, (10, 114))
+                    displayGreenhouseText = self.fonts['pokemon'].render("Greenhouse Effect: " + str(round(self.map.greenhouse, 2)), True, textColor, textBackdropColor)
+                    self.screen.blit(displayGreenhouseText, (10, 114))
                 
-                # Display time values
-                hoursRem = self.hours % 24.0
-                days = (self.hours - hoursRem) / 24.0
-                daysRem = days % 365
-                years = (days - daysRem) / 365
-                displayTimeText = self.fonts['pokemon'].render(str(round(years)) + " years, " +str(round(daysRem)) + " days, " + str(round(hoursRem)) + " hrs", True, textColor, textBackdropColor)
-                self.screen.blit(displayTimeText, (10, 140))
-
-            # Flip the display
-            pygame.display.flip()
+                    # Display time values
+                    hoursRem = self.hours % 24.0
+                    days = (self.hours - hoursRem) / 24.0
+                    daysRem = days % 365
+                    years = (days - daysRem) / 365
+                    displayTimeText = self.fonts['pokemon'].render(str(round(years)) + " years, " +str(round(daysRem)) + " days, " + str(round(hoursRem)) + " hrs", True, textColor, textBackdropColor)
+                    self.screen.blit(displayTimeText, (10, 140))
+
+                    # Energy budget of last tick (W/m^2, map average)
+                    if self.budgetReadout:
+                        self.draw_energy_budget((0, 166))
+
+                # Flip the display
+                pygame.display.flip()
             self.clock.tick(60)
 
         # QUITTING ROUTINE
+        if self.publisher is not None:
+            self.publisher.close()
+        if self.telemetry is not None:
+            self.telemetry.stop()
         pygame.quit()
 
     def launch(self):
@@ -0,0 +1,70 @@
+#############
+# CONSTANTS #
+#############
+
+# Physical constants and material properties shared by the map and the simulation kernels
+
+BASE_SUN_HEAT_FLUX = 1.2028 * 10**10    # BTU/hr per square mile from sun before albedo and latitude calcs
+
+HEAT_RATIO_AIR = 0.23           # default/initial percent of sun's radiation absorbed by atmosphere
+
+RADIATION_RATIO_AIR_TO_SURFACE = 0.5
+
+SURFACE_RADIATION_ABSORPTION_AIR = 0.8
+
+REFLECTION_RATIO_SURFACE_TO_AIR = 0.2
+
+STEFAN_BOLTZMANN_CONSTANT = 0.1714      # BTU/(hr*ft^2*°R^4)
+
+RADIATION_CONTROL_FACTOR = (1.0E-8) # how much radiative heat loss is scaled by... higher = more heat loss per tick (1.0E-8 = real Stefan-Boltzmann constant)
+
+NATURAL_CONVECTION_COEFFICIENT = 0.5 # chatgpt says horizontal surfaces should be in 0.5-1 BTU/(ft^2 °F)
+
+PRESSURE_GRADIENT_CONTROL_FACTOR = 1E-3 # how much of the pressure gradient force accelerates wind... tiles are too coarse for real gradients
+
+WIND_FRICTION_RATE = 0.25       # fraction of wind speed lost to surface friction per hour
+
+TEMPERATURE_SMOOTH_FACTOR = 0.003 # how much closer to average air temperature of their surroundings tiles get each smoothing iteration
+
+TILE_AREA = 5280.0**2           # ft^2 in one 1 mile x 1 mile tile
+
+# Material property dictionaries... maybe move to a per-material dictionary of propreties?
+HEAT_CAPACITY = {
+'stone':    0.23885,                    # BTU/lb F
+'water':    1.001,                      # BTU/lb F
+'ice':      0.5,                        # BTU/lb F
+'air':      0.17128                     # BTU/lb F
+}
+
+DENSITY = {
+'stone':    175,                        # lb / ft^3
+'water':    62.4,                       # lb / ft^3
+'ice':      57.24644,                   # lb / ft^3
+'air':      0.075                       # lb / ft^3
+}
+
+ALBEDO = {
+'stone':    0.35,
+'water':    0.075,
+'ice':      0.75,
+'air':      0.3
+}
+
+CALC_DEPTH = {
+'stone':    1,                         # ft
+'water':    300,                       # ft
+'ice':      5,                         # ft
+'air':      2500                          # ft
+}
+
+EMISSIVITY = {
+'surface':  0.9,
+'air':      0.7
+}
+
+# Surface roughness increase on surface area estimation
+# Rougher surface = more surface area for convection
+ROUGHNESS = {
+'stone':    1.2,
+'snow':     1.5
+}
@@ -0,0 +1,184 @@
+# Standard libraries
+import time
+from multiprocessing import shared_memory, resource_tracker
+
+# Third-party libraries
+import numpy as np #2.1.1
+
+# Local imports
+from ui import *
+
+#############
+# CONSTANTS #
+#############
+
+# Shared memory blocks are named "<prefix>_header" and "<prefix>_<field>"
+SHARED_STATE_PREFIX = "antistasis"
+SHARED_STATE_VERSION = 1
+
+# Map arrays mirrored each tick (wind: u toward +x, v up the map, ft/s; type: index into TILE_TYPES)
+SHARED_FIELDS = ('temperature', 'airTemperature', 'airPressure', 'windU', 'windV', 'typeCode')
+
+# Header block: the sequence counter is odd while the publisher writes, so a
+# reader seeing the same even value before and after reading got a whole tick
+SHARED_FIELD_NAME_LENGTH = 32
+HEADER_DTYPE = np.dtype([('version', '<i8'), ('sequence', '<u8'), ('tick', '<i8'), ('shape', '<i8', (2,)),
+                         ('fieldCount', '<i8'),
+                         ('fields', f'S{SHARED_FIELD_NAME_LENGTH}', (len(SHARED_FIELDS),)),
+                         ('dtypes', 'S8', (len(SHARED_FIELDS),))])
+
+# Reader retries while the publisher is mid-write
+READ_RETRIES = 100
+READ_RETRY_DELAY = 0.001    # s
+
+#####################
+# CLASSES/FUNCTIONS #
+#####################
+
+def attach_block(name):
+    """Attach to an existing shared memory block without adopting it: by
+       default Python's resource tracker unlinks every block a process
+       attached to when that process exits, which would remove the
+       publisher's blocks when a reader (e.g. a notebook) closes."""
+    block = shared_memory.SharedMemory(name)
+    resource_tracker.unregister(block._name, "shared_memory")
+    return block
+
+
+def unlink_state(prefix=SHARED_STATE_PREFIX, fields=SHARED_FIELDS):
+    """Remove the shared memory blocks of a publisher that did not close
+       (e.g. a crashed game). Returns the names of the blocks removed."""
+    removed = []
+    for name in ('header',) + tuple(fields):
+        try:
+            block = shared_memory.SharedMemory(f"{prefix}_{name}")
+        except FileNotFoundError:
+            continue
+        block.close()
+        block.unlink()
+        removed.append(block.name)
+    return removed
+
+
+class StatePublisher:
+    """Mirrors the core map arrays into named shared memory blocks once per
+       tick, so other processes (Jupyter, plotting scripts) can watch the
+       simulation live with StateReader instead of exchanging files.
+       The blocks exist until close() is called."""
+
+    def __init__(self, mapData, prefix=SHARED_STATE_PREFIX, fields=SHARED_FIELDS):
+        self.mapData = mapData
+        self.prefix = prefix
+        self.fields = fields
+        shape = getattr(mapData, fields[0]).shape
+
+        # One block per field, each viewed as an array of the map's shape and dtype,
+        # and the header (readers find the fields, shape and dtypes there)
+        self.blocks = {}
+        self.arrays = {}
+        try:
+            for name in fields:
+                source = getattr(mapData, name)
+                block = self.create_block(f"{prefix}_{name}", max(source.nbytes, 1))
+                self.blocks[name] = block
+                self.arrays[name] = np.ndarray(shape, source.dtype, buffer=block.buf)
+                self.arrays[name][...] = source
+            headerBlock = self.create_block(f"{prefix}_header", HEADER_DTYPE.itemsize)
+        except FileExistsError:
+            self.close()
+            raise
+        self.blocks['header'] = headerBlock
+        self.header = np.ndarray((), HEADER_DTYPE, buffer=headerBlock.buf)
+        self.header['version'] = SHARED_STATE_VERSION
+        self.header['sequence'] = 0
+        self.header['tick'] = 0
+        self.header['shape'] = shape
+        self.header['fieldCount'] = len(fields)
+        self.header['fields'][:len(fields)] = [name.encode() for name in fields]
+        self.header['dtypes'][:len(fields)] = [self.arrays[name].dtype.str.encode() for name in fields]
+        log(f"Publishing map state to shared memory ({prefix}_*)")
+
+    @staticmethod
+    def create_block(name, size):
+        """Create a shared memory block. Fails (FileExistsError) if the block
+           exists, rather than taking it away from another publisher and its
+           readers; blocks left behind by a game that crashed are removed
+           with unlink_state."""
+        try:
+            return shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            raise FileExistsError(f"Shared memory block {name} already exists (published by another game, or left "
+                                  f"behind by one that crashed: remove it with shared_state.unlink_state)") from None
+
+    def publish(self, tick):
+        """Copy the current map arrays into shared memory (sequence odd while copying)."""
+        self.header['sequence'] += 1
+        for name in self.fields:
+            self.arrays[name][...] = getattr(self.mapData, name)
+        self.header['tick'] = tick
+        self.header['sequence'] += 1
+
+    def close(self):
+        """Remove the shared memory blocks (readers keep what they attached to until they close)."""
+        self.arrays.clear()
+        self.header = None
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks.clear()
+
+
+class StateReader:
+    """Attaches to the blocks of a StatePublisher (possibly in another
+       process). fields holds zero-copy NumPy views of the shared arrays,
+       which change as the game ticks; use sequence() around reading them
+       (or snapshot() for copies) to detect ticks written meanwhile.
+
+           reader = StateReader()
+           tick, state = reader.snapshot()
+           plt.imshow(state['temperature'].T)
+    """
+
+    def __init__(self, prefix=SHARED_STATE_PREFIX):
+        self.blocks = {'header': attach_block(f"{prefix}_header")}
+        self.header = np.ndarray((), HEADER_DTYPE, buffer=self.blocks['header'].buf)
+        if self.header['version'] != SHARED_STATE_VERSION:
+            raise ValueError(f"Shared state version {self.header['version']} (expected {SHARED_STATE_VERSION})")
+        shape = tuple(self.header['shape'])
+        fieldCount = int(self.header['fieldCount'])
+        self.fields = {}
+        for name, dtype in zip(self.header['fields'][:fieldCount], self.header['dtypes'][:fieldCount]):
+            name = name.decode()
+            self.blocks[name] = attach_block(f"{prefix}_{name}")
+            self.fields[name] = np.ndarray(shape, np.dtype(dtype.decode()), buffer=self.blocks[name].buf)
+            self.fields[name].flags.writeable = False
+
+    def sequence(self):
+        """Current sequence counter (odd while the publisher is writing)."""
+        return int(self.header['sequence'])
+
+    def tick(self):
+        """Tick (simulated hours) of the last published state."""
+        return int(self.header['tick'])
+
+    def snapshot(self, retries=READ_RETRIES):
+        """Copies of all fields from one tick, as (tick, {field: array}).
+           Retries while the publisher writes; raises RuntimeError if no
+           whole tick could be read."""
+        for attempt in range(retries):
+            sequence = self.sequence()
+            if sequence % 2 == 0:
+                tick = self.tick()
+                state = {name: array.copy() for name, array in self.fields.items()}
+                if self.sequence() == sequence:
+                    return tick, state
+            time.sleep(READ_RETRY_DELAY)
+        raise RuntimeError(f"No consistent shared state after {retries} attempts")
+
+    def close(self):
+        """Detach from the shared memory blocks (drop any views taken from fields first)."""
+        self.fields.clear()
+        self.header = None
+        for block in self.blocks.values():
+            block.close()
+        self.blocks.clear()
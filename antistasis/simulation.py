@@ -1,10 +1,19 @@
 # Standard libraries
+import os
 import math
 import random
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Third-party libraries
+import numpy as np #2.1.1
 
 # Local imports
 from graphics import *
 from ui import *
+from physics import *
+from kernels import *
+from equilibrium import *
 
 #############
 # CONSTANTS #
@@ -13,111 +22,499 @@ from ui import *
 # Simulation/controls
 GREENHOUSE_EFFECT_INCREMENT = 0.05
 
-TIME_STEP = 1 # hrs
+TIME_STEP = 1 # hrs per tick (must divide a 24 hr day evenly)
 
-BASE_SUN_HEAT_FLUX = 1.2028 * 10**10    # BTU/hr per square mile from sun before albedo and latitude calcs
+ENERGY_BUDGET_HISTORY = 24 * 365 # ticks of energy budget kept (a year of hourly ticks)
 
-HEAT_RATIO_AIR = 0.23           # default/initial percent of sun's radiation absorbed by atmosphere
+# Generated worlds are cached on disk per (seed, size); bump the version when
+# world generation or the map arrays change so old cache files are not used
+WORLD_CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "antistasis")
+WORLD_CACHE_VERSION = 2
 
-RADIATION_RATIO_AIR_TO_SURFACE = 0.5
+# Seasons (day 0 is the March equinox)
+DAYS_PER_YEAR = 365
+AXIAL_TILT = 23.44              # degrees, largest solar declination
 
-SURFACE_RADIATION_ABSORPTION_AIR = 0.8
+# Sun data cache sizes (least recently used entries are dropped)
+SUNLIGHT_CACHE_SIZE = 24 * 7    # cosine of solar zenith tables (a week of hourly tables)
+SUN_OVERLAY_CACHE_SIZE = 24     # sun overlay surfaces (a day of hourly overlays, full map size)
 
-REFLECTION_RATIO_SURFACE_TO_AIR = 0.2
+# Tile types, stored per tile as an index into this tuple (-1 = not yet classified)
+TILE_TYPES = ('stone', 'water', 'snow', 'sea_ice')
+TILE_TYPE_CODES = {tileType: code for code, tileType in enumerate(TILE_TYPES)}
 
-STEFAN_BOLTZMANN_CONSTANT = 0.1714      # BTU/(hr*ft^2*°R^4)
+# Type code of a tile by [land, frozen]
+TYPE_CODE_BY_SURFACE = np.array([[TILE_TYPE_CODES['water'], TILE_TYPE_CODES['sea_ice']],
+                                 [TILE_TYPE_CODES['stone'], TILE_TYPE_CODES['snow']]], np.int8)
 
-RADIATION_CONTROL_FACTOR = (0.9E-9) # how much radiative heat loss is scaled by... higher = more heat loss per tick
+# Margin (degrees F) past the freezing thresholds before a tile changes type
+TYPE_HYSTERESIS = 0.5
 
-NATURAL_CONVECTION_COEFFICIENT = 0.5 # chatgpt says horizontal surfaces should be in 0.5-1 BTU/(ft^2 °F)
+# Equilibrium solves per spin-up, reclassifying tile types between them
+SPIN_UP_MAX_PASSES = 10
 
-TEMPERATURE_SMOOTH_FACTOR = 0.003 # how much closer to average air temperature of their surroundings tiles get each smoothing iteration
+# Frozen tile types (counted as ice cover)
+ICE_TYPE_CODES = (TILE_TYPE_CODES['snow'], TILE_TYPE_CODES['sea_ice'])
 
-# Material property dictionaries... maybe move to a per-material dictionary of propreties?
-HEAT_CAPACITY = {
-'stone':    0.23885,                    # BTU/lb F
-'water':    1.001,                      # BTU/lb F
-'ice':      0.5,                        # BTU/lb F
-'air':      0.17128                     # BTU/lb F
-}
+# Zonal (per map row, i.e. latitude) statistics kept each tick
+ZONAL_FIELDS = ('temperature', 'airTemperature', 'iceFraction')
+ZONAL_STATS = ('mean', 'min', 'max')
+ZONAL_HISTORY_LENGTH = 24 * 30  # ticks kept (30 days of hourly ticks)
 
-DENSITY = {
-'stone':    175,                        # lb / ft^3
-'water':    62.4,                       # lb / ft^3
-'ice':      57.24644,                   # lb / ft^3
-'air':      0.075                       # lb / ft^3
-}
+# Per-tile climatology: statistics of map fields over consecutive windows
+CLIMATOLOGY_FIELDS = ('temperature', 'airTemperature')
+CLIMATOLOGY_STATS = ('mean', 'variance', 'min', 'max')
+CLIMATOLOGY_WINDOWS = {'daily': 24, 'yearly': 24 * 365} # hrs per window
 
-ALBEDO = {
-'stone':    0.35,
-'water':    0.075,
-'ice':      0.75,
-'air':      0.3
+# Display modes drawn from climatology: window, field, statistic, contour range
+CLIMATOLOGY_DISPLAY_MODES = {
+'Mean Air Temperature':     ('yearly', 'airTemperature', 'mean', (-50, 120)),
+'Diurnal Range':            ('daily', 'airTemperature', 'range', (0, 40)),
 }
 
-CALC_DEPTH = {
-'stone':    1,                         # ft 
-'water':    300,                       # ft
-'ice':      5,                         # ft
-'air':      2500                          # ft
+# Contour display modes of map fields: field, contour range (None = sea level)
+# and factor from field units to the units shown on the contour bar
+CONTOUR_DISPLAY_MODES = {
+'Elevation':                ('elevation', (-9000, 15000), 1.0),
+'Elevation, Land-Only':     ('elevation', (None, 15000), 1.0),
+'Surface Temperature':      ('temperature', (-50, 120), 1.0),
+'Air Temperature':          ('airTemperature', (-50, 120), 1.0),
+'Air Pressure':             ('airPressure', (5, 15), 1.0),
+'Air Density':              ('airDensity', (0.04, 0.08), 1.0),
+'Wind Speed':               ('windSpeedMagnitude', (0, 176), 0.681818), # ft/s, shown in mph
 }
 
-EMISSIVITY = {
-'surface':  0.9,
-'air':      0.7
+# Snow/sea ice inherits ice material properties
+TILE_MATERIALS = {
+'stone':    'stone',
+'water':    'water',
+'snow':     'ice',
+'sea_ice':  'ice'
 }
 
+# Material properties looked up by tile type code
+# "Calc Depth" is used to calculate finite temp change - simplifying each tile to single point
+# with a "mass" determined by the volume and density, volume calculated from 1 mile * 1 mile * calc depth
+TYPE_ALBEDO = np.array([ALBEDO[TILE_MATERIALS[t]] for t in TILE_TYPES])
+TYPE_HEAT_MASS = np.array([DENSITY[TILE_MATERIALS[t]] * CALC_DEPTH[TILE_MATERIALS[t]] * TILE_AREA * HEAT_CAPACITY[TILE_MATERIALS[t]] for t in TILE_TYPES]) # BTU/F
+TYPE_ROUGHNESS = np.array([ROUGHNESS.get(t, 1.0) for t in TILE_TYPES])
+
+# Standard atmosphere at sea level (air at other elevations scaled by lapse-rate factors)
+SEA_LEVEL_AIR_TEMPERATURE = 59.0    # degrees F
+SEA_LEVEL_AIR_PRESSURE = 14.696     # psi
+SEA_LEVEL_AIR_DENSITY = SEA_LEVEL_AIR_PRESSURE * PSI_TO_PSF / (AIR_GAS_CONSTANT * (SEA_LEVEL_AIR_TEMPERATURE - ABSOLUTE_ZERO)) # lb/ft^3
+
 # Graphics
 TILE_GRAPHIC_SIZE = 64 # px
 
+# Graphic of each tile, stored per tile as an index into this tuple
+TILE_GRAPHICS = ('blank', 'water', 'snow', 'sea_ice') + tuple(f"stone{level}" for level in range(10)) \
+              + tuple(f"band{band}" for band in range(11))
+TILE_GRAPHIC_CODES = {graphic: code for code, graphic in enumerate(TILE_GRAPHICS)}
+
+# Tiles are drawn as graphics only when large on screen; zoomed out, each tile is
+# one pixel in the average color of its graphic, scaled up to the display
+SPRITE_MIN_TILE_PIXELS = 16     # px per tile on screen
+MAX_SPRITE_MAP_PIXELS = 4096    # px per side of the full-size map surface (larger worlds always use pixels)
+SUN_ICON_MIN_PIXELS = 24        # px, smallest size of the sun icon on screen
+SMOOTH_SCALE_DELAY = 150        # ms without zoom input before the zoomed map is smooth-scaled (nearest-neighbour preview until then)
+
 #####################
 # CLASSES/FUNCTIONS #
 #####################
 
+def classify_tiles(elevation, temperature, seaLevel, typeCode, hysteresis=TYPE_HYSTERESIS):
+    """Tile type code of each tile from its elevation and surface temperature:
+       land below 32 F is snow, otherwise stone; sea at or below 28 F is sea
+       ice, otherwise water. Frozen tiles only thaw once hysteresis (F) above
+       the threshold and thawed tiles only freeze once hysteresis below it,
+       so tiles near freezing do not flip back and forth every tick (tiles
+       that are new or changed between land and sea use the plain threshold).
+       Written into typeCode; arrays and sea level only need to broadcast
+       against each other. Returns flat indices of the tiles whose type changed."""
+    land = elevation >= seaLevel
+    wasFrozen = (typeCode == TILE_TYPE_CODES['snow']) | (typeCode == TILE_TYPE_CODES['sea_ice'])
+    wasLand = (typeCode == TILE_TYPE_CODES['stone']) | (typeCode == TILE_TYPE_CODES['snow'])
+    known = (typeCode >= 0) & (wasLand == land)
+    threshold = np.where(land, 32.0, 28.0) + np.where(known, np.where(wasFrozen, hysteresis, -hysteresis), 0.0)
+    frozen = np.where(land, temperature < threshold, temperature <= threshold)
+    newTypeCode = TYPE_CODE_BY_SURFACE[land.astype(np.int8), frozen.astype(np.int8)]
+    changedTiles = np.flatnonzero(newTypeCode != typeCode)
+    typeCode.flat[changedTiles] = newTypeCode.flat[changedTiles]
+    return changedTiles
+
+
+def elevation_factors(elevation, seaLevel):
+    """Lapse-rate factors of the air just above each tile (incl. ocean surface):
+       temperature, pressure and density relative to sea level, for air at the
+       tile's elevation, or at sea level over tiles below it. Temperature and
+       pressure are second-order curve fits to the first three data points of
+       the standard atmosphere
+       (https://www.engineeringtoolbox.com/standard-atmosphere-d_604.html);
+       density follows from them by the ideal gas law, so air at standard
+       temperature has the same pressure reduced to sea level everywhere.
+       Arrays and sea level only need to broadcast against each other."""
+    airElevation = np.where(elevation < seaLevel, 0.0, elevation)
+    tempFactor = 1.0000 - (6 * 10**(-5) * airElevation) + (5 * 10**(-12) * airElevation**2)
+    presFactor = 1.0004 - (4 * 10**(-5) * airElevation) + (5 * 10**(-10) * airElevation**2)
+    densFactor = presFactor * (SEA_LEVEL_AIR_TEMPERATURE - ABSOLUTE_ZERO) / (SEA_LEVEL_AIR_TEMPERATURE * tempFactor - ABSOLUTE_ZERO)
+    return tempFactor, presFactor, densFactor
+
+
+def zonal_statistics(temperature, airTemperature, typeCode, out=None):
+    """Mean, min and max of surface temperature, air temperature and ice cover
+       (1 for snow/sea ice tiles, else 0) along each map row (same latitude),
+       as an array indexed [ZONAL_FIELDS, ZONAL_STATS, row]."""
+    if out is None:
+        out = np.empty((len(ZONAL_FIELDS), len(ZONAL_STATS), temperature.shape[1]))
+    ice = (typeCode == ICE_TYPE_CODES[0]) | (typeCode == ICE_TYPE_CODES[1])
+    for field, values in enumerate((temperature, airTemperature, ice)):
+        np.mean(values, axis=0, out=out[field, 0])
+        np.min(values, axis=0, out=out[field, 1])
+        np.max(values, axis=0, out=out[field, 2])
+    return out
+
+
+class ZonalHistory:
+    """Rolling buffer of the zonal statistics of the last ZONAL_HISTORY_LENGTH
+       ticks (see zonal_statistics), preallocated so recording a tick only
+       writes one slot. count keeps rising with every tick recorded, so a
+       display can tell whether it has drawn the latest data."""
+
+    def __init__(self, rows, length=ZONAL_HISTORY_LENGTH):
+        self.data = np.zeros((length, len(ZONAL_FIELDS), len(ZONAL_STATS), rows))
+        self.hours = np.zeros(length)
+        self.count = 0
+
+    def record(self, hours, temperature, airTemperature, typeCode):
+        """Compute and store the zonal statistics of the current map state."""
+        slot = self.count % len(self.data)
+        zonal_statistics(temperature, airTemperature, typeCode, out=self.data[slot])
+        self.hours[slot] = hours
+        self.count += 1
+
+    def latest(self):
+        """Zonal statistics of the last tick recorded, [ZONAL_FIELDS, ZONAL_STATS, row]."""
+        return self.data[(self.count - 1) % len(self.data)]
+
+    def history(self):
+        """(hours, statistics) of the ticks kept, oldest first."""
+        slots = np.arange(max(self.count - len(self.data), 0), self.count) % len(self.data)
+        return self.hours[slots], self.data[slots]
+
+    def mean(self):
+        """Zonal statistics averaged over the ticks kept."""
+        return np.mean(self.history()[1], axis=0)
+
+
+class RunningStatistics:
+    """Per-tile mean, variance, min and max of map fields (CLIMATOLOGY_FIELDS)
+       over consecutive windows of windowTicks ticks. Each tick updates the
+       accumulators in place (Welford's method, so the variance needs no
+       stored history); when a window fills up its statistics are copied
+       to a snapshot and the accumulators restart. Memory is a fixed set of
+       arrays however long the run."""
+
+    def __init__(self, shape, windowTicks, fields=CLIMATOLOGY_FIELDS):
+        self.fields = fields
+        self.windowTicks = windowTicks
+        shape = (len(fields),) + tuple(shape)
+
+        # Accumulators of the current window
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self.sumSquares = np.zeros(shape)   # sum of squared differences from mean
+        self.minimum = np.full(shape, np.inf)
+        self.maximum = np.full(shape, -np.inf)
+        self.values = np.empty(shape)              # scratch arrays
+        self.delta = np.empty(shape)
+
+        # Statistics of the last completed window, [CLIMATOLOGY_STATS, field, x, y]
+        self.windowsCompleted = 0
+        self.snapshot = np.full((len(CLIMATOLOGY_STATS),) + shape, np.nan)
+
+    def record(self, mapData):
+        """Add the current value of every field of each tile to the window."""
+        for field, name in enumerate(self.fields):
+            self.values[field] = getattr(mapData, name)
+        np.minimum(self.minimum, self.values, out=self.minimum)
+        np.maximum(self.maximum, self.values, out=self.maximum)
+
+        # Welford update: mean += d/n and sumSquares += d^2 (n-1)/n, d the difference from the old mean
+        self.count += 1
+        self.values -= self.mean
+        np.divide(self.values, self.count, out=self.delta)
+        self.mean += self.delta
+        self.values *= self.delta
+        self.values *= self.count - 1
+        self.sumSquares += self.values
+        if self.count == self.windowTicks:
+            self.complete_window()
+
+    def complete_window(self):
+        """Snapshot the statistics of the current window and restart it."""
+        self.statistics(out=self.snapshot)
+        self.windowsCompleted += 1
+        self.count = 0
+        self.mean.fill(0)
+        self.sumSquares.fill(0)
+        self.minimum.fill(np.inf)
+        self.maximum.fill(-np.inf)
+
+    def statistics(self, out=None):
+        """Statistics of the current (possibly unfinished) window,
+           [CLIMATOLOGY_STATS, field, x, y] (NaN before the first tick)."""
+        if out is None:
+            out = np.empty_like(self.snapshot)
+        if self.count == 0:
+            out.fill(np.nan)
+            return out
+        out[0] = self.mean
+        np.divide(self.sumSquares, self.count, out=out[1])
+        out[2] = self.minimum
+        out[3] = self.maximum
+        return out
+
+    def value(self, field, statistic):
+        """One statistic ('mean', 'variance', 'std', 'min', 'max' or 'range')
+           of a field for each tile: from the last completed window, or
+           from the current one until a window has completed."""
+        statistics = self.snapshot if self.windowsCompleted else self.statistics()
+        fieldStatistics = statistics[:, self.fields.index(field)]
+        if statistic == 'range':
+            return fieldStatistics[3] - fieldStatistics[2]
+        if statistic == 'std':
+            return np.sqrt(fieldStatistics[1])
+        return fieldStatistics[CLIMATOLOGY_STATS.index(statistic)]
+
+
+def map_climatology(shape, timeStep):
+    """Running statistics of every climatology window (CLIMATOLOGY_WINDOWS)
+       for a map of given shape ticking timeStep hours at a time. Record each
+       tick into every window (see GameMap.update_climatology)."""
+    return {window: RunningStatistics(shape, int(hours / timeStep)) for window, hours in CLIMATOLOGY_WINDOWS.items()}
+
+
+def sun_hour_angles(timeStep):
+    """Hour angles (degrees) the sun data is stored at: hourly, or finer if a
+       tick is shorter than an hour (longer ticks average the hourly data)."""
+    sunDataResolution = 360 / 24 * min(timeStep, 1)
+    return [hour * sunDataResolution for hour in range(int(round(360 / sunDataResolution)))]
+
+
+def solar_declination(dayOfYear):
+    """Latitude (degrees) of the point the sun is overhead on a day of the year
+       (day 0 is the March equinox, northern summer peaks a quarter year later)."""
+    return AXIAL_TILT * math.sin(2 * math.pi * dayOfYear / DAYS_PER_YEAR)
+
+
+def cosine_solar_zenith(tileCount, hourAngleCenter, sunLatitude):
+    """Cosine of the solar zenith angle of each tile of a tileCount x tileCount
+       map with the sun centered at the given hour angle (x) and latitude
+       (solar declination, y). Negative on the night side. Trig is evaluated
+       per row and column only; each tile is a product of the two."""
+
+    # Latitude of each row (90 at the top row, 0 at the middle, -90 at the bottom row)
+    j = np.arange(tileCount)[np.newaxis, :]
+    latitudeAngleRadians = np.radians(90 - ((180/(tileCount-1))*j))
+
+    solarDeclinationAngleRadians = math.radians(sunLatitude)
+
+    # Hour angle of each column, relative to the sun (looping around the map)
+    halfTileCount = float(tileCount) / 2.0
+    sunPositionX = float(tileCount) * (hourAngleCenter / 360.0)
+    i = np.arange(tileCount)[:, np.newaxis]
+    deltaPositionX = (i - sunPositionX + tileCount) % tileCount
+    deltaPositionX = np.where(deltaPositionX > halfTileCount, deltaPositionX - tileCount, deltaPositionX)
+    hourAngleRadians = np.radians((360 / tileCount) * deltaPositionX)
+
+    # Solar Zenith Angle -- cos(Z) = sin(phi) * sin(delta) + cos(phi) * cos(delta) * cos(h)
+    return np.sin(latitudeAngleRadians) * math.sin(solarDeclinationAngleRadians) + \
+           np.cos(latitudeAngleRadians) * math.cos(solarDeclinationAngleRadians) * np.cos(hourAngleRadians)
+
+
+def display_values(mapData, displayMode, seaLevel=0, climatology=None):
+    """Values of every tile shown by a display mode and the contour range
+       they are banded over, as (values, valueMin, valueMax) in field units.
+       "Surface" gives tile type codes (see TILE_TYPES); climatology modes
+       need the map's climatology (see map_climatology). Raises ValueError
+       for unknown modes, or climatology modes without a climatology."""
+    if displayMode in CONTOUR_DISPLAY_MODES:
+        field, (valueMin, valueMax) = CONTOUR_DISPLAY_MODES[displayMode][:2]
+        return getattr(mapData, field), seaLevel if valueMin is None else valueMin, valueMax
+    if displayMode in CLIMATOLOGY_DISPLAY_MODES:
+        window, field, statistic, (valueMin, valueMax) = CLIMATOLOGY_DISPLAY_MODES[displayMode]
+        if climatology is None:
+            raise ValueError(f"{displayMode} needs a climatology (none is recorded for this map)")
+        return climatology[window].value(field, statistic), valueMin, valueMax
+    if displayMode == "Surface":
+        return mapData.typeCode, 0, len(TILE_TYPES) - 1
+    raise ValueError(f"Unknown display mode: {displayMode}")
+
+
+def contour_graphic_codes(values, valueMin, valueMax):
+    """Graphic code (see TILE_GRAPHICS) of each value's band of an 11-band
+       contour from valueMax (band0 and above) to valueMin (band10 and below);
+       NaN values are blank."""
+    bandIncr = (valueMax - valueMin) / 9.0
+    with np.errstate(invalid='ignore'):
+        bands = np.clip(np.ceil((valueMax - values) / bandIncr), 0, 10)
+    return np.where(np.isnan(bands), TILE_GRAPHIC_CODES["blank"], TILE_GRAPHIC_CODES["band0"] + np.nan_to_num(bands).astype(int))
+
+
+def surface_graphic_codes(typeCode, elevation):
+    """Graphic code of every tile in Surface display mode, as
+       GameMap.surface_graphic: follows tile type, stone shaded by elevation
+       (one shade per 1000 ft above 1000 ft, up to stone9)."""
+    stoneCodes = TILE_GRAPHIC_CODES["stone0"] + np.clip(np.ceil(elevation / 1000) - 1, 0, 9).astype(int)
+    typeGraphicCodes = np.array([TILE_GRAPHIC_CODES[tileType] if tileType in TILE_GRAPHIC_CODES else -1 for tileType in TILE_TYPES])
+    return np.where(typeCode == TILE_TYPE_CODES['stone'], stoneCodes, typeGraphicCodes[typeCode])
+
+
+def tile_colors(graphics):
+    """Average color of each tile graphic (RGB, indexed by graphic code), for
+       drawing a tile as one pixel."""
+    return np.array([pygame.transform.average_color(graphics.data[graphic])[:3] for graphic in TILE_GRAPHICS], np.uint8)
+
+
+def world_cache_path(seed, mapSize):
+    """File a generated world of given seed and size is cached in."""
+    return os.path.join(WORLD_CACHE_DIRECTORY, f"world_{mapSize}x{mapSize}_seed{seed}_v{WORLD_CACHE_VERSION}.npz")
+
+
+def world_arrays(mapData):
+    """Map arrays of a world, by field name (what the world cache stores)."""
+    return {name: value for name, value in vars(mapData).items() if isinstance(value, np.ndarray)}
+
+
+class LRUCache:
+    """Mapping of at most maxSize entries that drops the least recently used
+       entry when full, for data that is cheaper to keep than to recompute
+       but too large to keep for every key (e.g. sun data per day and hour)."""
+
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        """Value stored for key, or compute() (then stored) if not cached."""
+        if key in self.data:
+            self.data.move_to_end(key)
+            self.hits += 1
+            return self.data[key]
+        self.misses += 1
+        value = compute()
+        self.data[key] = value
+        if len(self.data) > self.maxSize:
+            self.data.popitem(last=False)
+        return value
+
+
+class ElevationIndex:
+    """Tiles sorted by elevation, built once per world. Land is elevation at or
+       above sea level, so the tiles a sea level change floods or drains are one
+       contiguous run of the sorted elevations, found by binary search instead
+       of comparing every tile against the new level."""
+
+    def __init__(self, elevation):
+        self.order = np.argsort(elevation, axis=None, kind='stable')
+        self.sortedElevation = elevation.ravel()[self.order]
+
+    def crossing(self, seaLevel, newSeaLevel):
+        """Flat indices of tiles that change between land and sea when sea level
+           moves from seaLevel to newSeaLevel (elevation in [lower, higher))."""
+        start, end = np.searchsorted(self.sortedElevation, sorted((seaLevel, newSeaLevel)))
+        return self.order[start:end]
+
+
+class TileField:
+    """Exposes one element of a Map_Data array as a Tile attribute,
+       so per-tile code can keep using tile.temperature etc. while
+       the simulation kernels work on the whole array at once."""
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, tile, owner=None):
+        if tile is None:
+            return self
+        return getattr(tile.mapData, self.name)[tile.x, tile.y]
+
+    def __set__(self, tile, value):
+        getattr(tile.mapData, self.name)[tile.x, tile.y] = value
+
+
 class Tile:
     """Class which stores the data within one "tile", or
        a 1X1 mile square that has properties like surface
        temperature, elevation, and air temperature.
-       Initializes to room temperature/sea level values."""
-
-    def __init__(self, x, y):
+       Physical values live in the map arrays (see GameMap.Map_Data),
+       which initialize to room temperature/sea level values."""
+
+    # Surface values
+    elevation = TileField()             # ft
+    temperature = TileField()           # degrees F
+
+    # Air values
+    airTemperature = TileField()        # degrees F
+    lastAirTemperature = TileField()    # degrees F
+    airPressure = TileField()           # psi
+    airDensity = TileField()            # lb/ft^3
+
+    # Calculation values
+    airTempElevFactor = TileField()
+    airPresElevFactor = TileField()
+    airDensElevFactor = TileField()
+    heatFromAir = TileField()
+
+    # Wind values
+    windU = TileField()                 # ft/s toward +x
+    windV = TileField()                 # ft/s toward -y ("up")
+    windSpeedMagnitude = TileField()    # ft/s
+
+    # Sun values
+    sunIntensity = TileField()
+
+    def __init__(self, x, y, mapData):
         
         # Location
         self.x = x
         self.y = y
+        self.mapData = mapData
         
-        # Surface values
-        self.elevation = 0              # ft
-        self.temperature = 70           # degrees F
-        
-        # Air values
-        self.airTemperature = 70        # degrees F
-        self.lastAirTemperature = 70    # degrees F
-        self.airPressure = 14.7         # psi
-        self.airDensity = 0.0765        # lb/ft^3
-        
-        # Calculation values
-        self.airTempElevFactor = 1
-        self.airPresElevFactor = 1
-        self.airDensElevFactor = 1
-        self.heatFromAir = 0
-        
-        # Wind values
-        self.windSpeedMagnitude = 5     # mph
-        self.windSpeedAngle = 0
-        
-        # Sun values
-        self.sunIntensity = 0
-        self.sunlightData = {}
-        
-        # Display values
+        # Display values (graphic is kept in the map arrays, see TILE_GRAPHICS)
         self.graphic = "blank"
         self.graphicOverlay = []
-        self.type = None
         
         # Stores Tile objects of neighboring tiles
         self.neighbors = []
 
+    @property
+    def windSpeedAngle(self):
+        """Wind direction in degrees clockwise from up (0 = toward -y)."""
+        return math.degrees(math.atan2(self.windU, self.windV)) % 360
+
+    @property
+    def graphic(self):
+        """Name of the graphic the tile is drawn with (e.g. 'stone3')."""
+        return TILE_GRAPHICS[self.mapData.graphicCode[self.x, self.y]]
+
+    @graphic.setter
+    def graphic(self, graphic):
+        self.mapData.graphicCode[self.x, self.y] = TILE_GRAPHIC_CODES[graphic]
+
+    @property
+    def type(self):
+        """Tile type name (e.g. 'snow'), or None before first classification."""
+        typeCode = self.mapData.typeCode[self.x, self.y]
+        return TILE_TYPES[typeCode] if typeCode >= 0 else None
+
+    @type.setter
+    def type(self, tileType):
+        self.mapData.typeCode[self.x, self.y] = TILE_TYPE_CODES[tileType]
+
 # Holds subclasses representing tile data as well as map dimensions, controls, etc.
 class GameMap:
     """Stores all tile data."""
@@ -135,15 +532,52 @@ class GameMap:
 
 
     class Map_Data:
-        """Class used to store data for each tile,
-           as a list of Tile objects."""
+        """Class used to store data for each tile. Physical values are
+           arrays indexed [x, y] so they can be updated all at once;
+           the list of Tile objects gives per-tile access to them."""
         def __init__(self, mapSize):
+            shape = (mapSize, mapSize)
+
+            # Surface values
+            self.elevation = np.zeros(shape)                # ft
+            self.temperature = np.full(shape, 70.0)         # degrees F
+            self.typeCode = np.full(shape, -1, np.int8)     # index into TILE_TYPES
+
+            # Air values
+            self.airTemperature = np.full(shape, 70.0)      # degrees F
+            self.lastAirTemperature = np.full(shape, 70.0)  # degrees F
+            self.airPressure = np.full(shape, 14.7)         # psi
+            self.airDensity = np.full(shape, SEA_LEVEL_AIR_DENSITY) # lb/ft^3
+
+            # Calculation values
+            self.airTempElevFactor = np.ones(shape)
+            self.airPresElevFactor = np.ones(shape)
+            self.airDensElevFactor = np.ones(shape)
+            self.heatFromAir = np.zeros(shape)
+
+            # Wind values (components, with speed derived from them)
+            self.windU = np.zeros(shape)                    # ft/s toward +x
+            self.windV = np.full(shape, 5.0)                # ft/s toward -y ("up")
+            self.windSpeedMagnitude = np.full(shape, 5.0)   # ft/s
+
+            # Sun values
+            self.sunIntensity = np.zeros(shape)
+
+            # Display values
+            self.graphicCode = np.zeros(shape, np.int16)    # index into TILE_GRAPHICS
+
+            # Material properties of surface (set from tile type)
+            self.surfaceAlbedo = np.zeros(shape)
+            self.surfaceHeatMass = np.ones(shape)           # BTU/F
+            self.surfaceRoughness = np.ones(shape)
+            self.surfaceSnow = np.zeros(shape, bool)
+
             # Generate map tile values
             self.tiles = []
             for i in range(mapSize):
                 row = []
                 for j in range(mapSize):
-                    tile = Tile(i, j)
+                    tile = Tile(i, j, self)
                     row.append(tile)
                 self.tiles.append(row)
     
@@ -152,14 +586,24 @@ class GameMap:
     # MAIN MAP CLASS FUNCTIONS AND CLASSES #
     ########################################
 
-    def __init__(self, gameWindow, graphics, mapSize, antialiasing=True):
+    def __init__(self, gameWindow, graphics, mapSize, antialiasing=True, kernelBackend=KERNEL_BACKEND, seed=None, progress=None):
         
+        # Setup progress (stage description, fraction done) is passed to progress, if given
+        self.progress = progress if progress is not None else lambda stage, fraction: None
+
         # Initialize display values (not changing)
         self.tileCount = mapSize
         self.mapAreaTiles = self.tileCount ** 2
         self.gameWindow = gameWindow
         self.graphics = graphics
         self.antialiasing = antialiasing
+
+        # Average color of each tile graphic, for drawing a tile as one pixel (see update_pixel_map)
+        self.tileColors = tile_colors(graphics)
+        self.mapSurface = None
+        self.sunLayerSurface = None
+        self.spriteRendering = True
+        self.redrawNeeded = True # set whenever view state or a displayed surface changed (cleared by the game loop)
         
         # Map display controls (changeable)
         self.displayMode = "Surface"
@@ -167,12 +611,28 @@ class GameMap:
         self.displaySun = True
 
         # Sun settings
-        self.sunGraphics = {}
+        self.sunlightCache = LRUCache(SUNLIGHT_CACHE_SIZE) # (day, hour angle[, hours]) -> cosine of solar zenith angle of each tile
+        self.sunOverlayCache = LRUCache(SUN_OVERLAY_CACHE_SIZE) # (day, hour angle) -> sun overlay surface
         self.sunHourAngle = 0 # 0 to 360 degrees (0 is x=0)
-        self.sunLatitude = 0 # 0 to 360 degrees (0 is half of map height)
+        self.dayOfYear = 0 # 0 to DAYS_PER_YEAR - 1 (sets solar declination, see solar_declination)
         
         self.greenhouse = 0.0
 
+        # Energy budget of the last tick (BTU per term of kernels.BUDGET_TERMS) and of recent ticks
+        self.energyBudget = np.zeros(len(BUDGET_TERMS))
+        self.energyBudgetHistory = deque(maxlen=ENERGY_BUDGET_HISTORY)
+
+        # Zonal (per latitude) statistics of recent ticks
+        self.zonalHistory = ZonalHistory(self.tileCount)
+
+        # Simulated hours per tick
+        self.timeStep = TIME_STEP
+        if (24 / self.timeStep) % 1 != 0:
+            raise ValueError(f"Time step of {self.timeStep} hrs does not divide a 24 hr day evenly")
+
+        # Per-tile statistics over daily and yearly windows (see RunningStatistics)
+        self.climatology = map_climatology((self.tileCount, self.tileCount), self.timeStep)
+
         # Tie to contour class so it can extract min/max data
         self.contourEnabled = False
         self.contourMin = 0
@@ -183,6 +643,11 @@ class GameMap:
         self.zoomIncrement = int(0.1 * gameWindow.y)
         self.panLimitPaddingX = int(0.05 * gameWindow.y)
         self.panLimitPaddingY = int(0.05 * gameWindow.y)
+        self.smoothScalePending = False
+        self.lastZoomTime = 0
+
+        # Smooth scaling of the map runs on a worker thread (see scale_map and finish_scaling)
+        self.mapScaler = BackgroundScaler(ThreadPoolExecutor(max_workers=1, thread_name_prefix="map-scaling"))
 
         # Actual size = tile size in px * number of tiles
         mapSideLengthPixels = TILE_GRAPHIC_SIZE * self.tileCount
@@ -198,18 +663,28 @@ class GameMap:
 
         # Generate map tile values (initially empty/blank, then algorithm run)
         self.seaLevel = 0
+        self.elevationFactorSeaLevel = None
         self.mapData = self.Map_Data(self.tileCount)
-        self.rand_gen()
+        self.topology = map_topology(self.mapData.temperature.shape)
+        self.progress("Loading kernels", 0.0)
+        self.kernels = load_kernels(self.mapData.temperature.shape, kernelBackend)
+        self.progress("Generating world", 0.1)
+        self.generate_world(seed)
+        self.elevationIndex = ElevationIndex(self.mapData.elevation)
+        self.update_tile_types()
+        self.progress("Drawing map", 0.7)
         self.reset_tiles()
-        self.calc_sun()
+        self.progress("Drawing sun", 0.9)
         self.reset_suntiles()
 
         # Collect neighboring tile objects for each tile
         self.collect_neighbors()
+        self.progress("Ready", 1.0)
 
         # Print information to stdout
         log("Map Size: " + str(self.tileCount) + " x " + str(self.tileCount) + " tiles (" + str(self.mapLengthsPixels.x) + " x " + str(self.mapLengthsPixels.y) + " px)")
         log("Map Area: " + str(self.mapAreaTiles) + " tiles (" + str(self.mapAreaPixels) + " px)")
+        log("Kernel Backend: " + self.kernels.name)
 
     
     def increase_greenhouse_effect(self, increment=GREENHOUSE_EFFECT_INCREMENT):
@@ -222,41 +697,51 @@ class GameMap:
         self.greenhouse -= increment
     
     
-    def collect_neighbors(self):      
+    def collect_neighbors(self):
         """Find all Tile objects that are surrounding each Tile object and
-           store their references in a list as a property of that tile"""
-        directions = [-1, 0, 1]
-        neighborIndices = [(x, y) for x in directions for y in directions]
+           store their references in a list as a property of that tile
+           (the eight neighbors from the map topology, not the tile itself)"""
         for i in range(self.tileCount):
             for j in range(self.tileCount):
                 tile = self.mapData.tiles[i][j]
-                for neighborIndex in neighborIndices:
-                    neighborX = i + neighborIndex[0]
-                    if neighborX > self.tileCount-1: 
-                        neighborX = 0
-                    elif neighborX < 0:
-                        neighborX = self.tileCount-1
-                    neighborY = j + neighborIndex[1]   
-                    if neighborY > self.tileCount-1: 
-                        neighborY = 0
-                    elif neighborY < 0:
-                        neighborY = self.tileCount-1  
-                    neighborTile = self.mapData.tiles[neighborX][neighborY]
-                    tile.neighbors.append(neighborTile)
-    
-    
-    def zoom(self, input):
-        """Scales map surface to zoom."""
+                tile.neighbors = [self.mapData.tiles[x][y] for x, y in self.topology.neighbor_positions(i, j)]
+
+
+    def zoom(self, input, relativePosition=(0, 0)):
+        """Scales map surface to zoom (input may be several wheel steps at once),
+           panned by relativePosition in the same rescale.
+           With antialiasing, the map is scaled nearest-neighbour while zooming
+           and smooth-scaled once zooming settles (see finish_zoom)."""
         zoomFactor = int(input * self.zoomIncrement)
         self.displaySize.x += zoomFactor
         self.displaySize.y += zoomFactor
-        self.origin.x -= zoomFactor/2
-        self.origin.y -= zoomFactor/2
+        self.origin.x += relativePosition[0] - zoomFactor/2
+        self.origin.y += relativePosition[1] - zoomFactor/2
         self.check_bounds()
-        self.scale_map()
+        self.scale_map(preview=self.antialiasing is True, contentChanged=False)
         if self.displaySun:
             self.scale_sun_map()
 
+
+    def finish_zoom(self, currentTime):
+        """Smooth-scale the map if zooming stopped SMOOTH_SCALE_DELAY ms ago
+           (currentTime in ms, as pygame.time.get_ticks)."""
+        if self.smoothScalePending and currentTime - self.lastZoomTime >= SMOOTH_SCALE_DELAY:
+            self.scale_map(contentChanged=False)
+
+
+    def finish_scaling(self):
+        """Show the smooth-scaled map once the worker thread finished it."""
+        mapSurfaceScaled = self.mapScaler.poll()
+        if mapSurfaceScaled is not None:
+            self.mapSurfaceScaled = mapSurfaceScaled
+            self.redrawNeeded = True
+
+
+    def scaling_pending(self):
+        """Whether a smooth-scaled map is still to come (deferred or in progress)."""
+        return self.smoothScalePending or self.mapScaler.pending()
+
     
     def drag(self, relativePosition):
         """Apply changed mouse position (click and drag) to map."""
@@ -264,6 +749,12 @@ class GameMap:
         self.origin.y += relativePosition[1]
         self.check_bounds()
 
+        # Zoomed-out views only scale the part of the map on screen, which moved
+        if not self.spriteRendering:
+            self.scale_map()
+            if self.displaySun:
+                self.scale_sun_map()
+
 
     def reset_view(self):
         """Reset display origin and size to recenter view."""
@@ -278,6 +769,7 @@ class GameMap:
         """A function that checks if map is not out of the bounds of the screen.
            Edges of displayed map are locked inside the edges of the screen.
            If zoomed too far in map is scaled up."""
+        self.redrawNeeded = True
     
         # Set to min size if zoomed too far in
         if self.displaySize.x < 100:
@@ -312,6 +804,39 @@ class GameMap:
                 self.origin.y = self.gameWindow.y - self.panLimitPaddingY - self.displaySize.y
 
 
+    def generate_world(self, seed=None):
+        """Generate the world from a seed (see rand_gen), or load it from the
+           world cache if a world of this seed and size was generated before
+           (generation is most of the startup time). Without a seed a new
+           random world is generated and not cached."""
+        if seed is None:
+            self.rand_gen()
+            return
+        path = world_cache_path(seed, self.tileCount)
+        if os.path.exists(path):
+            try:
+                with np.load(path) as world:
+                    mapArrays = world_arrays(self.mapData)
+                    if set(world.files) != set(mapArrays):
+                        raise KeyError(f"fields {sorted(set(world.files) ^ set(mapArrays))} do not match the map")
+                    for name in world.files:
+                        mapArrays[name][...] = world[name]
+                self.elevationFactorSeaLevel = self.seaLevel
+                log(f"World loaded from cache: {path}")
+                return
+            except (OSError, ValueError, KeyError, AttributeError) as error:
+                log(f"Could not load cached world ({error}), generating it again.")
+
+        # Generate and cache (written to a temporary file first, so a partly written cache is never loaded)
+        random.seed(seed)
+        self.rand_gen()
+        os.makedirs(WORLD_CACHE_DIRECTORY, exist_ok=True)
+        temporaryPath = f"{path}.{os.getpid()}.tmp"
+        with open(temporaryPath, "wb") as worldFile:
+            np.savez(worldFile, **world_arrays(self.mapData))
+        os.replace(temporaryPath, path)
+
+
     def rand_gen(self):
         """Random generation of world map."""
     
@@ -356,42 +881,17 @@ class GameMap:
                 tile = self.mapData.tiles[randomX][randomY]
                 tile.elevation = randomZ
                 
-            # Average elevations of tiles
+            # Average elevations of tiles over each 3x3 window (in place, tile by tile)
+            elevation = self.mapData.elevation.ravel()
             for h in range(smoothingIterations):
-                for i in range(self.tileCount):
-                    for j in range(self.tileCount):
-                    
-                        # Get current/focus tile data
-                        tile = self.mapData.tiles[i][j]
-                        adjTilesElev = []
-                        
-                        # Get nine neighboring tiles (including current)
-                        for k in [-1, 0, 1]:
-                            for l in [-1, 0, 1]:
-                            
-                                # Get neighboring tiles (loop around if at edge)
-                                adjIndexX = i+k
-                                if adjIndexX >= self.tileCount:
-                                    adjIndexX = 0
-                                elif adjIndexX < 0:
-                                    adjIndexX = self.tileCount-1
-                                adjIndexY = j+l
-                                if adjIndexY >= self.tileCount:
-                                    adjIndexY = 0
-                                elif adjIndexY < 0:
-                                    adjIndexY = self.tileCount-1
-                                    
-                                # Add elevation of neighboring tile to list
-                                adjTile = self.mapData.tiles[adjIndexX][adjIndexY]
-                                adjTilesElev.append(float(adjTile.elevation))
-                                
-                        avgElevation = sum(adjTilesElev) / 9
-                        effectiveElevation = avgElevation
-                        
-                        # Add random noise to elevation
-                        if random.randint(0, elevationNoiseFreq-1) == 0:
-                            effectiveElevation += random.randint(-1*elevationNoiseMax, elevationNoiseMax)
-                        tile.elevation = int(effectiveElevation)
+                for tileIndex, windowIndices in enumerate(self.topology.windowIndices):
+                    avgElevation = sum(elevation[windowIndices].tolist()) / WINDOW_SIZE
+                    effectiveElevation = avgElevation
+
+                    # Add random noise to elevation
+                    if random.randint(0, elevationNoiseFreq-1) == 0:
+                        effectiveElevation += random.randint(-1*elevationNoiseMax, elevationNoiseMax)
+                    elevation[tileIndex] = int(effectiveElevation)
 
         # Apply parabolic temperature curve (simulate equatorial effect)
         for i in range(self.tileCount):
@@ -414,19 +914,6 @@ class GameMap:
                 tile.temperature = temperature
                 tile.airTemperature = float(airTemperature)
                 
-        # Calculate air pressure from temperature        
-        for i in range(self.tileCount):
-            for j in range(self.tileCount):
-                tile = self.mapData.tiles[i][j]
-                airTemperature = tile.airTemperature
-                airTempRankine = airTemperature + 459.67
-                idealGasConst = 10.731577089016  # psi * ft3 / lbmol * °R
-                volumeOfTile = 5280.0**3.0 # 1 cubic mile to feet cubed
-                molesOfTile = ((4.168 * 10.0**12.0) / 24.0) * 0.00220462 # lbmols in one cubic mile
-                
-                # Ideal gas law estimation
-                tile.airPressure = (molesOfTile * idealGasConst * airTempRankine) / volumeOfTile
-                
         self.elevation_calcs()
         
         # Run a few times to smooth out initial values
@@ -439,518 +926,270 @@ class GameMap:
         """A function run at startup to calculate impact of current elevation of
            tile on the effective temperature/pressure at the surface. 
            The physical effect is known as Lapse Rate.
-           Data is saved as lists to each Tile object for quick lookup."""
+           Factors are kept per tile in the map arrays (see update_elevation_factors)."""
     
         # Apply effect to temp, pressure, and density according to tile elevation
         # Values should represent air at whatever elevation is just above surface (incl. ocean surface)
         # Should only apply once !!! after initial value generation (rand_gen)
-    
-        # Source: https://www.engineeringtoolbox.com/standard-atmosphere-d_604.html
-        # Conversion factors to adjust temp/pressure/density to elevation
-        # Second-order curve fits to first three data points
-        def temp_from_elev(elevation):
-            return 1.0000 - (6 * 10**(-5) * elevation) + (5 * 10**(-12) * elevation**2)
-        def pressure_from_elev(elevation):
-            return 1.0004 - (4 * 10**(-5) * elevation) + (5 * 10**(-10) * elevation**2)
-        def density_from_elev(elevation):
-            return 1.0001 - (3 * 10**(-5) * elevation) + (3 * 10**(-10) * elevation**2)
-        
-        # Adjust temp/pressure/density from elevation        
-        for i in range(self.tileCount):
-            for j in range(self.tileCount):
-            
-                # Get tile elevation data
-                tile = self.mapData.tiles[i][j]
-                tileElevation = tile.elevation
-                
-                # Air "elevation" on oceans should be at sea level
-                if tileElevation < self.seaLevel:
-                    tileElevation = 0.0
-                    
-                    self.airTempElevFactor = temp_from_elev(tileElevation)
-                    self.airPresElevFactor = pressure_from_elev(tileElevation)
-                    self.airDensElevFactor = density_from_elev(tileElevation)   
+        mapData = self.mapData
+        self.update_elevation_factors()
                     
-                # Apply equations to adjust unadjusted temps/pressures/densities to elevation
-                # TODO: Should only air density be affected? Since T/P are tied to this, they should be affected on calc steps
-                tile.airTemperature = tile.airTemperature * temp_from_elev(tileElevation)
-                tile.temperature = tile.temperature * temp_from_elev(tileElevation)
-                tile.airPressure = tile.airPressure * pressure_from_elev(tileElevation)
-                tile.airDensity = tile.airDensity * density_from_elev(tileElevation)
+        # Apply factors to adjust unadjusted temps to elevation (density set by update_elevation_factors)
+        # TODO: Should only air density be affected? Since T/P are tied to this, they should be affected on calc steps
+        mapData.airTemperature *= mapData.airTempElevFactor
+        mapData.temperature *= mapData.airTempElevFactor
+
+        # Calculate air pressure from temperature
+        ideal_gas(mapData)
+
+
+    def update_elevation_factors(self):
+        """Lapse-rate factors of every tile (see elevation_factors) and the air
+           density they give. Only depend on sea level, so they are recomputed
+           only when it changed since the last call, and then only for the tiles
+           that changed between land and sea (see ElevationIndex).
+           Returns flat indices of the tiles updated."""
+        mapData = self.mapData
+        if self.elevationFactorSeaLevel is None:
+            mapData.airTempElevFactor[...], mapData.airPresElevFactor[...], mapData.airDensElevFactor[...] = \
+                elevation_factors(mapData.elevation, self.seaLevel)
+            np.multiply(mapData.airDensElevFactor, SEA_LEVEL_AIR_DENSITY, out=mapData.airDensity)
+            tiles = np.arange(mapData.elevation.size)
+        else:
+            tiles = self.elevationIndex.crossing(self.elevationFactorSeaLevel, self.seaLevel)
+            mapData.airTempElevFactor.flat[tiles], mapData.airPresElevFactor.flat[tiles], mapData.airDensElevFactor.flat[tiles] = \
+                elevation_factors(mapData.elevation.flat[tiles], self.seaLevel)
+            mapData.airDensity.flat[tiles] = mapData.airDensElevFactor.flat[tiles] * SEA_LEVEL_AIR_DENSITY
+        self.elevationFactorSeaLevel = self.seaLevel
+        return tiles
+
+
+    def set_sea_level(self, seaLevel):
+        """Move sea level, updating only the tiles it floods or drains: their
+           land/sea type (and material properties), lapse-rate factors and,
+           in Surface display mode, graphics. Other display modes that depend
+           on sea level are redrawn in full."""
+        mapData = self.mapData
+        self.seaLevel = seaLevel
+        crossingTiles = self.update_elevation_factors()
+
+        # Reclassify only the crossing tiles (others keep their land/sea state)
+        typeCode = mapData.typeCode.flat[crossingTiles]
+        changedTiles = crossingTiles[classify_tiles(mapData.elevation.flat[crossingTiles], mapData.temperature.flat[crossingTiles],
+                                                    self.seaLevel, typeCode)]
+        mapData.typeCode.flat[crossingTiles] = typeCode
+        if changedTiles.size:
+            self.update_material_properties(changedTiles)
+
+        if self.displayMode == "Surface":
+            self.redraw_tiles(changedTiles)
+        elif self.displayMode in ("Elevation, Land-Only", "Air Density"):
+            self.reset_tiles()
 
 
-    def smooth_temps(self):
+    def smooth_temps(self, dt=None):
         """Averages temperatures across each tile and its eight neighbors,
            applying only a percentage of the difference between the average
-           and the actual to simulate slower diffusion."""
-        directions = [-1, 0, 1]
-        neighborIndices = [(x, y) for x in directions for y in directions]
-        allTileIndices = [(x, y) for x in range(self.tileCount) for y in range(self.tileCount)]
-        random.shuffle(allTileIndices)
-        for tileIndex in allTileIndices:
-            tile = self.mapData.tiles[tileIndex[0]][tileIndex[1]]
-            airTemperature = tile.airTemperature
-            totalTemperature = airTemperature
-            for neighborTile in tile.neighbors:
-                totalTemperature += neighborTile.airTemperature
-            averageTemperature = totalTemperature / 9
-            tile.airTemperature += (averageTemperature - tile.airTemperature) * TEMPERATURE_SMOOTH_FACTOR
-            for neighborTile in tile.neighbors:
-                neighborTile.airTemperature += (averageTemperature - neighborTile.airTemperature) * TEMPERATURE_SMOOTH_FACTOR
-
-
-    def heat_calcs(self):
+           and the actual to simulate slower diffusion.
+           Every tile is smoothed from the same starting temperatures, so the
+           result no longer depends on a shuffled visiting order.
+           The percentage is per hour, scaled by the time step (dt, hrs) and
+           split into sub-steps if a single step would overshoot the average."""
+        if dt is None:
+            dt = self.timeStep
+        smoothFactor = TEMPERATURE_SMOOTH_FACTOR * dt
+        substeps = substep_count(SMOOTH_PULL_WEIGHT * smoothFactor, STABILITY_FACTOR)
+        for substep in range(substeps):
+            self.kernels.smooth_temps(self.mapData, smoothFactor / substeps)
+
+
+    def update_material_properties(self, tiles=None):
+        """Look up material properties (albedo, heat capacity * mass,
+           convective roughness) of tiles from their current type.
+           tiles are flat indices (e.g. from classify_tiles), default all tiles."""
+        mapData = self.mapData
+        if tiles is None:
+            typeCode = mapData.typeCode
+            np.take(TYPE_ALBEDO, typeCode, out=mapData.surfaceAlbedo)
+            np.take(TYPE_HEAT_MASS, typeCode, out=mapData.surfaceHeatMass)
+            np.take(TYPE_ROUGHNESS, typeCode, out=mapData.surfaceRoughness)
+            np.equal(typeCode, TILE_TYPE_CODES['snow'], out=mapData.surfaceSnow)
+            return
+        typeCode = mapData.typeCode.flat[tiles]
+        mapData.surfaceAlbedo.flat[tiles] = TYPE_ALBEDO[typeCode]
+        mapData.surfaceHeatMass.flat[tiles] = TYPE_HEAT_MASS[typeCode]
+        mapData.surfaceRoughness.flat[tiles] = TYPE_ROUGHNESS[typeCode]
+        mapData.surfaceSnow.flat[tiles] = typeCode == TILE_TYPE_CODES['snow']
+
+
+    def update_tile_types(self):
+        """Reclassify tile types from current temperatures and sea level (run
+           every tick, independent of display mode) and update the material
+           properties of only the tiles whose type changed."""
+        changedTiles = classify_tiles(self.mapData.elevation, self.mapData.temperature, self.seaLevel, self.mapData.typeCode)
+        if changedTiles.size:
+            self.update_material_properties(changedTiles)
+        return changedTiles
+
+
+    def update_zonal_statistics(self, hours):
+        """Record the zonal statistics of the current tick (see ZonalHistory)."""
+        self.zonalHistory.record(hours, self.mapData.temperature, self.mapData.airTemperature, self.mapData.typeCode)
+
+
+    def update_climatology(self):
+        """Add the current tick to the per-tile climatology of every window."""
+        for statistics in self.climatology.values():
+            statistics.record(self.mapData)
+
+
+    def sunlight(self, hourAngle):
+        """Cosine of solar zenith angle of each tile with the sun at an hour angle
+           on the current day. Tables are computed on first use and kept in the
+           sun data cache (read-only, as they are shared by every user of a day
+           and hour: heat balance, sun overlay, ensembles)."""
+        def compute():
+            table = cosine_solar_zenith(self.tileCount, hourAngle, solar_declination(self.dayOfYear))
+            table.flags.writeable = False
+            return table
+        return self.sunlightCache.get((self.dayOfYear, hourAngle), compute)
+
+
+    def step_sunlight(self, dt):
+        """Cosine of solar zenith angle of each tile for a tick of dt hours ending
+           at the current hour angle. Ticks longer than an hour use the average of
+           the hourly daylight they cover (night hours count as zero, as in the
+           heat balance), so daily sun energy does not depend on dt."""
+        hours = int(round(dt))
+        if hours <= 1:
+            return self.sunlight(self.sunHourAngle)
+        def compute():
+            hourAngles = [(self.sunHourAngle - hour * 360 // 24) % 360 for hour in range(hours)]
+            table = np.mean([np.maximum(self.sunlight(hourAngle), 0) for hourAngle in hourAngles], axis=0)
+            table.flags.writeable = False
+            return table
+        return self.sunlightCache.get((self.dayOfYear, self.sunHourAngle, hours), compute)
+
+
+    def daily_sunlight(self):
+        """Cosine of solar zenith angle of each tile averaged over the current day
+           (all hour angles the sun data is stored at), counting only daylight:
+           the sun below the horizon (negative cosine) brings no heat."""
+        return np.mean([np.maximum(self.sunlight(hourAngle), 0) for hourAngle in sun_hour_angles(self.timeStep)], axis=0)
+
+
+    def spin_up(self):
+        """Jump straight to the daily-averaged equilibrium of the heat balance and
+           air smoothing (see equilibrium.py) instead of ticking until temperatures
+           settle, e.g. after changing greenhouse effect or sea level. Air carried
+           by the wind (see advect_temps) mixes neighboring tiles within hours, so
+           the solve adds it to the smoothing at the rate the current wind crosses
+           tiles (TILES_PER_WIND_HOUR). Each solve holds tile types fixed, so tiles
+           are reclassified from its result (with their material properties) and
+           solved again until no tile changes type (up to SPIN_UP_MAX_PASSES
+           solves). Normal ticks continue from the new state; the daily cycle
+           itself is not part of the average, so temperatures still move over each
+           day. If no equilibrium is found, temperatures and tile types are left
+           as they were."""
+        mapData = self.mapData
+        self.update_elevation_factors()
+        cosineSolarZenithAngle = self.daily_sunlight()
+        smoothFactor = TEMPERATURE_SMOOTH_FACTOR + np.mean(mapData.windSpeedMagnitude) * TILES_PER_WIND_HOUR
+        startTypeCode = mapData.typeCode.copy()
+        temperature, airTemperature = mapData.temperature, mapData.airTemperature
+        iterations = 0
+        for spinPass in range(1, SPIN_UP_MAX_PASSES + 1):
+            temperature, airTemperature, passIterations, converged = solve_equilibrium(mapData, cosineSolarZenithAngle, self.greenhouse,
+                                                                                       smoothFactor, initial=(temperature, airTemperature))
+            iterations += passIterations
+            if not converged:
+                break
+            changedTiles = classify_tiles(mapData.elevation, temperature, self.seaLevel, mapData.typeCode)
+            if not changedTiles.size:
+                break
+            self.update_material_properties(changedTiles)
+        if not converged:
+            mapData.typeCode[...] = startTypeCode
+            self.update_material_properties()
+            log(f"No equilibrium found after {iterations} iterations; temperatures unchanged.")
+            return
+        mapData.temperature[...] = temperature
+        mapData.airTemperature[...] = airTemperature
+        mapData.lastAirTemperature[...] = airTemperature
+        mapData.heatFromAir[...] = RADIATION_RATIO_AIR_TO_SURFACE * AIR_RADIATION_COEFFICIENT * (1 + self.greenhouse) * (airTemperature - ABSOLUTE_ZERO)**4
+        self.reset_tiles()
+        if changedTiles.size:
+            log(f"Spun up in {iterations} iterations; {changedTiles.size} tiles still changed type after {spinPass} passes.")
+        else:
+            log(f"Spun up to equilibrium in {iterations} iterations ({spinPass} passes).")
+
+
+    def heat_calcs(self, dt=None):
         """Calculate input and output heats to each tile (both surface and air) and
            calculate the resulting temperature change. Includes transfer of heat
            between air and surface. Includes radiative and convective effects.
-           No conduction is used due to the large scale of each tile. All calculations
-           currently rely on fact that each tick/iteration is a single hour.
-           TODO: add in "time step size" as a factor for all calcs so it can be adjusted."""
-        debug = False
-    
-        # DEBUGGING
-        if debug:
-            worldHeatGainSum = 0
-            worldHeatLossSum = 0
-            worldSurfaceHeatGainSum = 0
-            worldSurfaceHeatLossSum = 0
-            worldAirHeatGainSum = 0
-            worldAirHeatLossSum = 0
-    
-        # Change temp of tiles in sunlight      
-        for i in range(self.tileCount):
-            for j in range(self.tileCount):
-            
-                # Get tile data
-                tile = self.mapData.tiles[i][j]
-                tileType = tile.type
-                surfaceTemperature = tile.temperature
-                airTemperature = tile.airTemperature
-                airRadiationToSurface = tile.heatFromAir
-                surfaceTemperatureRankine = surfaceTemperature + 459.67
-                airTemperatureRankine = airTemperature + 459.67
-                cosineSolarZenithAngle = tile.sunlightData[self.sunHourAngle]
-                
-                airTempElevFactor = self.airTempElevFactor
-                
-                # Correct for values below absolute zero
-                if surfaceTemperatureRankine < 0:
-                    tile.temperature = surfaceTemperature = -459.67
-                    surfaceTemperatureRankine = 0
-                if airTemperatureRankine < 0:
-                    tile.airTemperature = airTemperature = -459.67
-                    airTemperatureRankine = 0
-                
-                # Allow heat input if tile is in sunlight
-                # Scale by latitude (lower at poles)
-                sunHeatIn = BASE_SUN_HEAT_FLUX * cosineSolarZenithAngle
-
-
-                # Snow/sea ice inherits ice material properties
-                if tileType == 'snow' or tileType == 'sea_ice':
-                    material = 'ice'
-                else:
-                    material = tileType
-                    
-                # Collect material properties
-                surfaceAlbedo = ALBEDO[material]
-                heatCapacity = HEAT_CAPACITY[material]
-                heatCalcDepth = CALC_DEPTH[material]
-                
-                # "Calc Depth" is used to calculate finite temp change - simplifying each tile to single point
-                # with a "mass" determined by the volume and density, volume calculated from 1 mile * 1 mile * calc depth
-                surfaceMass = DENSITY[material] * heatCalcDepth * 5280.0**2
-
-                # Warm air or surface reduces albedo
-                if tileType == "snow" or tileType == "ice":
-                    if airTemperature > 32:
-                        surfaceAlbedo -= 0.1
-                    if surfaceTemperature > 32:
-                        surfaceAlbedo -= 0.15
-
-                # Uses Calc Depth as well, only simulating the first layer of air above the surface
-                # TODO: once air gas calcs ironed out, use air density instead of static value
-                airMass = (CALC_DEPTH['air'] * 5280**2) * DENSITY['air']
-                 
-                # Air to surface convection
-                # Convection coefficient maxes out at 120mph wind and 175 W/m^2 K
-                airConvCoefBounds = (0.088, 30.840) # 0.5 to 175 W/m^2 K in BTU/ft^2 F
-                if tile.windSpeedMagnitude > 176.0: # 120mph -- 176 ft/s
-                    airConvectionCoefficient = 1.0
-                else:
-                    airConvectionCoefficient = tile.windSpeedMagnitude / 176.0
-                airConvectionCoefficient = airConvCoefBounds[0] + \
-                                          (airConvCoefBounds[1] - airConvCoefBounds[0]) * (tile.windSpeedMagnitude / 176.0)**0.5
-                airConvectionCoefficient = max(airConvectionCoefficient, NATURAL_CONVECTION_COEFFICIENT)
-                
-                # Surface roughness increase on surface area estimation
-                # Rougher surface = more surface area for convection
-                if tileType == 'stone':
-                    roughnessFactor = 1.2
-                elif tileType == 'snow':
-                    roughnessFactor = 1.5
-                else:
-                    roughnessFactor = 1
-                
-                # Calculate surface/air temperature difference
-                deltaTemp = airTemperature - surfaceTemperature
-                
-                # BTU from (BTU/ft^2 F) * (ft^2) * (degrees F)
-                convectionEnergy = (airConvectionCoefficient*roughnessFactor) * (5280**2) * deltaTemp
-                
-                # Add convective heat gain if positive
-                if convectionEnergy > 0:
-                    airConvectionToSurface = convectionEnergy
-                else:
-                    airConvectionToSurface = 0
-
-                # Add convective heat loss if negative
-                if convectionEnergy < 0:
-                    surfaceConvectionToAir = -1*convectionEnergy
-                else:
-                    surfaceConvectionToAir = 0
-                
-                # Calculate energy breakdown for surface
-                # apply greenhouse factor to percent of sun energy absorbed by atmosphere
-                # remaining energy goes to surface
-                percentSunHeatToAir = HEAT_RATIO_AIR
-                percentSunHeatToSurface = 1 - percentSunHeatToAir
-                
-                ########################
-                # Surface heat transfer
-                ########################
-                
-                # IN: sun radiation, atmosphere re-radiation, hot air convection
-                
-                # Add energy from sun
-                sunHeatToSurface = (percentSunHeatToSurface * sunHeatIn)
-                sunHeatToSurfaceAbsorbed = sunHeatToSurface * (1 - surfaceAlbedo)
-
-                # OUT: radiation to air, reflected sun radiation, cold air convection
-                # TODO: when water system active, heat lost through latent heat, or evaporative heat loss
-
-                # Radiation back to air
-                surfaceRadiation = RADIATION_CONTROL_FACTOR * STEFAN_BOLTZMANN_CONSTANT * EMISSIVITY['surface'] * (5280.0**2) * surfaceTemperatureRankine**4.0
-                
-                # Reflected sun radiation
-                surfaceReflection = sunHeatToSurface * surfaceAlbedo
-
-                ### SUM GAINS
-                totalSurfaceHeatGain = sunHeatToSurfaceAbsorbed + airRadiationToSurface + airConvectionToSurface
-                
-                ### SUM LOSSES
-                totalSurfaceHeatLoss = surfaceRadiation + surfaceConvectionToAir
-                
-                ### NET HEAT CHANGE
-                surfaceNetHeat = totalSurfaceHeatGain - totalSurfaceHeatLoss
-                surfaceDeltaTemperature = surfaceNetHeat / (surfaceMass * heatCapacity)
-                tile.temperature = surfaceTemperature + surfaceDeltaTemperature
-
-                ####################
-                # Air heat transfer
-                ####################
-                
-                # IN: sun radiation, surface re-radiation, hot surface convection, a percent of surface reflected energy
-
-                # Add energy from sun
-                sunHeatToAir = (percentSunHeatToAir * sunHeatIn)
-                sunHeatToAirAbsorbed = sunHeatToAir * (1 - ALBEDO['air'])
-
-                # Reabsorb surface radiation
-                surfaceRadiationToAir = surfaceRadiation * (SURFACE_RADIATION_ABSORPTION_AIR * (1 + self.greenhouse))
-                
-                # Reabsorb surface reflection
-                surfaceReflectionToAir = surfaceReflection * (REFLECTION_RATIO_SURFACE_TO_AIR * (1 + self.greenhouse))
-                
-                # OUT: radiation to surface/space, reflected sun radiation, cold surface convection
-                
-                # Radiation to space and surface (50/50)
-                airRadiation = RADIATION_CONTROL_FACTOR * STEFAN_BOLTZMANN_CONSTANT * (EMISSIVITY['air'] * (1 + self.greenhouse)) * (5280.0**2) * airTemperatureRankine**4.0
-                
-                # Atmosphere reflection of sun radiation
-                airReflectionToSpace = sunHeatToAir * ALBEDO['air']
-
-                ### SUM GAINS
-                totalAirHeatGain = sunHeatToAirAbsorbed + surfaceRadiationToAir + surfaceConvectionToAir + surfaceReflectionToAir
-                
-                ### SUM LOSSES
-                totalAirHeatLoss = airRadiation + airConvectionToSurface
-                
-                ### NET HEAT CHANGE
-                airNetHeat = totalAirHeatGain - totalAirHeatLoss
-                airDeltaTemperature = airNetHeat / (airMass * HEAT_CAPACITY['air'])
-
-                # By default, half of radiation from atmosphere reabsorbed by the surface
-                tile.heatFromAir = airRadiation * RADIATION_RATIO_AIR_TO_SURFACE
-
-                if airDeltaTemperature < 0:
-                    airTempElevFactor = 1
-
-                # Save previous value to calculate change in pressure/density
-                tile.lastAirTemperature = float(airTemperature)
-                tile.airTemperature = airTemperature + airDeltaTemperature * airTempElevFactor 
-                
-                if debug:
-                
-                    worldHeatGainSum += (totalAirHeatGain + totalSurfaceHeatGain) / 1E20
-                    worldHeatLossSum += (totalAirHeatLoss + totalSurfaceHeatLoss) / 1E20 
-                    worldSurfaceHeatGainSum += (totalSurfaceHeatGain) / 1E20
-                    worldSurfaceHeatLossSum += (totalSurfaceHeatLoss) / 1E20
-                    worldAirHeatGainSum += (totalAirHeatGain) / 1E20
-                    worldAirHeatLossSum += (totalAirHeatLoss) / 1E20
-                    
-                    print('---')
-                    print('Net heat surface: ' + str(surfaceNetHeat))
-                    print('Total heat gain surface: ' + str(totalSurfaceHeatGain))
-                    print('Total heat loss surface: ' + str(totalSurfaceHeatLoss))
-                    print('Sun heating surface: ' + str(sunHeatToSurfaceAbsorbed))
-                    print('Air radiation heating surface: ' + str(airRadiationToSurface))
-                    print('Convection heating surface: ' + str(airConvectionToSurface))
-                    print('Radiation heat loss surface: ' + str(surfaceRadiation))
-                    print('Convection heat loss surface: ' + str(surfaceConvectionToAir))
-                    print('Surface temp: ' + str(surfaceTemperature))
-                    print('Air temp: ' + str(airTemperature))
-                    print('Tile lit: ' + str(tileLit))
-                    print('Radiation heat loss air: ' + str(airRadiation))
-
-        if debug:
-            print('---')
-            print("Total world heat gain = " + str(worldHeatGainSum) + " E20 BTU")
-            print("Total world heat loss = " + str(worldHeatLossSum) + " E20 BTU")
-            print("Total world surface heat gain = " + str(worldSurfaceHeatGainSum) + " E20 BTU")
-            print("Total world surface heat loss = " + str(worldSurfaceHeatLossSum) + " E20 BTU") 
-            print("Total world air heat gain = " + str(worldAirHeatGainSum) + " E20 BTU")
-            print("Total world air heat loss = " + str(worldAirHeatLossSum) + " E20 BTU")
-
-
-    def calc_velocity(self):
-        """Use Bernoulli's equation and air pressures to modify wind vectors."""
-        
-        # Shuffle tiles as to avoid order of operations influencing result
-        tileListX = list(range(self.tileCount))
-        tileListY = list(range(self.tileCount))
-        random.shuffle(tileListX)
-        random.shuffle(tileListY)
-        
-        # Loop through randomized tile lists
-        for i in tileListX:
-            for j in tileListY:
-                
-                # Get current tile data
-                tile = self.mapData.tiles[i][j]
-                tileAirPressure = tile.airPressure
-                tileAirVelocityMagnitude = tile.windSpeedMagnitude
-                tileAirVelocityAngle = tile.windSpeedAngle
-                tileAirDensity = tile.airDensity
-                                            
-                # Initialize x/y components so adjacent tiles' effects can be added                            
-                velocityComponentSumX = tileAirVelocityMagnitude * math.sin(math.radians(tileAirVelocityAngle))
-                velocityComponentSumY = tileAirVelocityMagnitude * math.cos(math.radians(tileAirVelocityAngle))
-
-                # Get eight neighboring tiles (excluding current)
-                tileForceVectors = []
-                tileVelocityVectors = []
-                for k in [-1, 0, 1]:
-                    for l in [-1, 0, 1]:
-                        if not (k == 0 and l == 0):
-                        
-                            # Get neighboring tiles (loop around if at edge)
-                            adjIndexX = i+k
-                            if adjIndexX >= self.tileCount:
-                                adjIndexX = 0
-                            elif adjIndexX < 0:
-                                adjIndexX = self.tileCount-1
-                            adjIndexY = j+l
-                            if adjIndexY >= self.tileCount:
-                                adjIndexY = 0
-                            elif adjIndexY < 0:
-                                adjIndexY = self.tileCount-1
-
-                            # Figure out angle to adjacent tile (0 degrees is up)
-                            if k == -1 and l == -1:
-                                adjAngle = 315
-                            elif k == -1 and l == 0:
-                                adjAngle = 270
-                            elif k == -1 and l == 1:
-                                adjAngle = 225
-                            elif k == 0 and l == 1:
-                                adjAngle = 180
-                            elif k == 1 and l == 1:
-                                adjAngle = 135
-                            elif k == 1 and l == 0:
-                                adjAngle = 90
-                            elif k == 1 and l == -1:
-                                adjAngle = 45
-                            elif k == 0 and l == -1:
-                                adjAngle = 0
-
-                            adjTile = self.mapData.tiles[adjIndexX][adjIndexY]
-                            adjTileAirPressure = adjTile.airPressure
-                            adjTileAirVelocityMagnitude = adjTile.windSpeedMagnitude
-                            adjTileAirVelocityAngle = adjTile.windSpeedAngle
-                            tileForceVectors.append((adjAngle, adjTileAirPressure))
-                            tileVelocityVectors.append((adjAngle, tileAirVelocityMagnitude, adjTileAirVelocityAngle))
-
-                for forceVector, velocityVector in zip(tileForceVectors, tileVelocityVectors):
-                
-                    adjPressureDirection = forceVector[0]
-                    adjPressureMagnitude = forceVector[1]
-                    
-                    adjVelocityDirection = velocityVector[0]
-                    adjVelocityMagnitude = velocityVector[1]
-                    adjVelocityAngle = velocityVector[2]
-                
-                    outwardVelocityMagnitude = adjVelocityMagnitude * math.cos(math.radians(adjVelocityDirection + adjVelocityAngle))
-                
-                    # Bernoulli's equation
-                    velocityMagnitude = math.sqrt(abs(outwardVelocityMagnitude**2 - ((tileAirPressure - adjPressureMagnitude)/(0.5*tileAirDensity))))
-                    
-                    # Add components to sum
-                    velocityComponentSumX += velocityMagnitude * math.sin(math.radians(adjPressureDirection))
-                    velocityComponentSumY += velocityMagnitude * math.cos(math.radians(adjPressureDirection))
-
-                newAngleRadians = math.atan(velocityComponentSumX / velocityComponentSumY)
-                tile.windSpeedAngle = math.degrees(newAngleRadians)
-                tile.windSpeedMagnitude = math.sqrt(velocityComponentSumX**2 + velocityComponentSumY**2)
+           No conduction is used due to the large scale of each tile.
+           Heat flows are per hour and applied over the time step (dt, hrs, defaults
+           to one tick). If the explicit update could overshoot for the fastest-
+           responding tile (e.g. thin stone), the step is split into equal sub-steps.
+           The balance itself runs on the selected kernel backend (see kernels.py).
+           Deep water surfaces respond over months, but every tile is still updated
+           each step: the air above them responds within hours and makes up most
+           of the per-tile cost, so updating their surface less often saves little.
+           The map total of each heat flow over the step is kept as the energy
+           budget (see energy_budget)."""
+        if dt is None:
+            dt = self.timeStep
+        self.update_elevation_factors()
+        cosineSolarZenithAngle = self.step_sunlight(dt)
+        substeps = substep_count(dt, max_stable_time_step(self.mapData, self.greenhouse))
+        self.energyBudget = np.zeros(len(BUDGET_TERMS))
+        for substep in range(substeps):
+            self.kernels.heat_balance(self.mapData, cosineSolarZenithAngle, self.greenhouse, dt / substeps, budget=self.energyBudget)
+        self.energyBudgetHistory.append(self.energyBudget)
+
+
+    def energy_budget(self):
+        """Map totals (BTU) of each heat flow of the last heat_calcs step, by term
+           (see kernels.BUDGET_TERMS), plus the air heat lost to the lapse-rate
+           factor on warming air (what the air gained short of its heat flows)."""
+        budget = budget_terms(self.energyBudget)
+        budget['airLapseLoss'] = budget['sunAbsorbedAir'] + budget['greenhouseReabsorbed'] - budget['airRadiation'] \
+                               - budget['convectionToSurface'] - budget['airHeatGain']
+        return budget
+
+
+    def energy_budget_history(self):
+        """Energy budget of recent ticks (up to ENERGY_BUDGET_HISTORY), oldest
+           first, as an array of shape (ticks, len(BUDGET_TERMS))."""
+        return np.array(self.energyBudgetHistory).reshape(-1, len(BUDGET_TERMS))
+
+
+    def calc_velocity(self, dt=None):
+        """Accelerate wind toward low pressure (reduced to sea level) over the
+           time step (dt, hrs), against surface friction. Every tile's pressure
+           gradient is taken from its eight neighbors at once (see kernels.py)."""
+        if dt is None:
+            dt = self.timeStep
+        self.kernels.calc_velocity(self.mapData, dt)
+
+
+    def advect_temps(self, dt=None):
+        """Carry air temperature along with the wind over the time step (dt, hrs).
+           Each tile takes the air temperature from where its air came from
+           (semi-Lagrangian, see kernels.py), so the step stays stable however
+           many tiles the wind crosses in one tick."""
+        if dt is None:
+            dt = self.timeStep
+        self.kernels.advect_temps(self.mapData, dt)
 
 
     def gas_calcs(self):
         """Use Ideal Gas Law and air temperature/density
-           to solve for new air pressure."""
-    
-        # Loop through tiles
-        for i in range(self.tileCount):
-            for j in range(self.tileCount):
-                
-                #######
-                
-                # Method - calculate delta pressure and apply
-                
-                # Get current tile data
-                # tile = self.mapData.tiles[i][j]
-                
-                # Tile data to modify/calculate values
-                # tileAirDensity = tile.airDensity # lb/ft^3
-                # tileAirTemperature = tile.airTemperature # fahrenheit
-                # tileLastAirTemperature = tile.lastAirTemperature # fahrenheit
-                # tileAirPressure = tile.airPressure # psi
-
-                # gasConstant = 53.353 # ft lbf / lb R
-                # psfToPsi = 0.00694444 # sq ft to sq in
-                
-                # deltaTemperature = tileAirTemperature - tileLastAirTemperature
-                
-                # Ideal gas law 
-                # Delta P = density * gas const * delta T
-                # pressureIncr = tileAirDensity * gasConstant * deltaTemperature * psfToPsi
-                # tileAirPressureNew = tileAirPressure + pressureIncr
-                # tile.airPressure = tileAirPressureNew
-                
-                #######
-                
-                # Method - calculate pressure directly from P = density * R * T
-                
-                # Get current tile data
-                tile = self.mapData.tiles[i][j]
-                
-                # Tile data to modify/calculate values
-                tileAirDensity = tile.airDensity # lb/ft^3
-                tileAirTemperature = tile.airTemperature # fahrenheit
-                tileAirTemperatureRankine = tileAirTemperature + 459.67
-                tileAirPressure = tile.airPressure # psi
-
-                gasConstant = 53.353 # ft lbf / lb R
-                psfToPsi = 0.00694444 # sq ft to sq in
-
-                # Ideal gas law 
-                # P = density * gas const * T
-                tile.airPressure = tileAirDensity * gasConstant * tileAirTemperatureRankine * psfToPsi
-
-
-    def calc_temp_and_pressure(self):
-        """Calculates wind speed and velocity from temp/pressure."""
-    
-        # Shuffle tiles as to avoid order of operations influencing result
-        tileListX = list(range(self.tileCount))
-        tileListY = list(range(self.tileCount))
-        random.shuffle(tileListX)
-        random.shuffle(tileListY)
-        
-        # Loop through randomized tile lists
-        for i in tileListX:
-            for j in tileListY:
-                
-                # Get current tile data
-                tile = self.mapData.tiles[i][j]
-                tileAirVelocityMagnitude = tile.windSpeedMagnitude
-                tileAirVelocityAngle = tile.windSpeedAngle
-                
-                # Tile data to modify
-                tileAirDensity = tile.airDensity # maybe not density - see note in elev calcs
-                tileAirTemperature = tile.airTemperature
-                tileAirPressure = tile.airPressure
-                                            
-                # Initialize x/y components so adjacent tiles' effects can be added                            
-                velocityComponentSumX = tileAirVelocityMagnitude * math.sin(math.radians(tileAirVelocityAngle))
-                velocityComponentSumY = tileAirVelocityMagnitude * math.cos(math.radians(tileAirVelocityAngle))
-
-                # Get eight neighboring tiles (excluding current)
-                adjTileData = []
-                for k in [-1, 0, 1]:
-                    for l in [-1, 0, 1]:
-                        if not (k == 0 and l == 0):
-                        
-                            # Get neighboring tiles (loop around if at edge)
-                            adjIndexX = i+k
-                            if adjIndexX >= self.tileCount:
-                                adjIndexX = 0
-                            elif adjIndexX < 0:
-                                adjIndexX = self.tileCount-1
-                            adjIndexY = j+l
-                            if adjIndexY >= self.tileCount:
-                                adjIndexY = 0
-                            elif adjIndexY < 0:
-                                adjIndexY = self.tileCount-1
-
-                            # Figure out angle to adjacent tile (0 degrees is up)
-                            if k == -1 and l == -1:
-                                adjAngle = 315
-                            elif k == -1 and l == 0:
-                                adjAngle = 270
-                            elif k == -1 and l == 1:
-                                adjAngle = 225
-                            elif k == 0 and l == 1:
-                                adjAngle = 180
-                            elif k == 1 and l == 1:
-                                adjAngle = 135
-                            elif k == 1 and l == 0:
-                                adjAngle = 90
-                            elif k == 1 and l == -1:
-                                adjAngle = 45
-                            elif k == 0 and l == -1:
-                                adjAngle = 0
-                                
-                            # Only tiles within 90 degrees of wind direction will exchange temp/pressure
-                            tileAngleFactor = abs(tileAirVelocityAngle - adjAngle)    
-                            if tileAngleFactor < 90:
-                                adjTile = self.mapData.tiles[adjIndexX][adjIndexY]
-                                adjTileAirPressure = adjTile.airPressure
-                                adjTileAirTemperature = adjTile.airTemperature
-                                adjTileAirDensity = adjTile.airDensity
-                                adjTileData.append((adjAngle, adjTile))
-
-                for adjTileItem in adjTileData:
-                
-                    adjPressureDirection = forceVector[0]
-                    adjPressureMagnitude = forceVector[1]
-        
-                    adjVelocityDirection = velocityVector[0]
-                    adjVelocityMagnitude = velocityVector[1]
-                    adjVelocityAngle = velocityVector[2]
-                
-                newAngleRadians = math.atan(velocityComponentSumX / velocityComponentSumY)
-                tile.windSpeedAngle = math.degrees(newAngleRadians)
-                tile.windSpeedMagnitude = math.sqrt(velocityComponentSumX**2 + velocityComponentSumY**2)
+           to solve for new air pressure, for all tiles at once.
+           Density is set by elevation (see update_elevation_factors)."""
+        self.update_elevation_factors()
+        self.kernels.ideal_gas(self.mapData)
 
 
     def update_map(self):
@@ -966,112 +1205,169 @@ class GameMap:
         self.mapSurface.fill((120, 120, 120))
         for i in range(self.tileCount):
             for j in range(self.tileCount):
-                tile = self.mapData.tiles[i][j]
-                tileType = tile.graphic
-                currentPosition = (i*TILE_GRAPHIC_SIZE, j*TILE_GRAPHIC_SIZE)
-                tileGraphic = self.graphics.data[tileType]
-                self.mapSurface.blit(tileGraphic, currentPosition)
-                if self.windArrows:
-                    arrowImage = self.graphics.data["arrow"]
-                    rotate_center(self.mapSurface, arrowImage, currentPosition, tile.windSpeedAngle)
-                if tile.graphicOverlay != []:
-                    for overlay in tile.graphicOverlay:
-                        graphicOverlayType = overlay[0]
-                        graphicOverlay = self.graphics.data[graphicOverlayType]
-                        tileOverlayAngle = overlay[1]
-                        rotate_center(self.mapSurface, graphicOverlay, currentPosition, tileOverlayAngle)
+                self.draw_tile(i, j)
+
+
+    def draw_tile(self, i, j):
+        """Blit the current graphic (and wind arrow/overlays) of one tile onto the map surface."""
+        tile = self.mapData.tiles[i][j]
+        tileType = tile.graphic
+        currentPosition = (i*TILE_GRAPHIC_SIZE, j*TILE_GRAPHIC_SIZE)
+        tileGraphic = self.graphics.data[tileType]
+        self.mapSurface.blit(tileGraphic, currentPosition)
+        if self.windArrows:
+            arrowImage = self.graphics.data["arrow"]
+            rotate_center(self.mapSurface, arrowImage, currentPosition, tile.windSpeedAngle)
+        if tile.graphicOverlay != []:
+            for overlay in tile.graphicOverlay:
+                graphicOverlayType = overlay[0]
+                graphicOverlay = self.graphics.data[graphicOverlayType]
+                tileOverlayAngle = overlay[1]
+                rotate_center(self.mapSurface, graphicOverlay, currentPosition, tileOverlayAngle)
+
+
+    def update_pixel_map(self):
+        """Update map surface with one pixel per tile, in the average color of
+           its graphic (for zoomed-out views, see sprite_rendering). Filled
+           from the graphic of every tile at once, so it also works for
+           worlds too large for a full-size map surface."""
+        if self.mapSurface is None or self.mapSurface.get_size() != (self.tileCount, self.tileCount):
+            self.mapSurface = pygame.Surface((self.tileCount, self.tileCount))
+        pygame.surfarray.blit_array(self.mapSurface, self.tileColors[self.mapData.graphicCode])
+
+
+    def sprite_rendering(self):
+        """Whether tiles are large enough on screen to draw each with its graphic
+           (see update_map) rather than as one pixel (see update_pixel_map)."""
+        return TILE_GRAPHIC_SIZE * self.tileCount <= MAX_SPRITE_MAP_PIXELS \
+               and self.displaySize.x / self.tileCount >= SPRITE_MIN_TILE_PIXELS
+
+
+    def render_map(self):
+        """Redraw the map surface on the render path for the current zoom
+           (see sprite_rendering) and scale it to the display."""
+        spriteRendering = self.sprite_rendering()
+        pathChanged = spriteRendering != self.spriteRendering
+        self.spriteRendering = spriteRendering
+        if self.spriteRendering:
+            self.update_map()
+        else:
+            self.update_pixel_map()
+        self.scale_map()
+        if pathChanged and self.displaySun and self.sunLayerSurface is not None:
+            self.scale_sun_map()
 
 
-    def reset_suntiles(self):
-        """Pulls pre-loaded sun surface (includes "darkness"
-           and sun icon for a specific time of day) and scale
-           to current display settings."""
-    
-        # Generate blank map layer
-        self.sunLayerSurface = self.sunGraphics[self.sunHourAngle]
-        self.scale_sun_map()
+    def redraw_tiles(self, tiles):
+        """Update the Surface display graphics of only some tiles (flat indices)
+           on the existing map surface and its scaled copy, instead of
+           rebuilding both for the whole map (see reset_tiles)."""
+        if len(tiles) > self.mapAreaTiles // 2:
+            self.reset_tiles()
+            return
+        self.redrawNeeded = True
+        scaleX = self.displaySize.x / self.tileCount
+        scaleY = self.displaySize.y / self.tileCount
+        for index in tiles:
+            i, j = divmod(int(index), self.tileCount)
+            tile = self.mapData.tiles[i][j]
+            tile.graphic = self.surface_graphic(tile)
+            if not self.spriteRendering:
+                continue
+            self.draw_tile(i, j)
+
+            # Scale just this tile into its place on the scaled map
+            left, top = int(i * scaleX), int(j * scaleY)
+            width, height = int((i + 1) * scaleX) - left, int((j + 1) * scaleY) - top
+            if width > 0 and height > 0:
+                tileSurface = self.mapSurface.subsurface((i*TILE_GRAPHIC_SIZE, j*TILE_GRAPHIC_SIZE, TILE_GRAPHIC_SIZE, TILE_GRAPHIC_SIZE))
+                if self.antialiasing is True:
+                    tileSurface = pygame.transform.smoothscale(tileSurface, (width, height))
+                else:
+                    tileSurface = pygame.transform.scale(tileSurface, (width, height))
+                self.mapSurfaceScaled.blit(tileSurface, (left, top))
 
+        # Zoomed out, the whole pixel map is cheap to refill
+        if not self.spriteRendering:
+            self.update_pixel_map()
+            self.scale_map()
 
-    def calc_sun(self):
-        """A function run at startup to calculate position of sun and whether each
-           tile is sun-lit at each time increment in the simulation (0-24hr).
-           Data is saved as lists to each Tile object for quick lookup."""
+        # A smooth scaling in progress started from the map before these tiles changed
+        elif self.mapScaler.pending():
+            self.scale_map()
 
-        # Load sun graphics
-        sunGraphic = self.graphics.data["sun"]
-        shadowImage = self.graphics.data["shadow_50percent"]
 
-        # Determine the angular change of the sun for each time step
-        # 1 hr = 15 deg, 0.5 hr = 7.5 deg, etc.
-        sunDataResolution = int(360 / (24 / TIME_STEP))
-        
-        # Loop through degrees of Hour Angle (only the correct Hour Angle at center of sun location)
-        for hourAngleCenter in range(0, 360, sunDataResolution):
+    def reset_suntiles(self):
+        """Pulls the sun shadow layer ("darkness") for the current
+           day and time of day from the sun overlay cache (drawn
+           on first use) and scale to current display settings."""
+        self.sunLayerSurface = self.sunOverlayCache.get((self.dayOfYear, self.sunHourAngle), self.draw_sun_layer)
+        self.scale_sun_map()
 
-            # Generate blank map layer
-            sunLayerSurface = pygame.Surface((self.mapLengthsPixels.x, self.mapLengthsPixels.y), pygame.SRCALPHA)
-            sunLayerSurface.fill((255, 255, 255, 0))
 
-            # Calculate center location of sun on map
-            dieoutFactor = 1.475
-            
-            # Determine position of the sun based on hour angle/latitude
-            halfTileCount = float(self.tileCount) / 2.0
-            sunPositionY = halfTileCount + (self.sunLatitude / 90) * halfTileCount
-            sunPositionX = float(self.tileCount) * (hourAngleCenter / 360.0)
-            sunPosition = (sunPositionX * TILE_GRAPHIC_SIZE, sunPositionY * TILE_GRAPHIC_SIZE)
-            sunLayerSurface.blit(sunGraphic, sunPosition)
-
-            # Latitude factors calculated based on Mercator Projection (1/cos(lat))
-            latitudeFactorBase = 1.0 / math.cos(math.radians(self.sunLatitude / dieoutFactor))
-
-            # Calculate base dimensions of sunlit area on map
-            sunlightWidthBase = float(self.tileCount) / 4.0
-            sunlightWidth = sunlightWidthBase * latitudeFactorBase
-            sunlightHeight = float(self.tileCount) / 2.0
-            
-            # Calculate Solar Zenith Angles, effective solar radiation coefficients,
-            # and save sun graphics for each time step/tick
-            for i in range(self.tileCount):
-                for j in range(self.tileCount):
-                    
-                    latitudeAngle = abs(90 - ((180/(self.tileCount-1))*j))
-                    latitudeAngleRadians = math.radians(latitudeAngle)
-                    
-                    solarDeclinationAngle = 0
-                    solarDeclinationAngleRadians = math.radians(solarDeclinationAngle)
-                    
-                    # Calculate correct hour angle of each tile (with respect to current
-                    deltaPositionX = (i - sunPositionX + self.tileCount) % self.tileCount
-                    if deltaPositionX > halfTileCount:
-                        deltaPositionX = deltaPositionX - self.tileCount
-                    
-                    hourAngleEffective = (360 / self.tileCount) * deltaPositionX
-                    hourAngleRadians = math.radians(hourAngleEffective)
-                    
-                    # Solar Zenith Angle -- cos(Z) = sin(phi) * sin(delta) + cos(phi) * cos(delta) * cos(h)
-                    cosineSolarZenithAngle = math.sin(latitudeAngleRadians) * math.sin(solarDeclinationAngleRadians) + \
-                                             math.cos(latitudeAngleRadians) * math.cos(solarDeclinationAngleRadians) * math.cos(hourAngleRadians)
-
-                    shadowGraphicAlpha = 255*(1-cosineSolarZenithAngle)
-                    if shadowGraphicAlpha > 255:
-                        shadowGraphicAlpha = 255
-                    elif shadowGraphicAlpha < 0:
-                        shadowGraphicAlpha = 0
-                        
-                    shadowImage.set_alpha(shadowGraphicAlpha)
-                    currentPosition = (i * TILE_GRAPHIC_SIZE, j * TILE_GRAPHIC_SIZE)
-                    sunLayerSurface.blit(shadowImage, currentPosition)
-                    self.mapData.tiles[i][j].sunlightData.update({hourAngleCenter: cosineSolarZenithAngle})
+    def draw_sun_layer(self):
+        """Draw the sun shadow layer for the current day and hour angle: each
+           tile darkened by how low the sun is there (from the same sun data
+           as the heat balance), one pixel per tile (scaled by scale_sun_map)."""
 
-            self.sunGraphics.update({hourAngleCenter: sunLayerSurface})
+        # Shadow of each tile (shadow graphic faded by 1 - cosine of solar zenith angle)
+        shadowImage = self.graphics.data["shadow_50percent"]
+        shadowGraphicAlpha = np.clip(255 * (1 - self.sunlight(self.sunHourAngle)), 0, 255).astype(int)
+        shadowColor = shadowImage.get_at((0, 0))
+        sunLayerSurface = pygame.Surface((self.tileCount, self.tileCount), pygame.SRCALPHA)
+        sunLayerSurface.fill(shadowColor[:3] + (0,))
+        pygame.surfarray.pixels_alpha(sunLayerSurface)[...] = shadowGraphicAlpha * shadowColor[3] // 255
+        return sunLayerSurface
+
+
+    def sun_position(self):
+        """Position of the sun (in tiles) based on hour angle/declination (north at the top)."""
+        halfTileCount = float(self.tileCount) / 2.0
+        sunPositionY = halfTileCount - (solar_declination(self.dayOfYear) / 90) * halfTileCount
+        sunPositionX = float(self.tileCount) * (self.sunHourAngle / 360.0)
+        return sunPositionX, sunPositionY
+
+
+    def surface_graphic(self, tile):
+        """Graphic of a tile in Surface display mode: follows tile type
+           (see update_tile_types), stone shaded by elevation."""
+        tileType = tile.type
+        if tileType == "stone":
+            if tile.elevation > 9000:
+                return "stone9"
+            elif tile.elevation > 8000:
+                return "stone8"
+            elif tile.elevation > 7000:
+                return "stone7"
+            elif tile.elevation > 6000:
+                return "stone6"
+            elif tile.elevation > 5000:
+                return "stone5"
+            elif tile.elevation > 4000:
+                return "stone4"
+            elif tile.elevation > 3000:
+                return "stone3"
+            elif tile.elevation > 2000:
+                return "stone2"
+            elif tile.elevation > 1000:
+                return "stone1"
+            else:
+                return "stone0"
+        return tileType
+
+
+    def set_contour_graphics(self, values, valueMin, valueMax):
+        """Set the graphic of every tile to its band of an 11-band contour
+           (see contour_graphic_codes), as the contour display modes below."""
+        self.mapData.graphicCode[...] = contour_graphic_codes(values, valueMin, valueMax)
 
 
     def reset_tiles(self):
         """Takes current tile settings (dependent on
            tile properties, e.g. ice on tiles below
            freezing), fetches pre-loaded graphic and 
-           adds to correct location on map surface."""
+           adds to correct location on map surface.
+           Tile types themselves are set by update_tile_types."""
     
         # Default tile graphics display
         if self.displayMode == "Surface":
@@ -1081,322 +1377,140 @@ class GameMap:
                     tile = self.mapData.tiles[i][j]
                     tile.graphicOverlay = []
                     tile.graphicOverlayAngle = []
-                    if tile.elevation >= self.seaLevel:
-                        if tile.temperature < 32:
-                            tile.graphic = "snow"
-                            tile.type = "snow"
-                        else:
-                            tile.type = "stone"
-                            if tile.elevation > 9000:
-                                tile.graphic = "stone9"
-                            elif tile.elevation > 8000:
-                                tile.graphic = "stone8"
-                            elif tile.elevation > 7000:
-                                tile.graphic = "stone7"
-                            elif tile.elevation > 6000:
-                                tile.graphic = "stone6"
-                            elif tile.elevation > 5000:
-                                tile.graphic = "stone5"
-                            elif tile.elevation > 4000:
-                                tile.graphic = "stone4"
-                            elif tile.elevation > 3000:
-                                tile.graphic = "stone3"
-                            elif tile.elevation > 2000:
-                                tile.graphic = "stone2"
-                            elif tile.elevation > 1000:
-                                tile.graphic = "stone1"
-                            else:
-                                tile.graphic = "stone0"
-                    elif tile.elevation < self.seaLevel:
-                        if tile.temperature > 28:
-                            tile.graphic = "water"
-                            tile.type = "water"
-                        else:
-                            tile.graphic = "sea_ice"
-                            tile.type = "sea_ice"
-
-        # Contour-band elevation display
-        elif self.displayMode == "Elevation":
-            self.contourEnabled = True
-            tileElevationMax = 15000
-            tileElevationMin = -9000
-            self.contourMin = tileElevationMin
-            self.contourMax = tileElevationMax
-            tileElevationDifference = tileElevationMax - tileElevationMin
-            tileElevationIncr = tileElevationDifference / 9.0 # for 11-band contour
-            for i in range(self.tileCount):
-                for j in range(self.tileCount):
-                    tile = self.mapData.tiles[i][j]
-                    if tile.elevation >= tileElevationMax:
-                        tile.graphic = "band0"
-                    elif tile.elevation < tileElevationMax - tileElevationIncr*0 and tile.elevation >= tileElevationMax - tileElevationIncr*1:
-                        tile.graphic = "band1"
-                    elif tile.elevation < tileElevationMax - tileElevationIncr*1 and tile.elevation >= tileElevationMax - tileElevationIncr*2:
-                        tile.graphic = "band2"
-                    elif tile.elevation < tileElevationMax - tileElevationIncr*2 and tile.elevation >= tileElevationMax - tileElevationIncr*3:
-                        tile.graphic = "band3"
-                    elif tile.elevation < tileElevationMax - tileElevationIncr*3 and tile.elevation >= tileElevationMax - tileElevationIncr*4:
-                        tile.graphic = "band4"
-                    elif tile.elevation < tileElevationMax - tileElevationIncr*4 and tile.elevation >= tileElevationMax - tileElevationIncr*5:
-                        tile.graphic = "band5"
-                    elif tile.elevation < tileElevationMax - tileElevationIncr*5 and tile.elevation >= tileElevationMax - tileElevationIncr*6:
-                        tile.graphic = "band6"
-                    elif tile.elevation < tileElevationMax - tileElevationIncr*6 and tile.elevation >= tileElevationMax - tileElevationIncr*7:
-                        tile.graphic = "band7"
-                    elif tile.elevation < tileElevationMax - tileElevationIncr*7 and tile.elevation >= tileElevationMax - tileElevationIncr*8:
-                        tile.graphic = "band8"
-                    elif tile.elevation < tileElevationMax - tileElevationIncr*8 and tile.elevation >= tileElevationMax - tileElevationIncr*9:
-                        tile.graphic = "band9"
-                    elif tile.elevation <= tileElevationMax - tileElevationIncr*9:
-                        tile.graphic = "band10"     
-                    else:
-                        tile.graphic = "blank"                                     
-                        
-        elif self.displayMode == "Elevation, Land-Only":
-            self.contourEnabled = True
-            tileElevationMax = 15000
-            tileElevationMin = self.seaLevel
-            self.contourMin = tileElevationMin
-            self.contourMax = tileElevationMax
-            tileElevationDifference = tileElevationMax - tileElevationMin
-            tileElevationIncr = tileElevationDifference / 9.0 # for 11-band contour
-            for i in range(self.tileCount):
-                for j in range(self.tileCount):
-                    tile = self.mapData.tiles[i][j]
-                    if tile.elevation >= tileElevationMax:
-                        tile.graphic = "band0"
-                    elif tile.elevation < tileElevationMax - tileElevationIncr*0 and tile.elevation >= tileElevationMax - tileElevationIncr*1:
-                        tile.graphic = "band1"
-                    elif tile.elevation < tileElevationMax - tileElevationIncr*1 and tile.elevation >= tileElevationMax - tileElevationIncr*2:
-                        tile.graphic = "band2"
-                    elif tile.elevation < tileElevationMax - tileElevationIncr*2 and tile.elevation >= tileElevationMax - tileElevationIncr*3:
-                        tile.graphic = "band3"
-                    elif tile.elevation < tileElevationMax - tileElevationIncr*3 and tile.elevation >= tileElevationMax - tileElevationIncr*4:
-                        tile.graphic = "band4"
-                    elif tile.elevation < tileElevationMax - tileElevationIncr*4 and tile.elevation >= tileElevationMax - tileElevationIncr*5:
-                        tile.graphic = "band5"
-                    elif tile.elevation < tileElevationMax - tileElevationIncr*5 and tile.elevation >= tileElevationMax - tileElevationIncr*6:
-                        tile.graphic = "band6"
-                    elif tile.elevation < tileElevationMax - tileElevationIncr*6 and tile.elevation >= tileElevationMax - tileElevationIncr*7:
-                        tile.graphic = "band7"
-                    elif tile.elevation < tileElevationMax - tileElevationIncr*7 and tile.elevation >= tileElevationMax - tileElevationIncr*8:
-                        tile.graphic = "band8"
-                    elif tile.elevation < tileElevationMax - tileElevationIncr*8 and tile.elevation >= tileElevationMax - tileElevationIncr*9:
-                        tile.graphic = "band9"
-                    elif tile.elevation <= tileElevationMin:
-                        tile.graphic = "band10"     
-                    else:
-                        tile.graphic = "blank"                    
-                        
-        elif self.displayMode == "Surface Temperature":
-            self.contourEnabled = True
-            tileTemperatureMax = 120
-            tileTemperatureMin = -50
-            self.contourMin = tileTemperatureMin
-            self.contourMax = tileTemperatureMax
-            tileTemperatureDifference = tileTemperatureMax - tileTemperatureMin
-            tileTemperatureIncr = tileTemperatureDifference / 9.0 # for 11-band contour
-            for i in range(self.tileCount):
-                for j in range(self.tileCount):
-                    tile = self.mapData.tiles[i][j]
-                    if tile.temperature >= tileTemperatureMax:
-                        tile.graphic = "band0"
-                    elif tile.temperature < tileTemperatureMax - tileTemperatureIncr*0 and tile.temperature >= tileTemperatureMax - tileTemperatureIncr*1:
-                        tile.graphic = "band1"
-                    elif tile.temperature < tileTemperatureMax - tileTemperatureIncr*1 and tile.temperature >= tileTemperatureMax - tileTemperatureIncr*2:
-                        tile.graphic = "band2"
-                    elif tile.temperature < tileTemperatureMax - tileTemperatureIncr*2 and tile.temperature >= tileTemperatureMax - tileTemperatureIncr*3:
-                        tile.graphic = "band3"
-                    elif tile.temperature < tileTemperatureMax - tileTemperatureIncr*3 and tile.temperature >= tileTemperatureMax - tileTemperatureIncr*4:
-                        tile.graphic = "band4"
-                    elif tile.temperature < tileTemperatureMax - tileTemperatureIncr*4 and tile.temperature >= tileTemperatureMax - tileTemperatureIncr*5:
-                        tile.graphic = "band5"
-                    elif tile.temperature < tileTemperatureMax - tileTemperatureIncr*5 and tile.temperature >= tileTemperatureMax - tileTemperatureIncr*6:
-                        tile.graphic = "band6"
-                    elif tile.temperature < tileTemperatureMax - tileTemperatureIncr*6 and tile.temperature >= tileTemperatureMax - tileTemperatureIncr*7:
-                        tile.graphic = "band7"
-                    elif tile.temperature < tileTemperatureMax - tileTemperatureIncr*7 and tile.temperature >= tileTemperatureMax - tileTemperatureIncr*8:
-                        tile.graphic = "band8"
-                    elif tile.temperature < tileTemperatureMax - tileTemperatureIncr*8 and tile.temperature >= tileTemperatureMax - tileTemperatureIncr*9:
-                        tile.graphic = "band9"
-                    elif tile.temperature <= tileTemperatureMin:
-                        tile.graphic = "band10"     
-                    else:
-                        tile.graphic = "blank"
-                        
-        elif self.displayMode == "Air Temperature":
-            self.contourEnabled = True
-            airTemperatureMax = 120
-            airTemperatureMin = -50
-            self.contourMin = airTemperatureMin
-            self.contourMax = airTemperatureMax
-            airTemperatureDifference = airTemperatureMax - airTemperatureMin
-            airTemperatureIncr = airTemperatureDifference / 9.0 # for 11-band contour
-            for i in range(self.tileCount):
-                for j in range(self.tileCount):
-                    tile = self.mapData.tiles[i][j]
-                    if tile.airTemperature >= airTemperatureMax:
-                        tile.graphic = "band0"
-                    elif tile.airTemperature < airTemperatureMax - airTemperatureIncr*0 and tile.airTemperature >= airTemperatureMax - airTemperatureIncr*1:
-                        tile.graphic = "band1"
-                    elif tile.airTemperature < airTemperatureMax - airTemperatureIncr*1 and tile.airTemperature >= airTemperatureMax - airTemperatureIncr*2:
-                        tile.graphic = "band2"
-                    elif tile.airTemperature < airTemperatureMax - airTemperatureIncr*2 and tile.airTemperature >= airTemperatureMax - airTemperatureIncr*3:
-                        tile.graphic = "band3"
-                    elif tile.airTemperature < airTemperatureMax - airTemperatureIncr*3 and tile.airTemperature >= airTemperatureMax - airTemperatureIncr*4:
-                        tile.graphic = "band4"
-                    elif tile.airTemperature < airTemperatureMax - airTemperatureIncr*4 and tile.airTemperature >= airTemperatureMax - airTemperatureIncr*5:
-                        tile.graphic = "band5"
-                    elif tile.airTemperature < airTemperatureMax - airTemperatureIncr*5 and tile.airTemperature >= airTemperatureMax - airTemperatureIncr*6:
-                        tile.graphic = "band6"
-                    elif tile.airTemperature < airTemperatureMax - airTemperatureIncr*6 and tile.airTemperature >= airTemperatureMax - airTemperatureIncr*7:
-                        tile.graphic = "band7"
-                    elif tile.airTemperature < airTemperatureMax - airTemperatureIncr*7 and tile.airTemperature >= airTemperatureMax - airTemperatureIncr*8:
-                        tile.graphic = "band8"
-                    elif tile.airTemperature < airTemperatureMax - airTemperatureIncr*8 and tile.airTemperature >= airTemperatureMax - airTemperatureIncr*9:
-                        tile.graphic = "band9"
-                    elif tile.airTemperature <= airTemperatureMin:
-                        tile.graphic = "band10"     
-                    else:
-                        tile.graphic = "blank"
-                        
-        elif self.displayMode == "Air Pressure":
-            self.contourEnabled = True
-            airPressureMax = 15
-            airPressureMin = 5
-            self.contourMin = airPressureMin
-            self.contourMax = airPressureMax
-            airPressureDifference = airPressureMax - airPressureMin
-            airPressureIncr = airPressureDifference / 9.0 # for 11-band contour
-            for i in range(self.tileCount):
-                for j in range(self.tileCount):
-                    tile = self.mapData.tiles[i][j]
-                    if tile.airPressure >= airPressureMax:
-                        tile.graphic = "band0"
-                    elif tile.airPressure < airPressureMax - airPressureIncr*0 and tile.airPressure >= airPressureMax - airPressureIncr*1:
-                        tile.graphic = "band1"
-                    elif tile.airPressure < airPressureMax - airPressureIncr*1 and tile.airPressure >= airPressureMax - airPressureIncr*2:
-                        tile.graphic = "band2"
-                    elif tile.airPressure < airPressureMax - airPressureIncr*2 and tile.airPressure >= airPressureMax - airPressureIncr*3:
-                        tile.graphic = "band3"
-                    elif tile.airPressure < airPressureMax - airPressureIncr*3 and tile.airPressure >= airPressureMax - airPressureIncr*4:
-                        tile.graphic = "band4"
-                    elif tile.airPressure < airPressureMax - airPressureIncr*4 and tile.airPressure >= airPressureMax - airPressureIncr*5:
-                        tile.graphic = "band5"
-                    elif tile.airPressure < airPressureMax - airPressureIncr*5 and tile.airPressure >= airPressureMax - airPressureIncr*6:
-                        tile.graphic = "band6"
-                    elif tile.airPressure < airPressureMax - airPressureIncr*6 and tile.airPressure >= airPressureMax - airPressureIncr*7:
-                        tile.graphic = "band7"
-                    elif tile.airPressure < airPressureMax - airPressureIncr*7 and tile.airPressure >= airPressureMax - airPressureIncr*8:
-                        tile.graphic = "band8"
-                    elif tile.airPressure < airPressureMax - airPressureIncr*8 and tile.airPressure >= airPressureMax - airPressureIncr*9:
-                        tile.graphic = "band9"
-                    elif tile.airPressure <= airPressureMin:
-                        tile.graphic = "band10"     
-                    else:
-                        tile.graphic = "blank"
-    
-        elif self.displayMode == "Air Density":
-            self.contourEnabled = True
-            airDensityMax = 0.08
-            airDensityMin = 0.04
-            self.contourMin = airDensityMin
-            self.contourMax = airDensityMax
-            airDensityDifference = airDensityMax - airDensityMin
-            airDensityIncr = airDensityDifference / 9.0 # for 11-band contour
-            for i in range(self.tileCount):
-                for j in range(self.tileCount):
-                    tile = self.mapData.tiles[i][j]
-                    if tile.airDensity >= airDensityMax:
-                        tile.graphic = "band0"
-                    elif tile.airDensity < airDensityMax - airDensityIncr*0 and tile.airDensity >= airDensityMax - airDensityIncr*1:
-                        tile.graphic = "band1"
-                    elif tile.airDensity < airDensityMax - airDensityIncr*1 and tile.airDensity >= airDensityMax - airDensityIncr*2:
-                        tile.graphic = "band2"
-                    elif tile.airDensity < airDensityMax - airDensityIncr*2 and tile.airDensity >= airDensityMax - airDensityIncr*3:
-                        tile.graphic = "band3"
-                    elif tile.airDensity < airDensityMax - airDensityIncr*3 and tile.airDensity >= airDensityMax - airDensityIncr*4:
-                        tile.graphic = "band4"
-                    elif tile.airDensity < airDensityMax - airDensityIncr*4 and tile.airDensity >= airDensityMax - airDensityIncr*5:
-                        tile.graphic = "band5"
-                    elif tile.airDensity < airDensityMax - airDensityIncr*5 and tile.airDensity >= airDensityMax - airDensityIncr*6:
-                        tile.graphic = "band6"
-                    elif tile.airDensity < airDensityMax - airDensityIncr*6 and tile.airDensity >= airDensityMax - airDensityIncr*7:
-                        tile.graphic = "band7"
-                    elif tile.airDensity < airDensityMax - airDensityIncr*7 and tile.airDensity >= airDensityMax - airDensityIncr*8:
-                        tile.graphic = "band8"
-                    elif tile.airDensity < airDensityMax - airDensityIncr*8 and tile.airDensity >= airDensityMax - airDensityIncr*9:
-                        tile.graphic = "band9"
-                    elif tile.airDensity <= airDensityMin:
-                        tile.graphic = "band10"     
-                    else:
-                        tile.graphic = "blank"
-    
-        elif self.displayMode == "Wind Speed":
-            ftPerSecToMPH = 0.681818
+
+                    tile.graphic = self.surface_graphic(tile)
+
+        # Contour-band display of a map field or climatology statistic (see display_values)
+        elif self.displayMode in CONTOUR_DISPLAY_MODES or self.displayMode in CLIMATOLOGY_DISPLAY_MODES:
             self.contourEnabled = True
-            windSpeedMax = 176
-            windSpeedMin = 0
-            self.contourMin = windSpeedMin * ftPerSecToMPH
-            self.contourMax = windSpeedMax * ftPerSecToMPH
-            windSpeedDifference = windSpeedMax - windSpeedMin
-            windSpeedIncr = windSpeedDifference / 9.0 # for 11-band contour
-            for i in range(self.tileCount):
-                for j in range(self.tileCount):
-                    tile = self.mapData.tiles[i][j]
-                    tileX = i * TILE_GRAPHIC_SIZE
-                    tileY = j * TILE_GRAPHIC_SIZE
-                    if tile.windSpeedMagnitude >= windSpeedMax:
-                        tile.graphic = "band0"
-                    elif tile.windSpeedMagnitude < windSpeedMax - windSpeedIncr*0 and tile.windSpeedMagnitude >= windSpeedMax - windSpeedIncr*1:
-                        tile.graphic = "band1"
-                    elif tile.windSpeedMagnitude < windSpeedMax - windSpeedIncr*1 and tile.windSpeedMagnitude >= windSpeedMax - windSpeedIncr*2:
-                        tile.graphic = "band2"
-                    elif tile.windSpeedMagnitude < windSpeedMax - windSpeedIncr*2 and tile.windSpeedMagnitude >= windSpeedMax - windSpeedIncr*3:
-                        tile.graphic = "band3"
-                    elif tile.windSpeedMagnitude < windSpeedMax - windSpeedIncr*3 and tile.windSpeedMagnitude >= windSpeedMax - windSpeedIncr*4:
-                        tile.graphic = "band4"
-                    elif tile.windSpeedMagnitude < windSpeedMax - windSpeedIncr*4 and tile.windSpeedMagnitude >= windSpeedMax - windSpeedIncr*5:
-                        tile.graphic = "band5"
-                    elif tile.windSpeedMagnitude < windSpeedMax - windSpeedIncr*5 and tile.windSpeedMagnitude >= windSpeedMax - windSpeedIncr*6:
-                        tile.graphic = "band6"
-                    elif tile.windSpeedMagnitude < windSpeedMax - windSpeedIncr*6 and tile.windSpeedMagnitude >= windSpeedMax - windSpeedIncr*7:
-                        tile.graphic = "band7"
-                    elif tile.windSpeedMagnitude < windSpeedMax - windSpeedIncr*7 and tile.windSpeedMagnitude >= windSpeedMax - windSpeedIncr*8:
-                        tile.graphic = "band8"
-                    elif tile.windSpeedMagnitude < windSpeedMax - windSpeedIncr*8 and tile.windSpeedMagnitude >= windSpeedMax - windSpeedIncr*9:
-                        tile.graphic = "band9"
-                    elif tile.windSpeedMagnitude <= windSpeedMin:
-                        tile.graphic = "band10"     
-                    else:
-                        tile.graphic = "blank"
+            values, valueMin, valueMax = display_values(self.mapData, self.displayMode, self.seaLevel, self.climatology)
+            unitFactor = CONTOUR_DISPLAY_MODES[self.displayMode][2] if self.displayMode in CONTOUR_DISPLAY_MODES else 1.0
+            self.contourMin = valueMin * unitFactor
+            self.contourMax = valueMax * unitFactor
+            self.set_contour_graphics(values, valueMin, valueMax)
     
     
-        self.update_map()
-        self.scale_map()
-
-
-    def scale_map(self):
-        """Scale map surface to current display settings."""
-        if self.antialiasing is True:
-            self.mapSurfaceScaled = pygame.transform.smoothscale(self.mapSurface, (self.displaySize.x, self.displaySize.y))
+        self.render_map()
+
+
+    def redraw_tick(self, changedTiles):
+        """Redraw the map after a tick. In Surface mode only the tiles whose type
+           changed (flat indices from update_tile_types) are redrawn; contour
+           modes, whose values change every tick, and wind arrows redraw all tiles."""
+        if self.displayMode != "Surface" or self.windArrows:
+            self.reset_tiles()
+        elif changedTiles.size:
+            self.redraw_tiles(changedTiles)
+
+
+    def scale_view(self, surface):
+        """Scale the part of a one-pixel-per-tile surface (see update_pixel_map)
+           that is on screen to the display, so zoomed-in views of large worlds
+           never scale tiles that are off screen. Returns the scaled surface
+           and its position on screen."""
+        tilePixelsX = self.displaySize.x / self.tileCount
+        tilePixelsY = self.displaySize.y / self.tileCount
+        left = min(max(int(-self.origin.x // tilePixelsX), 0), self.tileCount - 1)
+        top = min(max(int(-self.origin.y // tilePixelsY), 0), self.tileCount - 1)
+        right = max(min(math.ceil((self.gameWindow.x - self.origin.x) / tilePixelsX), self.tileCount), left + 1)
+        bottom = max(min(math.ceil((self.gameWindow.y - self.origin.y) / tilePixelsY), self.tileCount), top + 1)
+        viewLeft, viewTop = round(self.origin.x + left * tilePixelsX), round(self.origin.y + top * tilePixelsY)
+        viewRight, viewBottom = round(self.origin.x + right * tilePixelsX), round(self.origin.y + bottom * tilePixelsY)
+        view = surface.subsurface((left, top, right - left, bottom - top))
+        return pygame.transform.scale(view, (viewRight - viewLeft, viewBottom - viewTop)), (viewLeft, viewTop)
+
+
+    def scale_map(self, preview=False, contentChanged=True):
+        """Scale map surface to current display settings
+           (redrawn first if the zoom changed the render path).
+           With antialiasing, the map is smooth-scaled on a worker thread (see
+           finish_scaling). Meanwhile, if only the zoom changed (contentChanged
+           False), the last smooth-scaled map is shown, stretched if the size
+           changed; otherwise the current map is scaled nearest-neighbour. A
+           preview only does that (cheap) and leaves smooth scaling to finish_zoom."""
+        self.redrawNeeded = True
+        self.smoothScalePending = False
+        if self.sprite_rendering() != self.spriteRendering:
+            self.render_map()
+            return
+        self.mapScaler.cancel()
+        if contentChanged:
+            self.mapScaler.discard()
+        size = (self.displaySize.x, self.displaySize.y)
+        if not self.spriteRendering:
+            self.mapSurfaceScaled, self.mapPosition = self.scale_view(self.mapSurface)
+        elif self.antialiasing is True:
+            if preview:
+                self.smoothScalePending = True
+                self.lastZoomTime = pygame.time.get_ticks()
+            else:
+                self.mapScaler.request(pygame.transform.smoothscale, self.mapSurface.copy(), size)
+            self.mapSurfaceScaled = self.mapScaler.preview(size)
+            if self.mapSurfaceScaled is None:
+                self.mapSurfaceScaled = pygame.transform.scale(self.mapSurface, size)
         else:
-            self.mapSurfaceScaled = pygame.transform.scale(self.mapSurface, (self.displaySize.x, self.displaySize.y))
+            self.mapSurfaceScaled = pygame.transform.scale(self.mapSurface, size)
 
 
     def scale_sun_map(self):
-        """Scale sun overlay surface to current display settings."""
-        if self.antialiasing is True:
-            self.sunLayerSurfaceScaled = pygame.transform.smoothscale(self.sunLayerSurface, (self.displaySize.x, self.displaySize.y))
-        else:
+        """Scale sun shadow layer to current display settings (tiles stay
+           sharp-edged) and add the sun icon over the tile it is overhead of."""
+        self.redrawNeeded = True
+        if self.spriteRendering:
             self.sunLayerSurfaceScaled = pygame.transform.scale(self.sunLayerSurface, (self.displaySize.x, self.displaySize.y))
+            self.sunLayerPosition = (self.origin.x, self.origin.y)
+        else:
+            self.sunLayerSurfaceScaled, self.sunLayerPosition = self.scale_view(self.sunLayerSurface)
+        tilePixelsX = self.displaySize.x / self.tileCount
+        tilePixelsY = self.displaySize.y / self.tileCount
+        sunPositionX, sunPositionY = self.sun_position()
+        iconSize = max(int(tilePixelsX), SUN_ICON_MIN_PIXELS)
+        sunIcon = pygame.transform.smoothscale(self.graphics.data["sun"], (iconSize, iconSize))
+        iconPosition = (self.origin.x + (sunPositionX + 0.5) * tilePixelsX - iconSize / 2 - self.sunLayerPosition[0],
+                        self.origin.y + (sunPositionY + 0.5) * tilePixelsY - iconSize / 2 - self.sunLayerPosition[1])
+        self.sunLayerSurfaceScaled.blit(sunIcon, iconPosition)
 
 
     def get_map(self):
         """Quick function to return map surface."""
+        if not self.spriteRendering:
+            return self.mapSurfaceScaled, self.mapPosition
         return self.mapSurfaceScaled, (self.origin.x, self.origin.y)
 
 
     def get_sun_map(self):
         """Quick function to return sun overlay surface."""
+        if not self.spriteRendering:
+            return self.sunLayerSurfaceScaled, self.sunLayerPosition
         return self.sunLayerSurfaceScaled, (self.origin.x, self.origin.y)
+
+
+class HeadlessWorld:
+    """A generated world without a window or graphics: the map arrays and sun
+       data of a GameMap (same generation code), e.g. for batch runs with
+       ensemble.Ensemble. Seeds Python's random module for repeatable worlds
+       (a seeded world is generated once and then loaded from the world cache)."""
+
+    # World generation (and its cache) works on the map arrays exactly as in GameMap
+    generate_world = GameMap.generate_world
+    rand_gen = GameMap.rand_gen
+    elevation_calcs = GameMap.elevation_calcs
+    update_elevation_factors = GameMap.update_elevation_factors
+
+    def __init__(self, mapSize, seed=None, timeStep=TIME_STEP):
+        self.tileCount = mapSize
+        self.mapAreaTiles = self.tileCount ** 2
+        self.timeStep = timeStep
+        self.seaLevel = 0
+        self.elevationFactorSeaLevel = None
+        self.greenhouse = 0.0
+        self.sunHourAngle = 0
+        self.dayOfYear = 0
+
+        # Generate map tile values (sun data is computed on first use, see GameMap.sunlight)
+        random.seed(seed)
+        self.mapData = GameMap.Map_Data(self.tileCount)
+        self.topology = map_topology(self.mapData.temperature.shape)
+        self.generate_world(seed)
+        classify_tiles(self.mapData.elevation, self.mapData.temperature, self.seaLevel, self.mapData.typeCode)
+        self.sunlightCache = LRUCache(SUNLIGHT_CACHE_SIZE)
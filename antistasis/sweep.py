@@ -0,0 +1,156 @@
+# Standard libraries
+import os
+import time
+import argparse
+import itertools
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Third-party libraries
+import numpy as np #2.1.1
+import pandas as pd #2.2.2
+
+# Local imports
+from simulation import *
+from ensemble import *
+
+#############
+# CONSTANTS #
+#############
+
+# Parameter grid defaults (every combination is one run)
+DEFAULT_SIZES = [32]            # tiles per side
+DEFAULT_SEEDS = [0]             # world generation seeds
+DEFAULT_GREENHOUSE = [0.0]
+DEFAULT_SEA_LEVELS = [0.0]      # ft
+
+# Run settings
+DEFAULT_TICKS = 24 * 30         # ticks per run (30 days of hourly ticks)
+DEFAULT_SAMPLE_INTERVAL = 24    # ticks between summaries
+DEFAULT_BANDS = 6               # latitude bands for zonal means
+DEFAULT_OUTPUT = "sweep.csv"    # .parquet (needs pyarrow) or .csv
+
+# Columns identifying a run
+RUN_PARAMETERS = ('size', 'seed', 'greenhouse', 'seaLevel')
+
+#####################
+# CLASSES/FUNCTIONS #
+#####################
+
+def parameter_grid(sizes, seeds, greenhouse, seaLevels):
+    """Every combination of the parameter lists, one dict per run."""
+    return [dict(size=int(size), seed=int(seed), greenhouse=float(greenhouseValue), seaLevel=float(seaLevel))
+            for size, seed, greenhouseValue, seaLevel in itertools.product(sizes, seeds, greenhouse, seaLevels)]
+
+
+def run_key(run):
+    """Hashable identity of a run (row or parameter dict)."""
+    return (int(run['size']), int(run['seed']), float(run['greenhouse']), float(run['seaLevel']))
+
+
+def summarize(ensemble, bands):
+    """Compact summary of the (single) ensemble member: global mean surface and
+       air temperature, fraction of tiles that are snow or sea ice, and zonal
+       means per latitude band (band 0 starts at y = 0)."""
+    temperature = ensemble.mapData.temperature[0]
+    airTemperature = ensemble.mapData.airTemperature[0]
+    summary = {
+        'hours': ensemble.hours,
+        'meanTemperature': float(np.mean(temperature)),
+        'meanAirTemperature': float(np.mean(airTemperature)),
+        'iceFraction': float(np.mean(np.isin(ensemble.mapData.typeCode[0], ICE_TYPE_CODES))),
+        }
+    for band, rows in enumerate(np.array_split(np.arange(temperature.shape[1]), bands)):
+        summary[f'zonalTemperature{band}'] = float(np.mean(temperature[:, rows]))
+        summary[f'zonalAirTemperature{band}'] = float(np.mean(airTemperature[:, rows]))
+    return summary
+
+
+def run_simulation(run, ticks, sampleInterval, bands):
+    """Generate the run's world and simulate it headless for a number of ticks.
+       Returns summary rows (at the start and every sampleInterval ticks)."""
+    world = HeadlessWorld(run['size'], run['seed'])
+    ensemble = Ensemble(world, 1, greenhouse=run['greenhouse'], seaLevel=run['seaLevel'])
+    rows = [dict(run, **summarize(ensemble, bands))]
+    for tick in range(1, ticks + 1):
+        ensemble.simulate()
+        if tick % sampleInterval == 0 or tick == ticks:
+            rows.append(dict(run, **summarize(ensemble, bands)))
+    return rows
+
+
+def pyarrow_available():
+    """Check whether pyarrow (needed for Parquet) is installed without importing it."""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def save_results(results, path):
+    """Write results to Parquet or CSV by file extension.
+       Parquet without pyarrow falls back to CSV next to it. Returns path written."""
+    if path.endswith(".parquet"):
+        if pyarrow_available():
+            results.to_parquet(path, index=False)
+            return path
+        path = path[:-len(".parquet")] + ".csv"
+        log(f"pyarrow is not installed, writing CSV instead: {path}")
+    results.to_csv(path, index=False)
+    return path
+
+
+def run_sweep(runs, ticks=DEFAULT_TICKS, sampleInterval=DEFAULT_SAMPLE_INTERVAL, bands=DEFAULT_BANDS,
+              workers=None, output=DEFAULT_OUTPUT, resume=False):
+    """Run every parameter combination in a process pool and collect all
+       summaries into one DataFrame, saved to output.
+       Finished runs are appended to a checkpoint file (output + ".partial.csv")
+       as they complete; with resume, runs already in it are skipped, so a
+       crashed or interrupted sweep continues where it stopped."""
+    checkpointPath = output + ".partial.csv"
+    if resume and os.path.exists(checkpointPath):
+        finished = {run_key(row) for row in pd.read_csv(checkpointPath, usecols=RUN_PARAMETERS).to_dict('records')}
+        log(f"Resuming sweep: {len(finished)} of {len(runs)} runs already finished.")
+    else:
+        finished = set()
+        if os.path.exists(checkpointPath):
+            os.remove(checkpointPath)
+    pending = [run for run in runs if run_key(run) not in finished]
+
+    # Checkpoint each run as soon as it finishes (a crash only loses runs in progress)
+    startTime = time.perf_counter()
+    with ProcessPoolExecutor(workers) as pool:
+        futures = {pool.submit(run_simulation, run, ticks, sampleInterval, bands): run for run in pending}
+        for count, future in enumerate(as_completed(futures), 1):
+            rows = pd.DataFrame(future.result())
+            rows.to_csv(checkpointPath, mode='a', header=not os.path.exists(checkpointPath), index=False)
+            log(f"  run {count}/{len(pending)} {futures[future]} ({time.perf_counter() - startTime:.1f} s)", log=False)
+
+    # One table for the whole sweep, in grid order
+    results = pd.read_csv(checkpointPath) if os.path.exists(checkpointPath) else pd.DataFrame(columns=RUN_PARAMETERS)
+    results = results.sort_values(list(RUN_PARAMETERS) + ['hours'], kind='stable', ignore_index=True)
+    savedPath = save_results(results, output)
+    if os.path.exists(checkpointPath):
+        os.remove(checkpointPath)
+    log(f"Sweep of {len(runs)} runs saved to {savedPath}")
+    return results
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Run headless simulations over a grid of parameters.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="tiles per side")
+    parser.add_argument("--seeds", type=int, nargs="+", default=DEFAULT_SEEDS, help="world generation seeds")
+    parser.add_argument("--greenhouse", type=float, nargs="+", default=DEFAULT_GREENHOUSE, help="greenhouse effect values")
+    parser.add_argument("--sea-levels", type=float, nargs="+", default=DEFAULT_SEA_LEVELS, help="sea levels (ft)")
+    parser.add_argument("--ticks", type=int, default=DEFAULT_TICKS, help="ticks per run")
+    parser.add_argument("--sample-interval", type=int, default=DEFAULT_SAMPLE_INTERVAL, help="ticks between summaries")
+    parser.add_argument("--bands", type=int, default=DEFAULT_BANDS, help="latitude bands for zonal means")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="results file (.parquet or .csv)")
+    parser.add_argument("--resume", action="store_true", help="skip runs finished by an earlier, interrupted sweep")
+    args = parser.parse_args()
+
+    runs = parameter_grid(args.sizes, args.seeds, args.greenhouse, args.sea_levels)
+    log(f"Parameter sweep: {len(runs)} runs, {args.ticks} ticks each")
+    run_sweep(runs, args.ticks, args.sample_interval, args.bands, args.workers, args.output, args.resume)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,385 @@
+# Standard libraries
+import io
+import json
+import base64
+import asyncio
+import hashlib
+import argparse
+import threading
+from collections import namedtuple
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+
+# Third-party libraries
+import numpy as np #2.1.1
+import pygame #2.6.1
+
+# Local imports
+from simulation import *
+from ensemble import *
+
+#############
+# CONSTANTS #
+#############
+
+# Server (local only by default)
+TELEMETRY_HOST = "127.0.0.1"
+TELEMETRY_PORT = 8765
+
+# Field frames: at most FRAME_SIZE x FRAME_SIZE values, as raw little-endian float16
+# (C order, shape [x, y]) or a grayscale PNG of the display mode's contour range
+FRAME_SIZE = 128
+FRAME_FORMATS = ('float16', 'png')
+FRAME_TIMEOUT = 10.0            # s an HTTP frame request waits for the next tick
+
+# Messages waiting per client; when a slow client falls behind, its oldest are dropped
+CLIENT_QUEUE_SIZE = 8
+
+# WebSocket protocol (RFC 6455)
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+WEBSOCKET_TEXT = 0x1
+WEBSOCKET_BINARY = 0x2
+WEBSOCKET_CLOSE = 0x8
+WEBSOCKET_PING = 0x9
+WEBSOCKET_PONG = 0xA
+
+# Headless run defaults
+DEFAULT_SIZE = 64               # tiles per side
+DEFAULT_SEED = 0
+
+# Field frame for the next tick: display mode, largest side, format and where to send the encoded frame
+FrameRequest = namedtuple('FrameRequest', ('displayMode', 'size', 'frameFormat', 'reply'))
+
+#####################
+# CLASSES/FUNCTIONS #
+#####################
+
+def map_metrics(mapData):
+    """Scalar metrics of a map for the per-tick stream: mean surface and air
+       temperature (°F), mean wind speed (ft/s) and ice cover (fraction of tiles)."""
+    return {
+        'meanTemperature': float(np.mean(mapData.temperature)),
+        'meanAirTemperature': float(np.mean(mapData.airTemperature)),
+        'meanWindSpeed': float(np.mean(mapData.windSpeedMagnitude)),
+        'iceFraction': float(np.mean(np.isin(mapData.typeCode, ICE_TYPE_CODES))),
+        }
+
+
+def downsample(values, size):
+    """Every tile of values, or for maps larger than size x size an evenly
+       spaced (nearest tile) sample of size x size of them."""
+    xIndices = np.arange(min(size, values.shape[0])) * values.shape[0] // min(size, values.shape[0])
+    yIndices = np.arange(min(size, values.shape[1])) * values.shape[1] // min(size, values.shape[1])
+    return values[np.ix_(xIndices, yIndices)]
+
+
+def encode_frame(values, valueMin, valueMax, size, frameFormat):
+    """Downsampled field frame: raw float16 values (C order, shape [x, y])
+       or a grayscale PNG with valueMin black and valueMax white."""
+    values = downsample(np.asarray(values, float), size)
+    if frameFormat == 'float16':
+        return values.astype('<f2').tobytes()
+    with np.errstate(invalid='ignore'):
+        levels = np.nan_to_num(np.clip((values - valueMin) / (valueMax - valueMin), 0, 1) * 255).astype(np.uint8)
+    image = io.BytesIO()
+    pygame.image.save(pygame.surfarray.make_surface(np.repeat(levels[:, :, np.newaxis], 3, axis=2)), image, "frame.png")
+    return image.getvalue()
+
+
+def websocket_frame(opcode, payload):
+    """One unmasked, unfragmented WebSocket frame (server to client)."""
+    length = len(payload)
+    if length < 126:
+        header = bytes((0x80 | opcode, length))
+    elif length < 1 << 16:
+        header = bytes((0x80 | opcode, 126)) + length.to_bytes(2, 'big')
+    else:
+        header = bytes((0x80 | opcode, 127)) + length.to_bytes(8, 'big')
+    return header + payload
+
+
+async def read_websocket_frame(reader):
+    """Opcode and payload of the next WebSocket frame from a client
+       (clients mask every frame; requests are small, so fragmented
+       messages are not supported)."""
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length = int.from_bytes(await reader.readexactly(2), 'big')
+    elif length == 127:
+        length = int.from_bytes(await reader.readexactly(8), 'big')
+    mask = await reader.readexactly(4) if second & 0x80 else bytes(4)
+    payload = np.frombuffer(await reader.readexactly(length), np.uint8) ^ np.resize(np.frombuffer(mask, np.uint8), length)
+    return first & 0x0F, payload.tobytes()
+
+
+class TelemetryClient:
+    """A WebSocket connection fed from a bounded queue by its own writer task,
+       so a slow client only falls behind (dropping its oldest messages)
+       instead of holding up the server or the simulation."""
+
+    def __init__(self, writer, queueSize=CLIENT_QUEUE_SIZE):
+        self.writer = writer
+        self.queue = asyncio.Queue(queueSize)
+        self.dropped = 0
+
+    def send(self, opcode, payload):
+        """Queue a message (event loop thread only), dropping the oldest if full."""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait((opcode, payload))
+
+    async def write_messages(self):
+        """Send queued messages until the connection closes."""
+        while True:
+            opcode, payload = await self.queue.get()
+            self.writer.write(websocket_frame(opcode, payload))
+            await self.writer.drain()
+
+
+class TelemetryServer:
+    """Local HTTP + WebSocket server for monitoring a running simulation,
+       run by an asyncio event loop on its own thread. The simulation calls
+       publish() after every tick, which only hands the tick over and never
+       waits on clients; encoding frames runs on a worker thread.
+
+       HTTP:      GET /metrics           latest metrics (JSON)
+                  GET /frame?mode=...&size=128&format=float16|png
+                                         field frame of a display mode at the next tick
+       WebSocket: GET /ws                per-tick metrics as JSON text messages; send
+                                         {"frame": mode, "size": 128, "format": "float16"}
+                                         for a frame at the next tick, sent as a binary
+                                         message: 4-byte little-endian header length,
+                                         JSON header (tick, mode, shape, range), frame bytes
+
+       fieldSource(displayMode) returns (values, valueMin, valueMax) like
+       simulation.display_values and is called on the simulation thread."""
+
+    def __init__(self, fieldSource, host=TELEMETRY_HOST, port=TELEMETRY_PORT):
+        self.fieldSource = fieldSource
+        self.host = host
+        self.port = port
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.clients = set()
+        self.latest = {}
+        self.frameRequests = []
+        self.frameRequestsLock = threading.Lock()
+        self.encoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="telemetry-encoding")
+
+    def start(self):
+        """Start serving on a background thread (returns once listening)."""
+        started = threading.Event()
+        self.loop = asyncio.new_event_loop()
+
+        def serve():
+            asyncio.set_event_loop(self.loop)
+            self.server = self.loop.run_until_complete(asyncio.start_server(self.handle_connection, self.host, self.port))
+            self.port = self.server.sockets[0].getsockname()[1]
+            started.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=serve, name="telemetry", daemon=True)
+        self.thread.start()
+        started.wait()
+        log(f"Telemetry server listening on http://{self.host}:{self.port}")
+
+    def stop(self):
+        """Close the server and its connections and stop the event loop thread."""
+        async def close():
+            self.server.close()
+            for client in list(self.clients):
+                client.writer.close()
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.server.wait_closed()
+        asyncio.run_coroutine_threadsafe(close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.encoder.shutdown()
+
+    def publish(self, tick, metrics):
+        """Hand a finished tick to the server (simulation thread). Only the
+           fields of pending frame requests are copied here; everything else
+           happens on the server's threads."""
+        with self.frameRequestsLock:
+            frameRequests, self.frameRequests = self.frameRequests, []
+        fields = {}
+        for request in frameRequests:
+            if request.displayMode not in fields:
+                try:
+                    values, valueMin, valueMax = self.fieldSource(request.displayMode)
+                    fields[request.displayMode] = (np.array(values, float), valueMin, valueMax)
+                except Exception as error: # answered as an error reply; a bad request must not stop the simulation
+                    fields[request.displayMode] = error
+        self.loop.call_soon_threadsafe(self.dispatch, tick, dict(metrics), frameRequests, fields)
+
+    def request_frame(self, request):
+        """Ask for a frame of the next published tick (server thread)."""
+        with self.frameRequestsLock:
+            self.frameRequests.append(request)
+
+    def dispatch(self, tick, metrics, frameRequests, fields):
+        """Send a tick's metrics to every client and start encoding its frames (event loop thread)."""
+        self.latest = dict(metrics, tick=tick)
+        message = json.dumps({'type': 'metrics', **self.latest}).encode()
+        for client in self.clients:
+            client.send(WEBSOCKET_TEXT, message)
+        for request in frameRequests:
+            self.loop.create_task(self.send_frame(tick, request, fields[request.displayMode]))
+
+    async def send_frame(self, tick, request, field):
+        """Encode a requested frame on the encoder thread and reply with it."""
+        if isinstance(field, Exception):
+            request.reply(None, {'type': 'error', 'error': str(field)})
+            return
+        values, valueMin, valueMax = field
+        frame = await self.loop.run_in_executor(self.encoder, encode_frame, values, valueMin, valueMax,
+                                                request.size, request.frameFormat)
+        header = {'type': 'frame', 'tick': tick, 'mode': request.displayMode, 'format': request.frameFormat,
+                  'shape': [min(request.size, values.shape[0]), min(request.size, values.shape[1])],
+                  'valueMin': valueMin, 'valueMax': valueMax}
+        request.reply(frame, header)
+
+    def parse_frame_request(self, parameters, reply):
+        """FrameRequest from query parameters or a WebSocket request (raises ValueError if invalid)."""
+        displayMode = parameters.get('frame', parameters.get('mode'))
+        frameFormat = parameters.get('format', FRAME_FORMATS[0])
+        if displayMode is None:
+            raise ValueError("No display mode given")
+        if frameFormat not in FRAME_FORMATS:
+            raise ValueError(f"Unknown frame format: {frameFormat} (expected one of {', '.join(FRAME_FORMATS)})")
+        size = int(parameters.get('size', FRAME_SIZE))
+        if size < 1:
+            raise ValueError(f"Frame size must be positive, got {size}")
+        return FrameRequest(displayMode, size, frameFormat, reply)
+
+    async def handle_connection(self, reader, writer):
+        """Serve one HTTP request or WebSocket connection."""
+        try:
+            requestLine, *headerLines = (await reader.readuntil(b"\r\n\r\n")).decode('latin-1').split("\r\n")
+            method, target, version = requestLine.split(" ", 2)
+            headers = {name.strip().lower(): value.strip() for name, value in
+                       (line.split(":", 1) for line in headerLines if ":" in line)}
+            url = urlsplit(target)
+            parameters = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            if method != "GET":
+                await self.respond(writer, 405, "text/plain", b"Only GET is supported")
+            elif url.path == "/ws" and headers.get('upgrade', '').lower() == "websocket":
+                await self.serve_websocket(reader, writer, headers)
+            elif url.path == "/metrics":
+                await self.respond(writer, 200, "application/json", json.dumps(self.latest).encode())
+            elif url.path == "/frame":
+                await self.serve_frame(writer, parameters)
+            else:
+                await self.respond(writer, 404, "text/plain", b"Not found (see /metrics, /frame, /ws)")
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            pass # server stopping
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, contentType, body, extraHeaders=()):
+        """Write an HTTP response."""
+        reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 504: "Gateway Timeout"}
+        headerLines = [f"HTTP/1.1 {status} {reasons[status]}", f"Content-Type: {contentType}",
+                       f"Content-Length: {len(body)}", "Connection: close", *extraHeaders]
+        writer.write(("\r\n".join(headerLines) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+
+    async def serve_frame(self, writer, parameters):
+        """Reply to GET /frame with a frame of the next tick."""
+        reply = self.loop.create_future()
+
+        def set_reply(frame, header):
+            if not reply.done(): # cancelled if the request timed out
+                reply.set_result((frame, header))
+
+        try:
+            self.request_frame(self.parse_frame_request(parameters, set_reply))
+            frame, header = await asyncio.wait_for(reply, FRAME_TIMEOUT)
+        except ValueError as error:
+            await self.respond(writer, 400, "text/plain", str(error).encode())
+            return
+        except asyncio.TimeoutError:
+            await self.respond(writer, 504, "text/plain", b"No tick published in time")
+            return
+        if frame is None:
+            await self.respond(writer, 400, "text/plain", header['error'].encode())
+            return
+        contentType = "image/png" if header['format'] == 'png' else "application/octet-stream"
+        await self.respond(writer, 200, contentType, frame, [f"X-Frame-Header: {json.dumps(header)}"])
+
+    async def serve_websocket(self, reader, writer, headers):
+        """Upgrade to WebSocket, stream metrics and answer frame requests until the client closes."""
+        accept = base64.b64encode(hashlib.sha1((headers['sec-websocket-key'] + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        await writer.drain()
+        client = TelemetryClient(writer)
+        writerTask = self.loop.create_task(client.write_messages())
+        self.clients.add(client)
+
+        def reply(frame, header):
+            if frame is None:
+                client.send(WEBSOCKET_TEXT, json.dumps(header).encode())
+                return
+            headerBytes = json.dumps(header).encode()
+            client.send(WEBSOCKET_BINARY, len(headerBytes).to_bytes(4, 'little') + headerBytes + frame)
+
+        try:
+            while True:
+                opcode, payload = await read_websocket_frame(reader)
+                if opcode == WEBSOCKET_CLOSE:
+                    writer.write(websocket_frame(WEBSOCKET_CLOSE, payload[:2]))
+                    break
+                elif opcode == WEBSOCKET_PING:
+                    client.send(WEBSOCKET_PONG, payload)
+                elif opcode == WEBSOCKET_TEXT:
+                    try:
+                        self.request_frame(self.parse_frame_request(json.loads(payload), reply))
+                    except (ValueError, TypeError, AttributeError) as error:
+                        client.send(WEBSOCKET_TEXT, json.dumps({'type': 'error', 'error': str(error)}).encode())
+        finally:
+            self.clients.discard(client)
+            writerTask.cancel()
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Run a headless simulation with a local telemetry server.")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="tiles per side")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="world generation seed")
+    parser.add_argument("--greenhouse", type=float, default=0.0, help="greenhouse effect")
+    parser.add_argument("--ticks", type=int, default=0, help="ticks to run (0 = until interrupted)")
+    parser.add_argument("--host", default=TELEMETRY_HOST)
+    parser.add_argument("--port", type=int, default=TELEMETRY_PORT)
+    args = parser.parse_args()
+
+    world = HeadlessWorld(args.size, args.seed)
+    ensemble = Ensemble(world, 1, greenhouse=args.greenhouse)
+    climatology = map_climatology(world.mapData.temperature.shape, world.timeStep)
+    server = TelemetryServer(lambda displayMode: display_values(ensemble.member_data(), displayMode, world.seaLevel, climatology),
+                             args.host, args.port)
+    server.start()
+    tick = 0
+    try:
+        while args.ticks == 0 or tick < args.ticks:
+            ensemble.simulate()
+            tick += 1
+            mapData = ensemble.member_data()
+            for statistics in climatology.values():
+                statistics.record(mapData)
+            server.publish(ensemble.hours, map_metrics(mapData))
+    except KeyboardInterrupt:
+        log(f"Stopped after {tick} ticks.")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    run()
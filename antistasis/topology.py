@@ -0,0 +1,68 @@
+# Standard libraries
+import math
+from functools import lru_cache
+
+# Third-party libraries
+import numpy as np #2.1.1
+
+#############
+# CONSTANTS #
+#############
+
+# 3x3 window of a tile as (x, y) offsets, x-major, with the tile itself in the middle
+WINDOW_OFFSETS = tuple((x, y) for x in (-1, 0, 1) for y in (-1, 0, 1))
+WINDOW_SIZE = len(WINDOW_OFFSETS)
+SELF_INDEX = WINDOW_OFFSETS.index((0, 0))
+
+# Eight neighbors (x, y offset), window order without the tile itself
+NEIGHBOR_OFFSETS = tuple(offset for offset in WINDOW_OFFSETS if offset != (0, 0))
+
+# Unit vector (u toward +x, v "up" the map, toward -y) toward each window tile (zero for the tile itself)
+WINDOW_DIRECTIONS = tuple((x / math.hypot(x, y), -y / math.hypot(x, y)) if (x, y) != (0, 0) else (0.0, 0.0)
+                          for x, y in WINDOW_OFFSETS)
+
+#####################
+# CLASSES/FUNCTIONS #
+#####################
+
+class Topology:
+    """Neighbor tables of an X x Y map that loops around every edge, built
+       once per map shape (see map_topology) so stencil code looks neighbors
+       up instead of wrapping indices itself.
+
+       windowIndices holds, for every tile (flat index x * sizeY + y, the
+       order of a C-order [x, y] array), the flat indices of its 3x3 window
+       in WINDOW_OFFSETS order (int32, tiles x WINDOW_SIZE); column
+       SELF_INDEX is the tile itself, neighborIndices the other eight."""
+
+    def __init__(self, shape):
+        self.shape = tuple(int(size) for size in shape)
+        sizeX, sizeY = self.shape
+        self.tileCount = sizeX * sizeY
+        self.offsets = np.array(WINDOW_OFFSETS, np.int32)
+        self.directions = np.array(WINDOW_DIRECTIONS)
+
+        # Window of every tile, looping around the map edges
+        x = np.arange(sizeX)[:, np.newaxis, np.newaxis] + self.offsets[:, 0]
+        y = np.arange(sizeY)[np.newaxis, :, np.newaxis] + self.offsets[:, 1]
+        self.windowIndices = ((x % sizeX) * sizeY + y % sizeY).reshape(self.tileCount, WINDOW_SIZE).astype(np.int32)
+        self.neighborIndices = np.ascontiguousarray(np.delete(self.windowIndices, SELF_INDEX, axis=1))
+
+    def gather(self, values, neighborsOnly=False):
+        """Values of every tile's 3x3 window (or only its eight neighbors),
+           shape (..., sizeX, sizeY, 9 or 8), from values of shape
+           (..., sizeX, sizeY) in a single fancy-indexing operation. Leading
+           axes (e.g. ensemble members) are gathered map by map."""
+        indices = self.neighborIndices if neighborsOnly else self.windowIndices
+        flatValues = values.reshape(values.shape[:-2] + (self.tileCount,))
+        return flatValues[..., indices].reshape(values.shape + (indices.shape[1],))
+
+    def neighbor_positions(self, x, y):
+        """(x, y) of the eight neighbors of a tile, in NEIGHBOR_OFFSETS order."""
+        return [divmod(int(index), self.shape[1]) for index in self.neighborIndices[x * self.shape[1] + y]]
+
+
+@lru_cache(maxsize=None)
+def map_topology(shape):
+    """Topology of a map shape (sizeX, sizeY), built on first use and shared."""
+    return Topology(shape)